@@ -0,0 +1,753 @@
+'''
+Benchmarks of the zebra interpreter
+
+Usage: python bench.py [benchmark ...]
+Runs all the benchmarks when none are named.
+'''
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+import cache
+import sim
+import sim_BC
+from zebra import ENGINES
+from output import OUTPUT
+from profiler import Profiler, Sampler
+from timings import AllocationCounter
+from parser import parse
+from lexer import tokenize
+from resolver import resolve, ResolverScopes
+from typechecking import typecheckAST
+from error import ParseException, ResolveException, TypeCheckException
+
+# Registered benchmarks by name
+BENCHMARKS = {}
+
+# Euler programs of the golden tests
+EULER_PROGRAMS = [
+    "tests/test_euler_12_highly_divisible.zebra",
+    "tests/test_euler_19_counting_sundays.zebra",
+    "tests/test_euler_21_ambicle_numbers.zebra",
+    "tests/test_euler_4_largest_palindromic_product.zebra",
+    "tests/test_euler_nth_prime.zebra",
+    "tests/test_euler_summation_of_primes.zebra",
+]
+
+# Long running numeric loop, whose Fraction denominators keep growing
+FLOAT_LOOP = '''
+var float x = 0.5;
+for (var int i = 0; i < 2000; i = i + 1) {
+    x = x * 1.01 + 1 / 3;
+}
+zout(x > 0.0);
+'''
+
+def benchmark(function):
+    '''
+    Decorator registering a benchmark
+    '''
+    BENCHMARKS[function.__name__] = function
+    return function
+
+def prepare(path: str):
+    '''
+    Parses, resolves and typechecks the program at the given path
+    '''
+    with open(path, 'r') as file:
+        return prepareSource(file.read().strip())
+
+def prepareSource(stream: str):
+    '''
+    Parses, resolves and typechecks the given program
+    '''
+    program = resolve(parse(stream), ResolverScopes())
+    typecheckAST(program, sim.Scopes())
+    return program
+
+def run(program, engine: str = "tree"):
+    '''
+    Runs a prepared program, discarding its output, and returns the wall time taken
+    '''
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        ENGINES[engine](program, sim.Scopes())
+        OUTPUT.flush()
+        return time.perf_counter() - start
+
+@benchmark
+def allocations():
+    '''
+    Boxed runtime objects allocated (see timings.COUNTED_CLASSES), young generation collections and time taken by the Euler programs
+    '''
+    for engine in ENGINES:
+        print(f"engine={engine}")
+        for path in EULER_PROGRAMS:
+            program = prepare(path)
+            with AllocationCounter() as counter:
+                elapsed = run(program, engine)
+            counts = ", ".join(f"{name}={n}" for name, n in counter.counts.items() if n)
+            print(f"  {path[6:-6]:<45} {elapsed:7.2f}s  objects={sum(counter.counts.values()):<9} gen0={counter.collections:<6} {counts}")
+
+@benchmark
+def float_modes():
+    '''
+    Time taken by the float heavy programs with Fraction and with double floats
+    '''
+    programs = [(path[6:-6], path) for path in ["tests/test_exponents.zebra"] + EULER_PROGRAMS]
+    programs.append(("float_loop (generated)", None))
+    for engine in ENGINES:
+        print(f"engine={engine}")
+        for name, path in programs:
+            times = []
+            for mode in sim.FLOAT_MODES:
+                sim.setFloatMode(mode)
+                program = prepare(path) if path != None else prepareSource(FLOAT_LOOP)
+                times.append(f"{mode}={min(run(program, engine) for _ in range(3)):.4f}s")
+            sim.setFloatMode("fraction")
+            print(f"  {name:<45} {'  '.join(times)}")
+
+def opcodeSequences():
+    '''
+    Straight line VM code exercising each (group of) opcode(s), as (setup, repeated sequence) pairs
+    '''
+    x = sim.Variable(1, "x", 0)
+    f = sim.Variable(1, "f", 1)
+    body = sim_BC.ByteCode()
+    body.emit(sim_BC.I.PUSH(0))
+    body.emit(sim_BC.I.RETURN())
+    fn = sim.FnObject("FUNCTION", [], [], sim_BC.CompiledFunction(f, body), sim.Int)
+    setup = [sim_BC.I.PUSH(1), sim_BC.I.DECLARE(x, sim.Int, False), sim_BC.I.POP(),
+             sim_BC.I.DECLARE_FUN(f, fn), sim_BC.I.POP()]
+
+    def binary(instruction):
+        return [sim_BC.I.PUSH(3), sim_BC.I.PUSH(7), instruction, sim_BC.I.POP()]
+
+    def call(code):
+        # Label of the instruction after the call
+        label = code.label()
+        code.emit(sim_BC.I.LOAD(f))
+        code.emit(sim_BC.I.PREPARE_CALL(1, label))
+        code.emit(sim_BC.I.CALL(0))
+        code.emit_label(label)
+        code.emit(sim_BC.I.POP())
+
+    def jump(instruction):
+        def emit(code):
+            label = code.label()
+            code.emit(sim_BC.I.PUSH(False))
+            code.emit(instruction(label))
+            code.emit_label(label)
+        return emit
+
+    return {
+        "PUSH POP": (setup, [sim_BC.I.PUSH(1), sim_BC.I.POP()]),
+        "LOAD POP": (setup, [sim_BC.I.LOAD(x), sim_BC.I.POP()]),
+        "PUSH ASSIGN POP": (setup, [sim_BC.I.PUSH(2), sim_BC.I.ASSIGN(x), sim_BC.I.POP()]),
+        "ADD": (setup, binary(sim_BC.I.ADD())),
+        "SUB": (setup, binary(sim_BC.I.SUB())),
+        "MUL": (setup, binary(sim_BC.I.MUL())),
+        "DIV": (setup, binary(sim_BC.I.DIV(1))),
+        "REM": (setup, binary(sim_BC.I.REM())),
+        "LT": (setup, binary(sim_BC.I.LT())),
+        "EQ": (setup, binary(sim_BC.I.EQ())),
+        "JMP_IF_FALSE": (setup, jump(sim_BC.I.JMP_IF_FALSE)),
+        "BEGIN_SCOPE END_SCOPE": (setup, [sim_BC.I.BEGIN_SCOPE(), sim_BC.I.END_SCOPE()]),
+        "CALL RETURN": (setup, call),
+    }
+
+@benchmark
+def vm_opcodes():
+    '''
+    Time per executed VM instruction for each sequence of opcodes
+    '''
+    repeat = 2000
+    for name, (setup, sequence) in opcodeSequences().items():
+        code = sim_BC.ByteCode()
+        for instruction in setup:
+            code.emit(instruction)
+        start = len(code.inst)
+        for _ in range(repeat):
+            if (callable(sequence)):
+                sequence(code)
+            else:
+                for instruction in sequence:
+                    code.emit(instruction)
+        # Counting the instructions executed by the callees as well
+        executed = (len(code.inst) - start) + (repeat * 2 if name == "CALL RETURN" else 0)
+        code.emit(sim_BC.I.PUSH(None))
+        code.emit(sim_BC.I.HALT())
+
+        best = min(timeit(lambda: sim_BC.run(code, sim.Scopes())) for _ in range(20))
+        print(f"  {name:<25} {best / executed * 1e9:7.1f} ns/instruction")
+
+@benchmark
+def peephole():
+    '''
+    Instructions eliminated by the peephole optimizer and VM time taken with and without it
+    '''
+    for path in EULER_PROGRAMS:
+        program = prepare(path)
+        times = []
+        for enabled in [False, True]:
+            sim_BC.setPeephole(enabled)
+            sim_BC.peepholeStats.update(instructions=0, eliminated=0)
+            times.append(min(run(program, "vm") for _ in range(3)))
+        sim_BC.setPeephole(True)
+        # Statistics of the last (3 times compiled) run
+        stats = {key: n // 3 for key, n in sim_BC.peepholeStats.items()}
+        print(f"  {path[6:-6]:<45} eliminated {stats['eliminated']:>4} of {stats['instructions']:<5} "
+              f"off={times[0]:.4f}s  on={times[1]:.4f}s  ({times[0] / times[1]:.2f}x)")
+
+# Recursion as deep as n calls
+DEEP_RECURSION = '''
+func int sum(int n) {
+    if (n == 0) {
+        return 0;
+    }
+    return n + sum(n - 1);
+}
+zout(sum(%d));
+'''
+
+@benchmark
+def deep_recursion():
+    '''
+    Time taken by the recursive programs on each engine, and by recursions deeper than the Python stack on the VM
+    '''
+    program = prepare("tests/test_fibonacci_rec_linear.zebra")
+    times = "  ".join(f"{engine}={min(run(program, engine) for _ in range(10)):.4f}s" for engine in ENGINES)
+    print(f"  {'fibonacci_rec_linear':<45} {times}")
+    for depth in [10 ** 4, 10 ** 5, 2 * 10 ** 5]:
+        program = prepareSource(DEEP_RECURSION % depth)
+        print(f"  {f'sum depth={depth}':<45} vm={run(program, 'vm'):.4f}s")
+
+# Tail recursive sum of the first n numbers
+TAIL_RECURSION = '''
+func int sum(int n, int acc) {
+    if (n == 0) {
+        return acc;
+    }
+    return sum(n - 1, acc + n);
+}
+zout(sum(%d, 0));
+'''
+
+@benchmark
+def tail_recursion():
+    '''
+    Time taken by a one million deep tail recursion on each engine, and the peak memory of
+    tail recursions of growing depth on the VM (constant as the calls reuse the activation)
+    '''
+    program = prepareSource(TAIL_RECURSION % 10 ** 6)
+    for engine in ENGINES:
+        print(f"  {f'sum depth=10^6 engine={engine}':<45} {run(program, engine):.2f}s")
+    for depth in [10 ** 3, 10 ** 4, 10 ** 5]:
+        program = prepareSource(TAIL_RECURSION % depth)
+        tracemalloc.start()
+        run(program, "vm")
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {f'sum depth={depth} engine=vm':<45} peak={peak / 1024:.0f}KB")
+
+# Method called in a loop (on a class like the ones of tests/test_class.zebra)
+METHOD_LOOP = '''
+class counter {
+    var int total = 0;
+    func int add(int n) {
+        this.total = this.total + n;
+        return this.total;
+    }
+}
+var counter c = counter();
+for (var int i = 0; i < 20000; i = i + 1) {
+    c.add(i);
+}
+zout(c.total);
+'''
+
+@benchmark
+def method_calls():
+    '''
+    Time taken by a method called in a loop on each engine
+    '''
+    program = prepareSource(METHOD_LOOP)
+    for engine in ENGINES:
+        best = min(run(program, engine) for _ in range(5))
+        print(f"  {f'engine={engine}':<45} {best:.4f}s  ({best / 20000 * 1e6:.2f} us/call)")
+
+# Many instances allocated and kept alive in a linked list (tests/test_class_array.zebra scaled up)
+INSTANCES = '''
+class point {
+    var int x = 0;
+    var int y = 0;
+    var int z = 0;
+    var boolean seen = false;
+    var point next;
+}
+var point head = point();
+for (var int i = 0; i < %d; i = i + 1) {
+    var point p = point();
+    p.x = i;
+    p.y = i + 1;
+    p.next = head;
+    head = p;
+}
+var int total = 0;
+for (var int i = 0; i < %d; i = i + 1) {
+    total = total + head.x + head.y + head.z;
+    head = head.next;
+}
+zout(total);
+'''
+
+@benchmark
+def instances():
+    '''
+    Time taken and memory held per instance by a program allocating many objects and reading
+    their fields, on each engine
+    '''
+    count = 5000
+    program = prepareSource(INSTANCES % (count, count))
+    for engine in ENGINES:
+        best = min(run(program, engine) for _ in range(3))
+        tracemalloc.start()
+        run(program, engine)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {f'engine={engine}':<45} {best:.3f}s  ({best / count * 1e6:.1f} us/instance, {peak / count:.0f} bytes/instance)")
+
+# Objects created in a loop, from a class with constant and non constant field initializers
+INSTANTIATIONS = '''
+class particle {
+    var int x = 0;
+    var int y = 0;
+    var float mass = 1.5;
+    var boolean alive = true;
+    var string name = "particle";
+    var int id = 2 * 3 + 1;
+}
+for (var int i = 0; i < %d; i = i + 1) {
+    var particle p = particle();
+}
+zout("done");
+'''
+
+@benchmark
+def instantiations():
+    '''
+    Objects created per second by a loop instantiating a class, on each engine
+    '''
+    count = 10000
+    program = prepareSource(INSTANTIATIONS % count)
+    for engine in ENGINES:
+        best = min(run(program, engine) for _ in range(3))
+        print(f"  {f'engine={engine}':<45} {best:.3f}s  ({count / best:,.0f} objects/s)")
+
+# Sieve of Eratosthenes over a boolean array, summing the primes into an int array of digits
+SIEVE = '''
+var int limit = %d;
+var array(boolean) composite = array(boolean){};
+for (var int i = 0; i < limit; i = i + 1) {
+    append(false, composite);
+}
+for (var int i = 2; i * i < limit; i = i + 1) {
+    if (~composite[i]) {
+        for (var int j = i * i; j < limit; j = j + i) {
+            composite[j] = true;
+        }
+    }
+}
+var array(int) primes = array(int){};
+for (var int i = 2; i < limit; i = i + 1) {
+    if (~composite[i]) {
+        append(i, primes);
+    }
+}
+zout(length(primes));
+'''
+
+@benchmark
+def typed_arrays():
+    '''
+    Time taken and peak memory per element of a prime sieve on each engine
+    '''
+    limit = 10 ** 5
+    for engine in ENGINES:
+        # Array literals are evaluated in place, each run needs its own program
+        elapsed = run(prepareSource(SIEVE % limit), engine)
+        program = prepareSource(SIEVE % limit)
+        tracemalloc.start()
+        run(program, engine)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {f'sieve limit={limit} engine={engine}':<45} {elapsed:.2f}s  peak={peak / 1024:.0f}KB ({peak / limit:.1f} bytes/element)")
+
+# Arrays of 2^20 elements (built by concatenation), and each bulk operation as a loop and as a builtin
+BULK_ARRAYS = '''
+var array(int) a = array(int){3, 1, 4, 1, 5, 9, 2, 6};
+var array(int) b = array(int){2, 7, 1, 8, 2, 8, 1, 8};
+for (var int i = 0; i < 17; i = i + 1) {
+    a = a + a;
+    b = b + b;
+}
+var int n = length(a);
+var int result = 0;
+%s
+zout(result);
+'''
+BULK_OPERATIONS = {
+    "sum": ("for (var int i = 0; i < n; i = i + 1) { result = result + a[i]; }",
+            "result = sum(a);"),
+    "max": ("for (var int i = 0; i < n; i = i + 1) { if (a[i] > result) { result = a[i]; } }",
+            "result = max(a);"),
+    "dot": ("for (var int i = 0; i < n; i = i + 1) { result = result + a[i] * b[i]; }",
+            "result = dot(a, b);"),
+    "map": ("var array(int) c = array(int){}; for (var int i = 0; i < n; i = i + 1) { append(a[i] * 3, c); }",
+            "var array(int) c = map(*, 3, a);"),
+    "fill": ("for (var int i = 0; i < n; i = i + 1) { a[i] = 7; }",
+             "fill(7, a);"),
+    "reverse": ("for (var int i = 0; i < n // 2; i = i + 1) { var int t = a[i]; a[i] = a[n - 1 - i]; a[n - 1 - i] = t; }",
+                "reverse(a);"),
+}
+
+@benchmark
+def bulk_arrays():
+    '''
+    Time taken by each bulk operation over 2^20 elements written as a loop and as a builtin, on
+    each engine (without the time taken to build the arrays)
+    '''
+    print(f"  numpy={'yes' if sim.numpy != None else 'no'}")
+    for engine in ENGINES:
+        # Array literals are evaluated in place, each run needs its own program
+        build = run(prepareSource(BULK_ARRAYS % ""), engine)
+        for name, (loop, builtin) in BULK_OPERATIONS.items():
+            loopTime = run(prepareSource(BULK_ARRAYS % loop), engine) - build
+            # Repeating the builtin, as it takes less time than the noise of the build
+            repeated = f"for (var int k = 0; k < 10; k = k + 1) {{ {builtin} }}"
+            builtinTime = (run(prepareSource(BULK_ARRAYS % repeated), engine) - build) / 10
+            print(f"  {f'{name} engine={engine}':<45} loop={loopTime:7.3f}s  builtin={builtinTime:.4f}s  ({loopTime / max(builtinTime, 1e-6):,.0f}x)")
+
+# Array of 2^17 elements (built by concatenation), sliced repeatedly: by a loop taking the same
+# slice, and by a divide and conquer sum halving the slices down to 64 elements
+SLICED_ARRAY = '''
+var array(int) a = array(int){3, 1, 4, 1, 5, 9, 2, 6};
+for (var int i = 0; i < 14; i = i + 1) {
+    a = a + a;
+}
+var int result = 0;
+%s
+zout(result);
+'''
+SLICES = {
+    "loop": "for (var int i = 0; i < 2000; i = i + 1) { var array(int) b = slice a 1:131072; result = result + b[0]; }",
+    "divide": '''
+func int total(array(int) b) {
+    var int n = length(b);
+    if (n <= 64) {
+        return sum(b);
+    }
+    return total(slice b 0:n // 2) + total(slice b n // 2:n);
+}
+result = total(a);
+''',
+}
+
+@benchmark
+def slices():
+    '''
+    Time taken by the programs slicing a large array on each engine (without the time taken to
+    build the array)
+    '''
+    for engine in ENGINES:
+        # Array literals are evaluated in place, each run needs its own program
+        build = run(prepareSource(SLICED_ARRAY % ""), engine)
+        for name, slicing in SLICES.items():
+            elapsed = run(prepareSource(SLICED_ARRAY % slicing), engine) - build
+            print(f"  {f'{name} engine={engine}':<45} {elapsed:.3f}s")
+
+# String built one character at a time, and a string of 2^17 characters (built by concatenation)
+# whose characters are all set one at a time
+STRING_BUILDING = '''
+var string s = "";
+for (var int i = 0; i < %d; i = i + 1) {
+    s = s + "a";
+}
+zout(length(s));
+'''
+STRING_SETTING = '''
+var string s = "abcdefgh";
+for (var int i = 0; i < 14; i = i + 1) {
+    s = s + s;
+}
+for (var int i = 0; i < length(s); i = i + 1) {
+    s[i] = "z";
+}
+zout(length(s));
+'''
+
+@benchmark
+def strings():
+    '''
+    Time taken to build a string of 10^6 characters one at a time, and to set each character
+    of a string of 2^17 characters, on each engine
+    '''
+    length = 10 ** 6
+    for engine in ENGINES:
+        elapsed = run(prepareSource(STRING_BUILDING % length), engine)
+        print(f"  {f'build length={length} engine={engine}':<45} {elapsed:.2f}s")
+        elapsed = run(prepareSource(STRING_SETTING), engine)
+        print(f"  {f'set length={2 ** 17} engine={engine}':<45} {elapsed:.2f}s")
+
+# Printing in a loop, and printing an array of 2^10 arrays of 2^7 elements (built by concatenation)
+ZOUT_LOOP = '''
+for (var int i = 0; i < %d; i = i + 1) {
+    zout(i);
+}
+'''
+ZOUT_ARRAYS = '''
+var array(int) row = array(int){3, 1, 4, 1, 5, 9, 2, 6};
+for (var int i = 0; i < 4; i = i + 1) {
+    row = row + row;
+}
+var array(array(int)) rows = array(array(int)){row};
+for (var int i = 0; i < 10; i = i + 1) {
+    rows = rows + rows;
+}
+for (var int i = 0; i < %d; i = i + 1) {
+    zout(rows);
+}
+'''
+
+@benchmark
+def zout_calls():
+    '''
+    Time taken by 10^6 zout calls, and by printing a large array of arrays, written to /dev/null
+    through a line buffered stdout (as on a terminal) and a block buffered one (as to a file) on
+    each engine
+    '''
+    calls = 10 ** 6
+    prints = 20
+    for engine in ENGINES:
+        for name, program, count in (("calls", ZOUT_LOOP % calls, calls), ("arrays", ZOUT_ARRAYS % prints, prints)):
+            for buffering, stdout in ((1, "line"), (-1, "block")):
+                prepared = prepareSource(program)
+                with open(os.devnull, 'w', buffering=buffering) as devnull, redirect_stdout(devnull):
+                    start = time.perf_counter()
+                    ENGINES[engine](prepared, sim.Scopes())
+                    OUTPUT.flush()
+                    elapsed = time.perf_counter() - start
+                print(f"  {f'{name} stdout={stdout} engine={engine}':<45} {elapsed:.2f}s  ({count / elapsed:,.0f} zout/s)")
+
+@benchmark
+def profile_overhead():
+    '''
+    Time taken by the Euler programs on the tree walking evaluator, run directly and through the
+    profiler (zebra.py --profile)
+    '''
+    totals = [0.0, 0.0]
+    for path in EULER_PROGRAMS:
+        direct = run(prepare(path))
+        program = prepare(path)
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            Profiler().run(program, sim.Scopes())
+            OUTPUT.flush()
+            profiled = time.perf_counter() - start
+        totals[0] += direct
+        totals[1] += profiled
+        print(f"  {path[6:-6]:<45} direct={direct:.2f}s  profiled={profiled:.2f}s  ({profiled / direct:.2f}x)")
+    print(f"  {'total':<45} direct={totals[0]:.2f}s  profiled={totals[1]:.2f}s  ({totals[1] / totals[0]:.2f}x)")
+
+SAMPLED_PROGRAM = "tests/test_euler_12_highly_divisible.zebra"
+
+@benchmark
+def sampling_overhead():
+    '''
+    Time taken by tests/test_euler_12_highly_divisible.zebra on each engine, run directly and
+    through the sampling profiler (zebra.py --sample), best of 5 runs each
+    '''
+    def sampled(program, engine: str):
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            sampler = Sampler()
+            sampler.run(program, sim.Scopes(), ENGINES[engine])
+            OUTPUT.flush()
+            return time.perf_counter() - start, sampler.samples
+
+    for engine in ENGINES:
+        # Alternating the runs, so that neither gets the warmer interpreter
+        directRuns, sampledRuns = [], []
+        for _ in range(5):
+            directRuns.append(run(prepare(SAMPLED_PROGRAM), engine))
+            sampledRuns.append(sampled(prepare(SAMPLED_PROGRAM), engine))
+        direct = min(directRuns)
+        elapsed, samples = min(sampledRuns)
+        print(f"  {engine:<8} direct={direct:.3f}s  sampled={elapsed:.3f}s  ({(elapsed / direct - 1) * 100:+.1f}%, {samples} samples)")
+
+@benchmark
+def front_end_cache():
+    '''
+    Time taken by the front end of the tests/ programs, cold (parsing, resolving, typechecking
+    and storing the program in the cache) and warm (loading the program from the cache)
+    '''
+    paths = sorted(f"tests/{name}" for name in os.listdir("tests") if name.startswith("test") and name.endswith(".zebra"))
+    directory = cache.CACHE_DIR
+    totals = [0.0, 0.0]
+    with tempfile.TemporaryDirectory() as cache.CACHE_DIR:
+        for path in paths:
+            with open(path, 'r') as file:
+                stream = file.read().strip()
+
+            def cold():
+                key = cache.cacheKey(stream, "fraction")
+                if (cache.load(key) == None):
+                    cache.store(key, prepareSource(stream))
+
+            def warm():
+                cache.load(cache.cacheKey(stream, "fraction"))
+
+            # Programs with errors are not cached
+            try:
+                with redirect_stdout(io.StringIO()):
+                    coldTime = timeit(cold)
+            except (ParseException, ResolveException, TypeCheckException):
+                continue
+            warmTime = min(timeit(warm) for _ in range(5))
+            totals[0] += coldTime
+            totals[1] += warmTime
+            print(f"  {path[6:-6]:<45} cold={coldTime * 1000:8.2f}ms  warm={warmTime * 1000:6.2f}ms")
+    cache.CACHE_DIR = directory
+    print(f"  {'total':<45} cold={totals[0] * 1000:8.2f}ms  warm={totals[1] * 1000:6.2f}ms  ({totals[0] / totals[1]:.1f}x)")
+
+# Size of the source lexed by the lexer benchmark
+LEXED_SIZE = 10 * 1024 * 1024
+
+@benchmark
+def lexer():
+    '''
+    Tokens per second of the lexer on a 10 MB source (the tests/ programs repeated)
+    '''
+    sources = []
+    for name in sorted(os.listdir("tests")):
+        if (name.endswith(".zebra")):
+            with open(f"tests/{name}", 'r') as file:
+                sources.append(file.read().strip())
+    chunk = "\n".join(sources) + "\n"
+    source = chunk * (LEXED_SIZE // len(chunk) + 1)
+    start = time.perf_counter()
+    tokens = len(tokenize(source))
+    elapsed = time.perf_counter() - start
+    print(f"  {len(source) / 1024 / 1024:.1f} MB  {tokens:,} tokens  {elapsed:.2f}s  ({tokens / elapsed:,.0f} tokens/s)")
+
+# Size of the script parsed by the streaming_parse benchmark
+STREAMED_SIZE = 100 * 1024 * 1024
+
+# Parsing a script in a fresh interpreter, printing the time taken and the growth of its peak
+# resident memory in KB (on Linux) from reading the script to the AST
+PARSE_MEMORY = '''
+import resource, sys, time
+from parser import parse
+path, mode = sys.argv[1:]
+start = time.perf_counter()
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+with open(path, 'r') as file:
+    program = parse(file.read().strip() if mode == "string" else file)
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+'''
+
+@benchmark
+def streaming_parse():
+    '''
+    Time taken and peak memory of parsing a 100 MB script of long string and array literals, read
+    into a string first and streamed from the file
+    '''
+    block = "".join([
+        f"var string s = \"{'zebra ' * 5000}\";\n",
+        f"var array(int) a = array(int){{{', '.join(str(i) for i in range(50))}}};\n",
+    ])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "streamed.zebra")
+        with open(path, 'w') as file:
+            for _ in range(STREAMED_SIZE // len(block)):
+                file.write(block)
+        size = os.path.getsize(path) / 1024 / 1024
+        for mode in ["string", "file"]:
+            result = subprocess.run([sys.executable, "-c", PARSE_MEMORY, path, mode], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            elapsed, memory = result.stdout.split()
+            print(f"  {size:.0f} MB from a {mode:<6} {float(elapsed):7.2f}s  peak memory +{int(memory) / 1024:,.0f} MB")
+
+# Top level statements of the script run by the streaming_execution benchmark
+STREAMED_STATEMENTS = 10 ** 5
+
+@benchmark
+def streaming_execution():
+    '''
+    Time to the first output, total time and peak memory of running a script of 10^5 top level
+    statements, parsed whole first and a statement at a time (zebra.py --stream)
+    '''
+    lines = ["var int total = 0;", "func int square(int n) {", "    return n * n;", "}"]
+    for i in range(STREAMED_STATEMENTS // 2):
+        lines.append(f"total = total + square({i});")
+        lines.append(f"zout({i}, total);")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "statements.zebra")
+        with open(path, 'w') as file:
+            file.write("\n".join(lines))
+        for options in [[], ["--stream"]]:
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, "zebra.py", "--no-cache", *options, path], stdout=subprocess.PIPE,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)))
+            process.stdout.read(1)
+            first = time.perf_counter() - start
+            process.stdout.read()
+            process.stdout.close()
+            _, _, usage = os.wait4(process.pid, 0)
+            elapsed = time.perf_counter() - start
+            mode = "streamed" if options else "whole"
+            print(f"  {mode:<9} first output {first:6.2f}s  total {elapsed:6.2f}s  peak memory {usage.ru_maxrss / 1024:,.0f} MB")
+
+# Statements of the script parsed by the parse_expressions benchmark
+PARSED_EXPRESSIONS = 20000
+
+@benchmark
+def parse_expressions():
+    '''
+    Statements per second of the parser on a script of long arithmetic, comparison and logical
+    expressions (lexed beforehand, the tokens replayed to the parser)
+    '''
+    operators = ["+", "*", "-", "//", "%", "^", "<<", "+", "*", ">>", "-", "/"]
+    lines = []
+    for i in range(PARSED_EXPRESSIONS):
+        terms = [f"(a{(i + j) % 7} {operators[(i + j) % 12]} {j + 1})" if j % 3 == 0 else f"a{(i * j) % 11}"
+                 for j in range(12)]
+        arithmetic = " ".join(term + " " + operators[(i + j) % 12] for j, term in enumerate(terms[:-1])) + " " + terms[-1]
+        lines.append(f"var boolean b{i} = {arithmetic} < -a{i % 5} && a1 * 2 != ~a2 || a3 >= a4 + 1 == a5 <= 4;")
+    source = "\n".join(lines)
+    tokens = tokenize(source)
+    start = time.perf_counter()
+    parse(source, tokens)
+    elapsed = time.perf_counter() - start
+    print(f"  {PARSED_EXPRESSIONS:,} statements  {len(tokens):,} tokens  {elapsed:.2f}s  ({PARSED_EXPRESSIONS / elapsed:,.0f} statements/s)")
+
+def timeit(function) -> float:
+    '''
+    Wall time taken by calling the function
+    '''
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if (name not in BENCHMARKS):
+            print(f"Unknown benchmark {name}, expected one of: {', '.join(BENCHMARKS)}")
+            exit(-1)
+        print(f"== {name}")
+        BENCHMARKS[name]()
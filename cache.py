@@ -0,0 +1,145 @@
+'''
+Persistent cache of the front end
+
+Stores the parsed, resolved and typechecked program (the AST every engine runs) in a cache
+directory, keyed by a hash of the source, the float mode (the float literals are parsed in it)
+and the interpreter version, so that running the same script again skips the front end.
+Entries are evicted least recently used first once the cache grows beyond its size limit.
+'''
+import hashlib
+import os
+import pickle
+import sys
+from lexer import readChunks
+
+# Directory of the cache entries, and the size it is kept under (in bytes)
+CACHE_DIR = os.environ.get("ZEBRA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "zebra"))
+CACHE_SIZE_LIMIT = int(os.environ.get("ZEBRA_CACHE_SIZE", 64 * 1024 * 1024))
+
+# Modules the cached programs depend on (an entry is only valid for the same sources)
+INTERPRETER_MODULES = ["lexer.py", "parser.py", "resolver.py", "typechecking.py", "sim.py", "error.py", "cache.py"]
+
+# Suffix of the cache entries
+SUFFIX = ".zcache"
+
+interpreterVersion = None
+
+def getInterpreterVersion() -> str:
+    '''
+    Hash of the interpreter modules and the Python version, computed once
+    '''
+    global interpreterVersion
+    if (interpreterVersion == None):
+        digest = hashlib.sha256(sys.version.encode())
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for module in INTERPRETER_MODULES:
+            with open(os.path.join(directory, module), 'rb') as file:
+                digest.update(file.read())
+        interpreterVersion = digest.hexdigest()
+    return interpreterVersion
+
+def cacheKey(stream, floatMode: str) -> str:
+    '''
+    Key of the cache entry of the given source (a string, or a file object or mmap, read in chunks
+    and keyed as the string of its stripped text)
+    '''
+    digest = hashlib.sha256(getInterpreterVersion().encode())
+    digest.update(floatMode.encode())
+    for chunk in ([stream] if isinstance(stream, str) else readChunks(stream)):
+        digest.update(chunk.encode())
+    return digest.hexdigest()
+
+def entryPath(key: str) -> str:
+    return os.path.join(CACHE_DIR, key + SUFFIX)
+
+def load(key: str):
+    '''
+    Returns the program cached with the given key, or None
+    '''
+    path = entryPath(key)
+    try:
+        with open(path, 'rb') as file:
+            program = pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Invalidating unreadable (truncated or stale) entries
+        remove(path)
+        return None
+
+    # Marking the entry as recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return program
+
+def store(key: str, program) -> bool:
+    '''
+    Caches the program with the given key (evicting the least recently used entries if the
+    cache is full), returns if it was cached
+    '''
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        data = pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+    except (OSError, pickle.PicklingError, RecursionError):
+        return False
+    if (len(data) > CACHE_SIZE_LIMIT):
+        return False
+
+    # Writing to a temporary file first, so readers never see partial entries
+    path = entryPath(key)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+    except OSError:
+        remove(temporary)
+        return False
+    evict(CACHE_SIZE_LIMIT)
+    return True
+
+def entries():
+    '''
+    Cache entries as (last use, size, path), least recently used first
+    '''
+    result = []
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return result
+    for name in names:
+        if (name.endswith(SUFFIX)):
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            result.append((stat.st_mtime, stat.st_size, path))
+    result.sort()
+    return result
+
+def evict(limit: int):
+    '''
+    Removes the least recently used entries until the cache takes at most limit bytes
+    '''
+    cached = entries()
+    size = sum(entry[1] for entry in cached)
+    for _, entrySize, path in cached:
+        if (size <= limit):
+            break
+        remove(path)
+        size -= entrySize
+
+def clear():
+    '''
+    Removes all the cache entries
+    '''
+    evict(0)
+
+def remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
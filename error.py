@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from output import OUTPUT
 
 @dataclass
 class Error:
@@ -10,6 +11,8 @@ class Error:
     lineNumber: int     # Line number obtained from the token
 
     def report(self):
+        # Writing out the output printed before the error first
+        OUTPUT.flush()
         print(f"\x1B[1;31m{self.type_}\x1B[0m(\x1B[96mline:\x1B[32m{self.lineNumber}\x1B[0m): {self.message_}")
 
 # Runtime error to be caught in the execute function
@@ -1,18 +1,67 @@
+import codecs
+import gc
+import io
+import re
 from fractions import Fraction
 from dataclasses import dataclass
-from typing import Optional, NewType
+from typing import Iterator, Optional, NewType
 from error import TokenError
 
 class EndOfStream(Exception):
     pass
 
+# Characters (or bytes) read from a file at a time
+CHUNK_SIZE = 1 << 20
+
+def readChunks(file, size: int = CHUNK_SIZE) -> Iterator[str]:
+    '''
+    Generator of the text of a file object or mmap (read from its start, size characters or bytes
+    at a time) stripped of its leading and trailing whitespace, like str.strip. The bytes of binary
+    files and mmaps are decoded as UTF-8, with their line breaks translated as in text files
+    '''
+    file.seek(0)
+    decoder = None
+    started = False
+    pending = ""            # Whitespace held back until something follows it
+    while True:
+        data = file.read(size)
+        if isinstance(data, str):
+            text = data
+        else:
+            if decoder is None:
+                decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+            text = decoder.decode(data, final=len(data) == 0)
+        if (len(data) == 0):
+            return
+        if not started:
+            text = text.lstrip()
+            started = len(text) != 0
+        text = pending + text
+        stripped = text.rstrip()
+        pending = text[len(stripped):]
+        if (len(stripped) != 0):
+            yield stripped
+
 @dataclass
 class Stream:
     source: str
     pos: int
+    chunks: Iterator[str] = None    # Rest of the source, read lazily (see from_file)
 
     def from_string(s):
-        return Stream(bytes(s, 'utf-8').decode('unicode-escape'), 0)
+        return Stream(s, 0)
+
+    def from_file(file, size: int = CHUNK_SIZE):
+        '''
+        Stream of the text of a file object or mmap, read in chunks as it is lexed
+        '''
+        return Stream("", 0, readChunks(file, size))
+
+    def from_source(source):
+        '''
+        Stream of a string, or of a file object or mmap
+        '''
+        return Stream.from_string(source) if isinstance(source, str) else Stream.from_file(source)
 
     def next_char(self):
         if self.pos >= len(self.source):
@@ -77,8 +126,23 @@ whitespace = " \t\n"
 line_cmt = "@"
 multiline_cmt = "$"
 
+# Regular expression of a token (or of whitespace, a comment or an invalid character), the group
+# matched naming its kind. The two character operators are tried before the single characters
+double_operators = "!= <= >= == << >> && || //".split()
+TOKEN = re.compile("|".join([
+    r"(?P<space>[ \t\n]+)",
+    "(?P<operator>" + "|".join(re.escape(operator) for operator in double_operators + symbolic_operators) + ")",
+    r"(?P<word>[^\W\d_]\w*)",
+    r"(?P<number>[0-9]+(?:\.[0-9]*)?)",
+    r"(?P<string>'[^'\\]*(?:\\[\s\S][^'\\]*)*'|\"[^\"\\]*(?:\\[\s\S][^\"\\]*)*\")",
+    r"(?P<comment>@[^\n]*\n?|\$[^$]*\$)",
+    r"(?P<error>[\s\S])",
+]))
+
+reserved_words = set(keywords + dtypes)
+
 def word_to_token(lineNumber, word):
-    if (word in keywords) or (word in dtypes):
+    if word in reserved_words:
         return Keyword(lineNumber,word)
     if word == "true":
         return Boolean(lineNumber, True)
@@ -90,6 +154,7 @@ def word_to_token(lineNumber, word):
 class Lexer:
     stream: Stream
     save: Token = None
+    scanner: Iterator = None # Generator of the tokens (see scan)
     lineNumber = 1
     
     def synchronize(self):
@@ -106,127 +171,9 @@ class Lexer:
         return Lexer(s)
 
     def next_token(self) -> Token:
-        try:
-            next_chr =  self.stream.next_char()
-            match next_chr:
-
-                case c if c in symbolic_operators: 
-                    s = str(c)
-                    if(s == ">" or "<" or "!" or "=" or  "&" or "/" or "|"):
-                        while True:
-                            try:
-                                c = self.stream.next_char()
-                                if ((s=="!" or s=="<" or s==">") and c == "=") or (c==s and (s==">" or s=="<" or s=="=" or s=="&" or s=="|" or s=="/")):
-                                    s = s + str(c) 
-                                    return(Operator(self.lineNumber,s))
-                                else:
-                                    self.stream.unget()
-                                    return (Operator(self.lineNumber,s))
-                            
-                            except EndOfStream:
-                                return (Operator(self.lineNumber,s))
-
-                    return Operator(self.lineNumber,s)         
-
-                case c if c in str_denote:
-                    s=""
-                    while True:
-                        try:
-                            c = self.stream.next_char()
-                            if c == next_chr:
-                                return String(self.lineNumber,s)
-                            else:
-                                s = s+str(c)
-
-                        except:
-                            raise Exception("String not closed")      
-
-                case c if (c == line_cmt):
-                    while True:
-                          try:
-                              c = self.stream.next_char()
-                              if (c == "\n"):
-                                  self.lineNumber += 1
-                                  return self.next_token()
-                              
-                          except:
-                              self.lineNumber += 1
-                              return self.next_token()
-                
-                case c if (c == multiline_cmt):
-                    while True:
-                            try:
-                                c = self.stream.next_char()
-                                if (c == multiline_cmt):
-                                    self.lineNumber += 1
-                                    return self.next_token()
-                            
-                            except:
-                                raise Exception("Comment not closed")
-
-                case c if c.isdigit():
-                    n = int(c)
-                    d = "0."
-                    is_decimal = True
-
-                    while True:
-                        try:
-                            c = self.stream.next_char()
-                            if c.isdigit():
-                                n = n*10 + int(c)
-
-                            elif c=='.':
-                                try:
-                                    while True:
-                                        c = self.stream.next_char()
-                                        if c.isdigit():
-                                            d = d + str(c) 
-                                        else:
-                                            self.stream.unget()
-                                            if (self.stream.pres() == '.'):
-                                                raise Exception("Invalid literal found")
-                                            
-                                            return Flt(self.lineNumber,(n+float(d)))
-
-                                except:
-                                    if d=="0.":
-                                        raise Exception("Invalid literal found")
-                                    return Flt(self.lineNumber,(n+float(d)))
-
-                                
-                            else:
-                                self.stream.unget()
-                                return Integer(self.lineNumber,n)
-
-                        except EndOfStream:
-                            return Integer(self.lineNumber,n)
-
-                case c if c.isalpha():
-                    s = c
-                    while True:
-                        try:
-                            c = self.stream.next_char()
-                            if c.isalnum() or c=="_":
-                                s = s + c
-                            else:
-                                self.stream.unget()
-                                return word_to_token(self.lineNumber, s)
-                        except EndOfStream:
-                            return word_to_token(self.lineNumber, s)
-
-                case c if c in whitespace:
-                    # increasing the line number in case of 
-                    if (c == '\n'):
-                        self.lineNumber += 1
-                    return self.next_token()
-
-                case _:
-                    raise Exception("Invalid literal")
-            
-        except EndOfStream:
-            return EOF()
-
-
+        if self.scanner is None:
+            self.scanner = scan(self, self.stream)
+        return next(self.scanner)
 
     def peek_token(self) -> Token:
         if self.save is not None:
@@ -254,3 +201,120 @@ class Lexer:
             return self.next_token()
         except EndOfTokens:
             raise StopIteration
+
+def decodeEscapes(text: str) -> str:
+    '''
+    Text of a string literal with its escape sequences (like \\n) decoded
+    '''
+    if "\\" not in text:
+        return text
+    return text.encode("latin-1", "backslashreplace").decode("unicode-escape")
+
+def scan(lexer: Lexer, stream: Stream) -> Iterator[Token]:
+    '''
+    Generator of the tokens of the stream (then of EOF for ever), matched by TOKEN in a single pass
+    over each chunk of the source read. A match reaching the end of the chunk (or an unclosed
+    string or comment) is matched again once the next chunk is read, as it may go on in it. The
+    line number of the lexer is kept up to date, for the errors it reports
+    '''
+    line = lexer.lineNumber
+    source = stream.source
+    pos = stream.pos
+    chunks = stream.chunks
+    while True:
+        start = len(source)
+        for match in TOKEN.finditer(source, pos):
+            kind = match.lastgroup
+            if (chunks is not None and (match.end() == len(source) or kind == "error")):
+                start = match.start()
+                break
+            if (kind == "operator"):
+                yield Operator(line, match.group(kind))
+            elif (kind == "word"):
+                yield word_to_token(line, match.group(kind))
+            elif (kind == "space"):
+                newlines = match.group(kind).count("\n")
+                if (newlines != 0):
+                    line += newlines
+                    lexer.lineNumber = line
+            elif (kind == "number"):
+                text = match.group(kind)
+                dot = text.find(".")
+                if (dot == -1):
+                    yield Integer(line, int(text))
+                    continue
+                # A "1." has to be followed by something other than a dot
+                end = match.end()
+                if (dot == len(text) - 1 and (end == len(source) or source[end] == ".")):
+                    raise Exception("Invalid literal found")
+                yield Flt(line, int(text[:dot]) + float("0." + text[dot + 1:]))
+            elif (kind == "string"):
+                yield String(line, decodeEscapes(match.group(kind)[1:-1]))
+            elif (kind == "comment"):
+                # A comment counts as a single line (even one spanning several)
+                line += 1
+                lexer.lineNumber = line
+            else:
+                c = match.group(kind)
+                if c in str_denote:
+                    raise Exception("String not closed")
+                if (c == multiline_cmt):
+                    raise Exception("Comment not closed")
+                raise Exception("Invalid literal")
+        else:
+            if chunks is None:
+                break
+
+        # Reading on (at least as much as what is left to match, for long tokens to take linear time)
+        parts = [source[start:]]
+        left = len(parts[0])
+        read = 0
+        for chunk in chunks:
+            parts.append(chunk)
+            read += len(chunk)
+            if (read >= left):
+                break
+        else:
+            chunks = None
+        source = "".join(parts)
+        pos = 0
+    while True:
+        yield EOF()
+
+def tokenize(source) -> list:
+    '''
+    Lexes the whole source (a string, or a file object or mmap), returning its tokens (up to EOF),
+    each with the line number of the lexer after it (for the errors reported by a parser
+    replaying them, see Tokens)
+    '''
+    lexer = Lexer.from_stream(Stream.from_source(source))
+    tokens = []
+    # The tokens hold no references to other objects, but the collections triggered by so many
+    # allocations would still keep going through the (growing) list of them
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for token in scan(lexer, lexer.stream):
+            tokens.append((token, lexer.lineNumber))
+            if token.__class__ is EOF:
+                return tokens
+    finally:
+        if collecting:
+            gc.enable()
+
+class Tokens(Lexer):
+    '''
+    Lexer replaying the tokens lexed beforehand by tokenize
+    '''
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.pos = 0
+        self.save = None
+        self.lineNumber = 1
+
+    def next_token(self) -> Token:
+        token, self.lineNumber = self.tokens[self.pos]
+        # Staying on EOF once reached
+        if (self.pos < len(self.tokens) - 1):
+            self.pos += 1
+        return token
@@ -0,0 +1,59 @@
+'''
+Buffered output of zout
+
+The engines write the printed values into OUTPUT, which joins them and writes them out in one go
+once it holds more than its size in characters, at the end of a program, before an error is
+reported, when a zout asks for it (flush = true) and when the interpreter exits. The output goes
+to sys.stdout (as it is when flushed), or to a file descriptor.
+'''
+import atexit
+import os
+import sys
+
+# Characters buffered before they are written out
+BUFFER_SIZE = 1 << 16
+
+class Writer:
+    '''
+    Buffer of the output
+    '''
+    def __init__(self, size: int = BUFFER_SIZE, fd: int = None):
+        self.parts = []
+        self.length = 0
+        self.size = size
+        self.fd = fd        # None for sys.stdout
+
+    def write(self, text: str):
+        self.parts.append(text)
+        self.length += len(text)
+        if (self.length > self.size):
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes out the buffered output
+        '''
+        if (len(self.parts) == 0):
+            return
+        text = "".join(self.parts)
+        self.parts.clear()
+        self.length = 0
+        if (self.fd is None):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        else:
+            data = memoryview(text.encode())
+            while (len(data) != 0):
+                data = data[os.write(self.fd, data):]
+
+# Output of the running program
+OUTPUT = Writer()
+atexit.register(OUTPUT.flush)
+
+def configure(size: int = BUFFER_SIZE, fd: int = None):
+    '''
+    Sets the size of the buffer (0 writes out every value) and where the output goes
+    '''
+    OUTPUT.flush()
+    OUTPUT.size = size
+    OUTPUT.fd = fd
@@ -14,6 +14,21 @@ id: Int = 0  # Global ID useful for the resolver pass
 # Global list for storing the names of the classes declared
 classList = []
 
+# Precedence of the binary operators (but the assignment), loosest first. The operators up to
+# ANY_TOKEN_PRECEDENCE are matched by the value of any token, the others only as Operator tokens
+binary_precedence = {
+    "||": 1,
+    "&&": 2,
+    "!=": 3, "==": 3,
+    "<": 4, ">": 4, ">=": 4, "<=": 4,
+    "<<": 5, ">>": 5,
+    "+": 6, "-": 6,
+    "*": 7, "/": 7, "%": 7, "//": 7,
+    "^": 8,
+}
+ANY_TOKEN_PRECEDENCE = 3
+right_associative = ["^"]
+
 def generate_id():
     global id
     id += 1
@@ -126,6 +141,7 @@ class Parser:
         pseq.append(self.parse_expr())
         sep_ = Str(" ")
         end_ = Str("\n")
+        flush_ = Bool(False)
         while(self.lexer.peek_token().val != ")"):
             self.lexer.match(Operator(0, ","))
             if (self.lexer.peek_token().val == "sep"):
@@ -145,13 +161,17 @@ class Parser:
                     ParseError(self, f"Expected a string", end.lineNumber)
                 self.lexer.advance()
                 end_ = Str(end.val)
-                
+
             else:
                 t=self.parse_expr()
-                pseq.append(t)
+                # flush = <boolean expression> (flush is not a keyword, but an option only here)
+                if (isinstance(t, BinOp) and t.operator == "=" and isinstance(t.firstOperand, Variable) and t.firstOperand.name == "flush"):
+                    flush_ = t.secondOperand
+                else:
+                    pseq.append(t)
         self.lexer.match(Operator(0, ")"))
         self.lexer.match(Operator(0, ";"))
-        return PRINT(lineNumber, pseq,sep_,end_)
+        return PRINT(lineNumber, pseq,sep_,end_,flush_)
 
     def parse_return(self):
         lineNumber = self.lexer.peek_token().lineNumber
@@ -219,6 +239,24 @@ class Parser:
         self.lexer.match(Operator(0,";"))
         return array_insert(lineNumber, index, ele, l)
     
+    def parse_map_operator(self):
+        '''
+        Parses the operator a call of map starts with, returned (as its token) in the list of the
+        arguments for the resolver, which tells the bulk array builtin from a function called map.
+        A "-" not followed by a "," is the unary minus of the first argument instead
+        '''
+        op = self.lexer.peek_token()
+        if (not isinstance(op, Operator) or op.val not in MAP_OPERATORS):
+            return []
+        self.lexer.advance()
+        if (self.lexer.peek_token().val == "," or op.val != "-"):
+            self.lexer.match(Operator(0, ","))
+            return [op]
+        arg = self.parse_binary(left=UnOp(op.lineNumber, op.val, self.parse_unary()))
+        if (self.lexer.peek_token().val == ","):
+            self.lexer.advance()
+        return [arg]
+
     def parse_expr_stmt(self):
         t = self.parse_expr()
         self.lexer.match(Operator(0, ';'))
@@ -229,10 +267,10 @@ class Parser:
         ast = self.parse_atom()
         while True:
             
-            # Parsing function calls
+            # Parsing function calls (and the bulk array builtins, told apart by the resolver)
             if self.lexer.peek_token().val == "(":
                 self.lexer.advance()
-                params = []
+                params = self.parse_map_operator() if isinstance(ast, Variable) and ast.name == "map" else []
                 while(self.lexer.peek_token().val != ")"):
                     iden = self.parse_expr()
                     params.append(iden)
@@ -372,90 +410,27 @@ class Parser:
             return self.parse_len()
         return self.parse_call()
     
-    def parse_power(self):
-        left = self.parse_unary()
-        op = self.lexer.peek_token()
-        if(isinstance(op, Operator) and op.val == "^"):
-            self.lexer.advance()
-            right = self.parse_power()
-            return BinOp(op.lineNumber, op.val,left, right)
-        return left
-    
-    def parse_mult(self):
-        left = self.parse_power()
-        while True:
-            match self.lexer.peek_token():
-                case Operator(lineNumber, op) if op in "*/%" or op == "//":
-                    self.lexer.advance()
-                    m = self.parse_power()
-                    left = BinOp(lineNumber, op, left, m)
-                case _:
-                    break
-        return left
-    
-    def parse_add(self):
-        left = self.parse_mult()
+    def parse_binary(self, minimum: int = 1, left: AST = None):
+        '''
+        Parses the binary operations (but assignments) by precedence climbing: the operators of at
+        least the minimum precedence are parsed here, with the operations of higher precedence
+        parsed as their operands. The left operand can be given, when it was already parsed
+        '''
+        if (left is None):
+            left = self.parse_unary()
         while True:
-            match self.lexer.peek_token():
-                case Operator(lineNumber, op) if op in ["+","-"]:
-                    self.lexer.advance()
-                    m = self.parse_mult()
-                    left = BinOp(lineNumber, op, left, m)
-                case _:
-                    break
-        return left
-
-    def parse_shift(self):
-        left = self.parse_add()
-        while True:
-            match self.lexer.peek_token():
-                case Operator(lineNumber, op) if op in ["<<",">>"]:
-                    self.lexer.advance()
-                    m = self.parse_add()
-                    left = BinOp(lineNumber, op, left, m)
-                case _:
-                    break
-        return left
-    
-    def parse_comparision(self):
-        left = self.parse_shift()
-        while(isinstance(self.lexer.peek_token(), Operator) and self.lexer.peek_token().val in ["<",">",">=","<="]):
-            op = self.lexer.peek_token()
-            self.lexer.advance()
-            right = self.parse_shift()
-            left =  BinOp(op.lineNumber, op.val, left, right)
-        return left
-    
-    def parse_equality(self):
-        left = self.parse_comparision()
-        while(self.lexer.peek_token().val in ["!=","=="]) :
-            t = self.lexer.peek_token()
-            self.lexer.advance()
-            right = self.parse_comparision()
-            left = BinOp(t.lineNumber, t.val,left,right)
-        return left
-    
-    def parse_logic_and(self) :
-        left = self.parse_equality()
-        while(self.lexer.peek_token().val == "&&"):
-            op = self.lexer.peek_token()
-            self.lexer.advance()
-            right = self.parse_equality()
-            left = BinOp(op.lineNumber, op.val,left,right)
-        return left
-    
-    def parse_logic_or(self) :
-        left = self.parse_logic_and()
-        while(self.lexer.peek_token().val == "||" ) :
             op = self.lexer.peek_token()
+            precedence = binary_precedence.get(op.val)
+            if (precedence == None or precedence < minimum or
+                    (precedence > ANY_TOKEN_PRECEDENCE and not isinstance(op, Operator))):
+                return left
             self.lexer.advance()
-            right = self.parse_logic_and()
-            left = BinOp(op.lineNumber, op.val,left,right)
-        return left
-    
+            right = self.parse_binary(precedence if op.val in right_associative else precedence + 1)
+            left = BinOp(op.lineNumber, op.val, left, right)
+
     def parse_assign(self):
         # Parsing the left hand side of the assignment
-        l = self.parse_logic_or()
+        l = self.parse_binary()
 
         # Verifying if its the assignment operator
         op = self.lexer.peek_token()
@@ -479,7 +454,7 @@ class Parser:
             else:
                 ParseError(self, "Expected an Identifier or field of instance.", l.lineNumber)
         
-        # Returning the value of parse_logic_or
+        # Returning the value of parse_binary
         return l
     
     def parse_expr(self):
@@ -610,7 +585,7 @@ class Parser:
                 self.lexer.match(Keyword(0, "int"))
                 
                 # Getting the variable or the Get expr
-                var = self.parse_logic_or()
+                var = self.parse_binary()
 
                 expr = nil()
 
@@ -630,7 +605,7 @@ class Parser:
                 self.lexer.match(Keyword(0, "float"))
                 
                 # Getting the variable or the Get expr
-                var = self.parse_logic_or()
+                var = self.parse_binary()
 
                 expr = nil()
 
@@ -650,7 +625,7 @@ class Parser:
                 self.lexer.match(Keyword(0, "string"))
                 
                 # Getting the variable or the Get expr
-                var = self.parse_logic_or()
+                var = self.parse_binary()
 
                 expr = nil()
 
@@ -670,7 +645,7 @@ class Parser:
                 self.lexer.match(Keyword(0, "boolean"))
                 
                 # Getting the variable or the Get expr
-                var = self.parse_logic_or()
+                var = self.parse_binary()
 
                 expr = nil()
 
@@ -695,7 +670,7 @@ class Parser:
                 dtype = arrayType(self.parse_array_type())
 
                  # Getting the variable or the Get expr
-                var = self.parse_logic_or()
+                var = self.parse_binary()
 
                 expr = nil()
 
@@ -824,9 +799,11 @@ class Parser:
                 isParseError = True
         return Seq(seqs)
 
-def parse(string):
+def parse(string, tokens: list = None):
     '''
     Return a Parsed AST as well as the isParseError flag corresponding to parsing
+    (of the tokens of the string, when they were lexed beforehand by tokenize). The string can
+    also be a file object or mmap, lexed as it is read
     '''
     # Reinitializing the isParseError to False
     global isParseError 
@@ -834,7 +811,7 @@ def parse(string):
 
     # Returning the obtained AST as well as the flag isParseError
     programAST = Parser.parse_program (
-        Parser(Lexer.from_stream(Stream.from_string(string)))
+        Parser(Lexer.from_stream(Stream.from_source(string)) if tokens is None else Tokens(tokens))
     )
 
     # Reraising the ParseException if isParseError is True
@@ -843,6 +820,27 @@ def parse(string):
     
     return programAST
 
+def parseStatements(string):
+    '''
+    Generator of the top level statements of the string (or file object or mmap), each parsed as
+    soon as its tokens are read. After a statement with parse errors, the rest is only parsed to
+    report their errors, and ParseException is raised
+    '''
+    global isParseError
+    isParseError = False
+
+    parser = Parser(Lexer.from_stream(Stream.from_source(string)))
+    while(parser.lexer.peek_token() != EOF()):
+        try:
+            statement = parser.parse_declare()
+        except (ParseException, TokenException):
+            isParseError = True
+        if not isParseError:
+            yield statement
+
+    if isParseError:
+        raise ParseException
+
 def test_parse():
     # print(parse("array int a = [1,2,3]; append(2,a); remove(2,a); insert(0,100,a); a[0:2];")) 
     # print(parse("append(2,a)"))
@@ -0,0 +1,282 @@
+'''
+Profilers of zebra programs (zebra.py --profile and --sample)
+
+Profiler.run evaluates a program with the tree walking evaluator, sim.evaluate, replaced by a
+wrapper timing every node evaluated. The time and counts are recorded by the line of the node
+and, for the function calls, by the name of the function called. The nodes without a line
+number (like Seq) and the leaves (variables and literals, only counted) count towards the line
+they were evaluated from. Calls made in tail position replace the calling function (see
+TailCall), so their time counts towards the call they replaced.
+
+Sampler.run instead leaves the evaluator as it is, and counts the call stacks found at regular
+intervals (zebra.py --sample), for a profile of (nearly) full speed runs on any engine.
+'''
+import json
+import signal
+import sys
+import threading
+import time
+import sim
+
+# Columns of the statistics of a line and of a function
+EVALUATIONS, INCLUSIVE, EXCLUSIVE, SCOPES, LOOKUPS = range(5)
+CALLS = 0
+
+# Rows shown in each table of the text report
+REPORT_ROWS = 20
+
+# Seconds between the samples of the sampling profiler (of CPU time where there are timer signals)
+SAMPLE_INTERVAL = 0.01
+
+# Name of the code outside of any function
+MAIN = "<main>"
+
+# Nodes only counted, their (short) evaluation counting towards the time of the node evaluating them
+LEAVES = {sim.Variable, sim.Int, sim.Float, sim.Bool, sim.Str, sim.nil, int, float, str}
+
+def functionName(f: 'sim.AST') -> str:
+    '''
+    Name of the function called through the given expression
+    '''
+    match f:
+        case sim.Variable(_, name, _):
+            return name
+        case sim.Get(_, _, name, _):
+            return f".{name}"
+    return "<anonymous>"
+
+class Profiler:
+    '''
+    Statistics of the evaluation of a program, by line and by function
+    '''
+    def __init__(self):
+        self.lines = {}         # Line number -> [evaluations, inclusive, exclusive time, scope entries, variable lookups]
+        self.functions = {}     # Function name -> [calls, inclusive, exclusive time]
+        self.total = 0.0
+        self.line = 0           # Line of the node being evaluated
+        self.activeLines = {}   # Evaluations of each line in progress (timed once, by the outermost)
+        self.activeCalls = {}   # Calls of each function in progress (timed once, by the outermost)
+        self.children = [0.0]   # Time spent in the nodes evaluated by each node in progress
+        self.calls = [[MAIN, 0.0]] # Function and the time spent in the calls it made, for each call in progress
+
+    def lineStats(self, line: int) -> list:
+        stats = self.lines.get(line)
+        if (stats == None):
+            stats = self.lines[line] = [0, 0.0, 0.0, 0, 0]
+        return stats
+
+    def functionStats(self, name: str) -> list:
+        stats = self.functions.get(name)
+        if (stats == None):
+            stats = self.functions[name] = [0, 0.0, 0.0]
+        return stats
+
+    def run(self, program: 'sim.AST', scopes: 'sim.Scopes'):
+        '''
+        Evaluates the program while profiling it
+        '''
+        evaluate = sim.evaluate
+        beginScope = sim.Scopes.beginScope
+        lookup = sim.Scopes.lookup
+        perf_counter = time.perf_counter
+        profiler = self
+
+        def profiled(program: 'sim.AST', scopes: 'sim.Scopes' = None):
+            if (program.__class__ in LEAVES):
+                profiler.lineStats(profiler.line)[EVALUATIONS] += 1
+                return evaluate(program, scopes)
+            line = getattr(program, "lineNumber", None)
+            if (line == None):
+                line = profiler.line
+            stats = profiler.lineStats(line)
+            stats[EVALUATIONS] += 1
+            outerLine = profiler.line
+            profiler.line = line
+            activeLines = profiler.activeLines
+            nested = activeLines.get(line, 0)
+            activeLines[line] = nested + 1
+
+            # Function calls (and the calls in tail position, only counted)
+            name = None
+            if (program.__class__ is sim.FunCall):
+                name = functionName(program.fn)
+                profiler.functionStats(name)[CALLS] += 1
+                profiler.calls.append([name, 0.0])
+                nestedCalls = profiler.activeCalls.get(name, 0)
+                profiler.activeCalls[name] = nestedCalls + 1
+            elif (program.__class__ is sim.Return and program.value.__class__ is sim.FunCall and program.value.tail):
+                profiler.functionStats(functionName(program.value.fn))[CALLS] += 1
+
+            children = profiler.children
+            children.append(0.0)
+            start = perf_counter()
+            try:
+                return evaluate(program, scopes)
+            finally:
+                elapsed = perf_counter() - start
+                stats[EXCLUSIVE] += elapsed - children.pop()
+                children[-1] += elapsed
+                if (nested == 0):
+                    stats[INCLUSIVE] += elapsed
+                activeLines[line] = nested
+                profiler.line = outerLine
+
+                if (name != None):
+                    _, calls = profiler.calls.pop()
+                    functionStats = profiler.functions[name]
+                    functionStats[EXCLUSIVE] += elapsed - calls
+                    if (nestedCalls == 0):
+                        functionStats[INCLUSIVE] += elapsed
+                    profiler.activeCalls[name] = nestedCalls
+                    profiler.calls[-1][1] += elapsed
+
+        def countedBeginScope(scopes: 'sim.Scopes'):
+            profiler.lineStats(profiler.line)[SCOPES] += 1
+            beginScope(scopes)
+
+        def countedLookup(scopes: 'sim.Scopes', var: 'sim.Variable'):
+            profiler.lineStats(profiler.line)[LOOKUPS] += 1
+            return lookup(scopes, var)
+
+        # The evaluator calls itself through the module, evaluating the whole program through profiled
+        sim.evaluate = profiled
+        sim.Scopes.beginScope = countedBeginScope
+        sim.Scopes.lookup = countedLookup
+        start = perf_counter()
+        try:
+            return profiled(program, scopes)
+        finally:
+            self.total += perf_counter() - start
+            sim.evaluate = evaluate
+            sim.Scopes.beginScope = beginScope
+            sim.Scopes.lookup = lookup
+            # The time spent outside of any function
+            main = self.functionStats(MAIN)
+            main[CALLS] = 1
+            main[INCLUSIVE] = self.total
+            main[EXCLUSIVE] = self.total - self.calls[0][1]
+
+    def toJSON(self, path: str = None, source: str = None) -> dict:
+        '''
+        Statistics as a JSON serializable dictionary (lines and functions sorted by exclusive time)
+        '''
+        sourceLines = source.split("\n") if source != None else []
+        lines = []
+        for line, (evaluations, inclusive, exclusive, scopes, lookups) in self.lines.items():
+            lines.append({
+                "line": line,
+                "source": sourceLines[line - 1].strip() if 0 < line <= len(sourceLines) else "",
+                "evaluations": evaluations,
+                "inclusive": inclusive,
+                "exclusive": exclusive,
+                "scopeEntries": scopes,
+                "variableLookups": lookups,
+            })
+        functions = []
+        for name, (calls, inclusive, exclusive) in self.functions.items():
+            functions.append({"name": name, "calls": calls, "inclusive": inclusive, "exclusive": exclusive})
+        return {
+            "path": path,
+            "total": self.total,
+            "evaluations": sum(stats[EVALUATIONS] for stats in self.lines.values()),
+            "lines": sorted(lines, key=lambda line: -line["exclusive"]),
+            "functions": sorted(functions, key=lambda function: -function["exclusive"]),
+        }
+
+    def writeJSON(self, file: str, path: str = None, source: str = None):
+        with open(file, 'w') as output:
+            json.dump(self.toJSON(path, source), output, indent=2)
+
+    def report(self, path: str = None, source: str = None, file = None):
+        '''
+        Writes the text report, the hottest lines and functions first (to stderr by default)
+        '''
+        file = file if file != None else sys.stderr
+        profile = self.toJSON(path, source)
+        print(f"Profile of {path or 'the program'}: {profile['total']:.3f}s, {profile['evaluations']:,} nodes evaluated", file=file)
+        print(f"\n{'line':>6} {'evaluations':>12} {'inclusive':>10} {'exclusive':>10} {'scopes':>9} {'lookups':>10}  source", file=file)
+        for line in profile["lines"][:REPORT_ROWS]:
+            print(f"{line['line']:>6} {line['evaluations']:>12,} {line['inclusive']:>9.3f}s {line['exclusive']:>9.3f}s "
+                  f"{line['scopeEntries']:>9,} {line['variableLookups']:>10,}  {line['source'][:60]}", file=file)
+        print(f"\n{'function':<24} {'calls':>12} {'inclusive':>10} {'exclusive':>10}", file=file)
+        for function in profile["functions"][:REPORT_ROWS]:
+            print(f"{function['name'][:24]:<24} {function['calls']:>12,} {function['inclusive']:>9.3f}s {function['exclusive']:>9.3f}s", file=file)
+
+class Sampler:
+    '''
+    Sampling profiler: the stack of zebra calls, sim.CALLS (kept by the calls of every engine), is
+    sampled every interval, by a SIGPROF timer (or by a background thread where there are no timer
+    signals), and nothing is recorded between the samples. The samples are counted by stack, written
+    as collapsed stacks ("<main>:line;function:line;...;function count", as read by flame graph
+    tools), where the line of each function is the line of the call it is making. The stacks are
+    counted by the ids of their calls (the tuples are shared by all the runs of a call on the closure
+    compiler and the VM, but for the calls in tail position), and only named when written
+    '''
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = {}        # Ids of the calls of a stack -> samples
+        self.calls = {}         # Id -> (function expression, line), of the calls sampled
+        self.samples = 0
+
+    def run(self, program: 'sim.AST', scopes: 'sim.Scopes', evaluate = None):
+        '''
+        Evaluates the program with the given engine (the tree walking evaluator by default) while
+        sampling it
+        '''
+        evaluate = evaluate if evaluate != None else sim.evaluate
+        sim.CALLS.clear()
+        if (hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()):
+            previous = signal.signal(signal.SIGPROF, lambda signum, frame: self.sample())
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            try:
+                return evaluate(program, scopes)
+            finally:
+                signal.setitimer(signal.ITIMER_PROF, 0, 0)
+                signal.signal(signal.SIGPROF, previous)
+
+        # Sampling the calls of this thread from another one
+        done = threading.Event()
+        def sampling():
+            while (not done.wait(self.interval)):
+                self.sample()
+        thread = threading.Thread(target=sampling, daemon=True)
+        thread.start()
+        try:
+            return evaluate(program, scopes)
+        finally:
+            done.set()
+            thread.join()
+
+    def sample(self):
+        '''
+        Counts the stack of the calls in progress
+        '''
+        calls = sim.CALLS.copy()
+        stack = tuple(map(id, calls))
+        samples = self.stacks.get(stack)
+        if (samples == None):
+            samples = 0
+            for call in calls:
+                self.calls[id(call)] = call
+        self.stacks[stack] = samples + 1
+        self.samples += 1
+
+    def collapsed(self) -> dict:
+        '''
+        Samples by collapsed stack
+        '''
+        stacks = {}
+        for stack, samples in self.stacks.items():
+            calls = [self.calls[call] for call in stack]
+            names = [MAIN] + [functionName(fn) for fn, _ in calls]
+            collapsed = ";".join([f"{name}:{line}" for name, (_, line) in zip(names, calls)] + [names[-1]])
+            stacks[collapsed] = stacks.get(collapsed, 0) + samples
+        return stacks
+
+    def writeCollapsed(self, file: str):
+        '''
+        Writes the samples as collapsed stacks, one "stack count" line each
+        '''
+        with open(file, 'w') as output:
+            for collapsed, count in sorted(self.collapsed().items()):
+                output.write(f"{collapsed} {count}\n")
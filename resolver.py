@@ -6,12 +6,18 @@ class ResolverScopes:
     Scopes storing the stack of environments
     '''
     stack: List[Dict[Variable, "AST"]]
+    slots: int          # Number of runtime slots handed out so far
+    functions: set      # Slots of the declared functions (not methods)
+    function: int       # Slot of the function being resolved (None outside functions and in methods)
 
     def __init__(self, stack: List[Dict[Variable, "AST"]] = None):
         if (stack == None):
             self.stack = [dict()]
         else:
             self.stack = stack
+        self.slots = 0
+        self.functions = set()
+        self.function = None
     
     def beginScope(self):
         self.stack.append({})
@@ -20,6 +26,14 @@ class ResolverScopes:
         assert(len(self.stack) != 0)
         self.stack.pop()
         
+    def newSlot(self, var: Variable):
+        '''
+        Returns the declared variable with the next free runtime slot as its id
+        '''
+        slot = self.slots
+        self.slots += 1
+        return Variable(var.lineNumber, var.name, slot)
+
     def declareFun(self, name: str, var: Variable, fn_object: FnObject):
         '''
         Declares the function in the current scope as the variable f
@@ -44,6 +58,12 @@ class ResolverScopes:
         self.stack[-1][name] = var
 
 
+    def isDeclared(self, name: str) -> bool:
+        '''
+        Whether a variable (or function) of the given name is visible from the current scope
+        '''
+        return any(name in scope for scope in self.stack)
+
     def getVariable(self, name: str, lineNumber: int):
         '''
         Utility to get the variable in the closest scope
@@ -82,6 +102,7 @@ def resolve(program: AST, scopes : ResolverScopes = None):
             # Resolving the value
             resolvedValue = resolve(value, scopes)
             # Declaring the variable
+            var = scopes.newSlot(var)
             scopes.declareVariable(var.name, var)
             # Resolving the data type
             if ((not isinstance(dtype, type)) and isinstance(dtype, instanceType)):
@@ -90,11 +111,14 @@ def resolve(program: AST, scopes : ResolverScopes = None):
         
         case DeclareClass(lineNumber, var, stmts, thisID):
             # Declaring the class
+            var = scopes.newSlot(var)
             scopes.declareVariable(var.name, var)
             # Resolving the statements
             scopes.beginScope()
             # Declaring the this variable
-            scopes.declareVariable("this", Variable(lineNumber, "this", thisID))
+            this = scopes.newSlot(Variable(lineNumber, "this", thisID))
+            thisID = this.id
+            scopes.declareVariable("this", this)
             for methodName in stmts:
                 
                 stmts[methodName] = resolve(stmts[methodName], scopes)
@@ -103,9 +127,15 @@ def resolve(program: AST, scopes : ResolverScopes = None):
 
         case DeclareFun(lineNumber, var, return_type, params_type, params, body, function_type):
             # Declaring the function
+            var = scopes.newSlot(var)
             scopes.declareFun(var.name, var, FnObject(function_type, return_type, params_type, params, body))
+            if (function_type == 'FUNCTION'):
+                scopes.functions.add(var.id)
+            enclosingFunction = scopes.function
+            scopes.function = var.id if function_type == 'FUNCTION' else None
             scopes.beginScope()
             # Declaring the parameters
+            params = [scopes.newSlot(param) for param in params]
             for param in params:
                 scopes.declareVariable(param.name, param)
             for i in range(len(params_type)):
@@ -114,6 +144,7 @@ def resolve(program: AST, scopes : ResolverScopes = None):
             # Resolving the body
             resolvedBody = resolve(body, scopes)
             scopes.endScope()
+            scopes.function = enclosingFunction
             return DeclareFun(lineNumber, var, return_type, params_type, params, resolvedBody, function_type)
         
         case Get(lineNumber, var, name):
@@ -136,7 +167,23 @@ def resolve(program: AST, scopes : ResolverScopes = None):
             resolvedValue = resolve(value, scopes)
             return SetAtIndex(lineNumber, resolvedVar, resolvedIndex, resolvedValue)
 
+        case FunCall(lineNumber, Variable(_, name, _), args) if (name in ARRAY_BUILTIN_ARITY and not scopes.isDeclared(name)):
+            # Calls of the bulk array builtins, unless a variable or function of the same name is visible
+            operator = None
+            if (name == "map"):
+                if (len(args) == 0 or not isinstance(args[0], Operator)):
+                    resolveError(f"Expected one of the operators {' '.join(MAP_OPERATORS)} for map", lineNumber)
+                operator = args[0].val
+                args = args[1:]
+            if (len(args) != ARRAY_BUILTIN_ARITY[name]):
+                resolveError(f"{name} takes {ARRAY_BUILTIN_ARITY[name]} arguments, but {len(args)} were given", lineNumber)
+            return array_builtin(lineNumber, name, [resolve(arg, scopes) for arg in args], operator)
+
         case FunCall(lineNumber, var, args):
+            # The operator of map is only an argument of the builtin
+            for arg in args:
+                if (isinstance(arg, Operator)):
+                    resolveError(f"Expected an expression instead of the operator {arg.val}", lineNumber)
             # Resolving the function variable
             resolvedVar = resolve(var, scopes)
             # Resolving the arguments
@@ -146,6 +193,11 @@ def resolve(program: AST, scopes : ResolverScopes = None):
         case Return(lineNumber, value):
             # Resolving the value
             resolvedValue = resolve(value, scopes)
+            # Calls of functions declared outside the current one (or itself) can reuse its activation,
+            # as their bodies cannot refer to the variables of the current function
+            if (isinstance(resolvedValue, FunCall) and isinstance(resolvedValue.fn, Variable) and scopes.function != None
+                    and resolvedValue.fn.id in scopes.functions and resolvedValue.fn.id <= scopes.function):
+                resolvedValue.tail = True
             return Return(lineNumber, resolvedValue)
         
         case Block(blockStatements):
@@ -181,12 +233,13 @@ def resolve(program: AST, scopes : ResolverScopes = None):
             resolvedThis = This(lineNumber, referencingVariable.id)
             return resolvedThis
 
-        case PRINT(lineNumber, print_stmts, sep,end):
+        case PRINT(lineNumber, print_stmts, sep, end, flush):
             # Resolving the print statement
             resolvedPrintStmt = [resolve(print_stmt, scopes) for print_stmt in print_stmts]
             resolvedSep = resolve(sep, scopes)
             resolvedEnd = resolve(end, scopes)
-            return PRINT(lineNumber, resolvedPrintStmt, resolvedSep, resolvedEnd)
+            resolvedFlush = resolve(flush, scopes)
+            return PRINT(lineNumber, resolvedPrintStmt, resolvedSep, resolvedEnd, resolvedFlush)
         
         case BinOp(lineNumber, op, left, right):
             # Resolving the left and right
@@ -1,22 +1,53 @@
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
 from fractions import Fraction
 from typing import Union, Optional, List, Dict
+from operator import mul
 from lexer import Keyword, Operator, Identifier
 from error import RuntimeError, typeCheckError, resolveError
+from output import OUTPUT
 import pprint
 
-def traverse_array(lst):
+# NumPy is optional, the bulk array builtins fall back to Python without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Elements of a flat array formatted at a time while printing it
+FORMAT_CHUNK = 4096
+
+def writeArray(lst, write):
     '''
-    Utility for printing lists
+    Utility for printing arrays, written out piece by piece as Python prints lists
     '''
-    print_lst = []
-    for ele in lst.elements:
-        if isinstance(ele, zArray):
-            array_ele = traverse_array(ele)
-            print_lst.append(array_ele)
-        else:
-            print_lst.append(ele.value)
-    return print_lst
+    elements = lst.elements
+    write("[")
+    if (len(lst.dtype) > 2):
+        # Arrays of arrays
+        for i, ele in enumerate(elements):
+            if (i != 0):
+                write(", ")
+            if isinstance(ele, zArray):
+                writeArray(ele, write)
+            else:
+                write(repr(ele))
+    else:
+        for start in range(0, len(elements), FORMAT_CHUNK):
+            if (start != 0):
+                write(", ")
+            write(", ".join(map(repr, elements[start:start + FORMAT_CHUNK])))
+    write("]")
+
+def printValue(value, end: str):
+    '''
+    Utility for printing the value of an expression (arrays as lists) followed by the end
+    '''
+    if isinstance(value, zArray):
+        writeArray(value, OUTPUT.write)
+        OUTPUT.write(end)
+    else:
+        OUTPUT.write(str(value) + end)
 
 @dataclass
 class metadata:
@@ -64,11 +95,11 @@ class Int():
 @dataclass
 class Float():
     '''
-    Floating objects represented as Fractions in python
+    Floating objects represented as Fractions (or doubles, see setFloatMode) in python
     '''
     value: Fraction
     def __init__(self, value):
-        self.value = Fraction(value)
+        self.value = FloatType(value)
     def __repr__ (self):
        return f"{self.value}"
 
@@ -94,6 +125,193 @@ class Str() :
     def __repr__ (self):
        return f"{self.value}"
 
+# Strings at least this long are concatenated (and have their characters set) in a StrBuilder
+BUILDER_MIN_LENGTH = 256
+
+class StrBuilder:
+    '''
+    Mutable representation of a long string, the list of its characters. Appending to it or
+    setting a character hands the list over to the resulting string and changes it in place:
+    the previous string only records that change (in diff), to undo it if it is read again.
+    The text is joined (and cached) when the string is printed or compared
+    '''
+    __slots__ = ("chars", "diff", "text")
+
+    def __init__(self, text: str):
+        self.chars = list(text)
+        self.diff = None    # (next string, index set or None when appended to, previous character or length)
+        self.text = text
+
+    def characters(self) -> list:
+        '''
+        Characters of the string, rebuilt from the strings it was changed into if they were taken
+        '''
+        if (self.chars is None):
+            if (self.text is not None):
+                self.chars = list(self.text)
+            else:
+                diffs = []
+                node = self
+                while (node.chars is None):
+                    diffs.append(node.diff)
+                    node = node.diff[0]
+                chars = node.chars[:]
+                for _, index, previous in reversed(diffs):
+                    if (index is None):
+                        del chars[previous:]
+                    else:
+                        chars[index] = previous
+                self.chars = chars
+            self.diff = None
+        return self.chars
+
+    def handedOver(self, index: Optional[int], previous) -> 'StrBuilder':
+        '''
+        New string taking over the characters, about to be changed (at the index, or appended to)
+        '''
+        chars = self.characters()
+        builder = StrBuilder.__new__(StrBuilder)
+        builder.chars = chars
+        builder.diff = None
+        builder.text = None
+        self.chars = None
+        self.diff = (builder, index, previous)
+        return builder
+
+    def replaced(self, index: int, char: str) -> 'StrBuilder':
+        '''
+        String with the character at the index replaced by the given one
+        '''
+        builder = self.handedOver(index, self.characters()[index])
+        builder.chars[index] = char
+        return builder
+
+    def __add__(self, other) -> 'StrBuilder':
+        other = str(other)
+        builder = self.handedOver(None, len(self.characters()))
+        builder.chars.extend(other)
+        return builder
+
+    def __radd__(self, other: str) -> 'StrBuilder':
+        return StrBuilder(other + str(self))
+
+    def __mul__(self, other: int) -> str:
+        return str(self) * other
+
+    def __rmul__(self, other: int) -> str:
+        return other * str(self)
+
+    def __str__(self) -> str:
+        if (self.text is None):
+            self.text = "".join(self.characters())
+        return self.text
+
+    def __repr__(self) -> str:
+        return repr(str(self))
+
+    def __len__(self) -> int:
+        return len(self.text) if self.text is not None else len(self.characters())
+
+    def __getitem__(self, index):
+        if (self.text is not None):
+            return self.text[index]
+        if (isinstance(index, slice)):
+            return "".join(self.characters()[index])
+        return self.characters()[index]
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __eq__(self, other):
+        return str(self) == other
+
+    def __ne__(self, other):
+        return str(self) != other
+
+    def __lt__(self, other):
+        return str(self) < str(other)
+
+    def __le__(self, other):
+        return str(self) <= str(other)
+
+    def __gt__(self, other):
+        return str(self) > str(other)
+
+    def __ge__(self, other):
+        return str(self) >= str(other)
+
+# Python classes of the string values
+STRING_TYPES = (str, StrBuilder)
+
+def concatenateStrings(first: str, second) -> Union[str, StrBuilder]:
+    '''
+    Concatenation of a str with a string, into a StrBuilder once it is long (to be appended to in place)
+    '''
+    if (len(first) >= BUILDER_MIN_LENGTH):
+        return StrBuilder(first) + second
+    return first + second
+
+def replacedCharacter(string: Union[str, StrBuilder], index: int, value: str) -> Union[str, StrBuilder]:
+    '''
+    String with the character at the index replaced by the value (in place for the long strings)
+    '''
+    if (len(value) == 1 and (string.__class__ is StrBuilder or len(string) >= BUILDER_MIN_LENGTH)):
+        return (string if string.__class__ is StrBuilder else StrBuilder(string)).replaced(index, value)
+    return string[:index] + value + string[index+1:]
+
+# Runtime values are native Python objects, the literal classes above only appear in the AST
+# (and as the types tracked by the typechecker)
+NATIVE_TYPES = {
+    Int: int,
+    Float: Fraction,
+    Bool: bool,
+    Str: STRING_TYPES,
+    nil: type(None)
+}
+
+# Literal class of each native runtime value (used while reporting errors)
+LITERAL_TYPES = {native: literal for literal, native in NATIVE_TYPES.items() if literal is not Str}
+LITERAL_TYPES[float] = Float
+LITERAL_TYPES[str] = LITERAL_TYPES[StrBuilder] = Str
+
+# Constant expressions (literals, and the immutable values they are replaced by once evaluated)
+CONSTANTS = (Int, Float, Bool, Str, nil, int, float, str, Fraction, type(None))
+
+# Python class of the Float values in each numeric mode
+FLOAT_MODES = {
+    "fraction": Fraction,   # Exact rationals (default)
+    "double": float         # IEEE-754 doubles
+}
+
+# Python class of the Float values of the running program
+FloatType = Fraction
+
+def setFloatMode(mode: str):
+    '''
+    Utility to select the numeric mode of the Float values (must be set before parsing a program)
+    '''
+    global FloatType
+    FloatType = FLOAT_MODES[mode]
+    NATIVE_TYPES[Float] = FloatType
+
+def floatValue(value) -> Union[Fraction, float]:
+    '''
+    Utility to convert a number into a Float value of the current numeric mode
+    '''
+    return FloatType(value)
+
+def literalType(value) -> type:
+    '''
+    Utility to get the literal class (Int, Float, ...) of a runtime value
+    '''
+    return LITERAL_TYPES.get(type(value), type(value))
+
+def nativeType(dtype: type) -> type:
+    '''
+    Utility to get the class of the runtime values of the given data type
+    '''
+    return NATIVE_TYPES.get(dtype, dtype)
+
 # Defined binary operators in the Language
 BINARY_OPERATORS = [
                     "+", "/", "-", "//", "*", "%", "^", "-",    # Binary operators for numbers
@@ -112,6 +330,8 @@ UNARY_OPERATORS = [
 class zArray(metadata):
     dtype : List[type|instanceType]
     elements : list
+    # Whether the storage of the elements is shared with slices (copied before any mutation)
+    shared : bool = field(default=False, compare=False)
 
     # Utility function to print the array
     def __repr__(self):
@@ -122,6 +342,256 @@ class zArray(metadata):
         return s
             
 
+class BoolArray(bytearray):
+    '''
+    Compact storage of the boolean arrays, one byte per element (read back as booleans)
+    '''
+    def __getitem__(self, index):
+        if (isinstance(index, slice)):
+            return BoolArray(bytearray.__getitem__(self, index))
+        return bytearray.__getitem__(self, index) != 0
+
+    def __iter__(self):
+        return (byte != 0 for byte in bytearray.__iter__(self))
+
+    def __add__(self, other):
+        return BoolArray(bytearray.__add__(self, other))
+
+    def __mul__(self, count: int):
+        return BoolArray(bytearray.__mul__(self, count))
+
+    def pop(self, index: int = -1) -> bool:
+        return bytearray.pop(self, index) != 0
+
+    def __repr__(self):
+        return repr(list(self))
+
+# Reads a byte of a BoolArray directly (its __getitem__ is a much slower Python call)
+byteAt = bytearray.__getitem__
+
+class ArrayView:
+    '''
+    Elements start:stop of the storage of another array, read in place (slices share the storage
+    of the array they are taken from, until either of them is mutated)
+    '''
+    __slots__ = ("base", "start", "stop")
+
+    def __init__(self, base, start: int, stop: int):
+        self.base = base
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if (isinstance(index, slice)):
+            start, stop, _ = index.indices(self.stop - self.start)
+            return ArrayView(self.base, self.start + start, self.start + max(start, stop))
+        if (index < 0):
+            index += self.stop - self.start
+        return self.base[self.start + index]
+
+    def __iter__(self):
+        # Iterating a copy of the elements (in C) is faster than indexing the base one by one
+        return iter(self.copy())
+
+    def copy(self):
+        return self.base[self.start:self.stop]
+
+    def __repr__(self):
+        return repr(list(self))
+
+def arrayStorage(dtype: List[type|instanceType], values) -> Union[list, array, BoolArray]:
+    '''
+    Storage of the elements of an array of the given type: compact (machine integers, doubles
+    or bytes) for the arrays of int, double float and boolean, a list for the others (and when
+    a value does not fit)
+    '''
+    if (len(dtype) == 2):
+        try:
+            if (dtype[1] == Int):
+                return array('q', values)
+            if (dtype[1] == Bool):
+                return BoolArray(values)
+            if (dtype[1] == Float and FloatType == float):
+                return array('d', values)
+        except OverflowError:
+            pass
+    return list(values)
+
+def boxed(arr: zArray) -> list:
+    '''
+    Moves the elements of the array to a list (once a value does not fit its compact storage)
+    '''
+    if (not isinstance(arr.elements, list)):
+        arr.elements = list(arr.elements)
+    return arr.elements
+
+def materialized(elements):
+    '''
+    Storage of the elements, copied out of the array they are a view of
+    '''
+    return elements.copy() if elements.__class__ is ArrayView else elements
+
+def own(arr: zArray):
+    '''
+    Copies the elements of an array sharing its storage with slices, before it is mutated
+    '''
+    elements = arr.elements
+    arr.elements = elements.copy() if elements.__class__ is ArrayView else elements[:]
+    arr.shared = False
+
+def sliceArray(arr: zArray, first: int, second: int, lineNumber: int) -> zArray:
+    '''
+    Slice first:second of the array, a view over its storage (so slicing does not copy)
+    '''
+    elements = arr.elements
+    if (elements.__class__ is ArrayView):
+        # Slices of slices view the original storage directly
+        first += elements.start
+        second += elements.start
+        elements = elements.base
+    arr.shared = True
+    return zArray(lineNumber, arr.dtype, ArrayView(elements, first, second), True)
+
+def concatenate(first: zArray, second: zArray, lineNumber: int) -> zArray:
+    '''
+    Concatenation of two arrays (in a list if only one of them was boxed)
+    '''
+    firstElements = materialized(first.elements)
+    secondElements = materialized(second.elements)
+    if (type(firstElements) == type(secondElements)):
+        return zArray(lineNumber, first.dtype, firstElements + secondElements)
+    return zArray(lineNumber, first.dtype, list(firstElements) + list(secondElements))
+
+# Bulk array builtins, each taking the evaluated arguments, the operator (of map) and the line number
+
+# Arrays shorter than this are not worth the overhead of NumPy
+NUMPY_MIN_LENGTH = 256
+INT64_MAX = 2 ** 63 - 1
+
+def numericView(elements):
+    '''
+    NumPy view (sharing the memory) of the elements of an int or double array, None without
+    NumPy, for short arrays and for the other storages
+    '''
+    start, stop = 0, len(elements)
+    if (elements.__class__ is ArrayView):
+        start, stop, elements = elements.start, elements.stop, elements.base
+    if (numpy is None or elements.__class__ is not array or stop - start < NUMPY_MIN_LENGTH):
+        return None
+    return numpy.frombuffer(elements, numpy.int64 if elements.typecode == 'q' else numpy.float64)[start:stop]
+
+def magnitude(view) -> int:
+    '''
+    Largest absolute value of the elements of an int view (to check the results fit in 64 bits)
+    '''
+    return max(-int(view.min()), int(view.max()))
+
+def arraySum(args: list, operator: str, lineNumber: int):
+    arr = args[0]
+    view = numericView(arr.elements)
+    # Double sums stay sequential, as NumPy adds in a different order (rounding differently)
+    if (view is not None and view.dtype == numpy.int64 and magnitude(view) * len(view) <= INT64_MAX):
+        return int(view.sum())
+    return sum(arr.elements, floatValue(0) if arr.dtype[1] == Float else 0)
+
+def arrayMin(args: list, operator: str, lineNumber: int):
+    arr = args[0]
+    if (len(arr.elements) == 0):
+        RuntimeError("Cannot take the min of an empty array", lineNumber, "indexError")
+    view = numericView(arr.elements)
+    if (view is not None):
+        return view.min().item()
+    return min(arr.elements)
+
+def arrayMax(args: list, operator: str, lineNumber: int):
+    arr = args[0]
+    if (len(arr.elements) == 0):
+        RuntimeError("Cannot take the max of an empty array", lineNumber, "indexError")
+    view = numericView(arr.elements)
+    if (view is not None):
+        return view.max().item()
+    return max(arr.elements)
+
+def arrayDot(args: list, operator: str, lineNumber: int):
+    first, second = args
+    if (len(first.elements) != len(second.elements)):
+        RuntimeError("Cannot take the dot product of arrays of different lengths", lineNumber, "indexError")
+    firstView = numericView(first.elements)
+    secondView = numericView(second.elements)
+    if (firstView is not None and secondView is not None and firstView.dtype == secondView.dtype == numpy.int64
+            and magnitude(firstView) * magnitude(secondView) * len(firstView) <= INT64_MAX):
+        return int(numpy.dot(firstView, secondView))
+    isFloat = first.dtype[1] == Float or second.dtype[1] == Float
+    return sum(map(mul, first.elements, second.elements), floatValue(0) if isFloat else 0)
+
+# Operation of map on each element, and on a whole NumPy view
+MAP_OPERATIONS = {
+    "+": lambda element, scalar: element + scalar,
+    "-": lambda element, scalar: element - scalar,
+    "*": lambda element, scalar: element * scalar,
+    "/": lambda element, scalar: FloatType(element / scalar),
+}
+NUMPY_MAP_OPERATIONS = {
+    "+": lambda view, scalar: view + scalar,
+    "-": lambda view, scalar: view - scalar,
+    "*": lambda view, scalar: view * scalar,
+    "/": lambda view, scalar: view / scalar,
+}
+
+def arrayMap(args: list, operator: str, lineNumber: int) -> zArray:
+    '''
+    New array of the operator applied to each element and the scalar
+    '''
+    scalar, arr = args
+    if (operator == "/" and isZero(scalar)):
+        RuntimeError("Cannot divide with zero.", lineNumber)
+    isFloat = operator == "/" or arr.dtype[1] == Float or not isinstance(scalar, int)
+    dtype = [zArray, Float if isFloat else Int]
+
+    view = numericView(arr.elements)
+    if (view is not None):
+        # Doubles give the same results elementwise, ints only while they fit in 64 bits
+        if (view.dtype == numpy.float64 and isinstance(scalar, float)):
+            return zArray(lineNumber, dtype, array('d', NUMPY_MAP_OPERATIONS[operator](view, scalar).tobytes()))
+        if (view.dtype == numpy.int64 and type(scalar) is int and operator != "/"):
+            bound = magnitude(view)
+            if ((bound * abs(scalar) if operator == "*" else bound + abs(scalar)) <= INT64_MAX):
+                return zArray(lineNumber, dtype, array('q', NUMPY_MAP_OPERATIONS[operator](view, scalar).tobytes()))
+
+    operation = MAP_OPERATIONS[operator]
+    return zArray(lineNumber, dtype, arrayStorage(dtype, [operation(element, scalar) for element in arr.elements]))
+
+def arrayFill(args: list, operator: str, lineNumber: int):
+    value, arr = args
+    arr.elements = arrayStorage(arr.dtype, [value]) * len(arr.elements)
+    arr.shared = False
+    return None
+
+def arrayReverse(args: list, operator: str, lineNumber: int):
+    arr = args[0]
+    if (arr.shared):
+        own(arr)
+    arr.elements.reverse()
+    return None
+
+# Bulk array builtins by name
+ARRAY_BUILTINS = {
+    "sum": arraySum,
+    "min": arrayMin,
+    "max": arrayMax,
+    "dot": arrayDot,
+    "map": arrayMap,
+    "fill": arrayFill,
+    "reverse": arrayReverse,
+}
+
+# Number of arguments of each bulk array builtin, and the operators map can apply
+ARRAY_BUILTIN_ARITY = {"sum": 1, "min": 1, "max": 1, "dot": 2, "map": 2, "fill": 2, "reverse": 1}
+MAP_OPERATORS = ["+", "-", "*", "/"]
+
 @dataclass
 class FnObject:
     function_type: str
@@ -130,23 +600,100 @@ class FnObject:
     body: 'AST'
     return_type: type
 
+@dataclass
+class Layout:
+    '''
+    Layout of the instances of a class, shared by all of them: the fields are stored in a list
+    of values (the slots of the instance) in the order of their declarations. New instances copy
+    the template, holding the values of the constant initializers, and only run the others
+    '''
+    fields: List["Declare"]     # Declarations of the fields, by slot
+    slots: Dict[str, int]       # Slot of each field
+    template: List = None       # Values of the slots, evaluated once for the constant initializers
+    initializers: List = None   # (slot, initializer compiled by the engine) of the other fields
+    scopes: "Scopes" = None     # Scopes the initializers run in (shared by all the instantiations)
+
 @dataclass
 class ClassObject:
     name: str
     methods: Dict[str, "Declare"]
     thisID: int
+    functions: Dict[str, FnObject] = None  # Method table, the FnObject of each method (built once per class declaration)
+    layout: Layout = None                   # Layout of the instances (see classLayout)
 
     def __repr__(self):
         return f"Class<{self.name}>"
+
+def instanceLayout(stmts: Dict[str, "AST"], compileInitializer = None) -> Layout:
+    '''
+    Layout of the instances of a class with the given statements (with the non constant field
+    initializers compiled by compileInitializer)
+    '''
+    fields = [stmt for stmt in stmts.values() if isinstance(stmt, Declare)]
+    layout = Layout(fields, {stmt.var.name: slot for slot, stmt in enumerate(fields)}, [None] * len(fields), [], Scopes())
+    for slot, stmt in enumerate(fields):
+        if (isinstance(stmt.value, CONSTANTS)):
+            layout.template[slot] = evaluate(stmt.value)
+        else:
+            layout.initializers.append((slot, compileInitializer(stmt) if compileInitializer != None else stmt.value))
+    return layout
+
+def classLayout(cls: ClassObject) -> Layout:
+    '''
+    Layout of the instances of the class, computed once
+    '''
+    if (cls.layout == None):
+        cls.layout = instanceLayout(cls.methods)
+    return cls.layout
     
 @dataclass
 class InstanceObject:
     zClass: ClassObject
-    fields: Dict[str, List[Union["AST", type, bool]]]
+    slots: List["AST"]  # Values of the fields, laid out by the Layout of the class
+    boundMethods: Dict[str, "BoundMethod"] = field(default_factory=dict, compare=False)  # Cache of boundMethod
     
     def __repr__(self):
         return f"Instance<{self.zClass.name}>"
 
+@dataclass(repr=False)
+class BoundMethod:
+    '''
+    Method of an instance: calling it binds this (and the method itself) in the scope of the call
+    '''
+    obj: InstanceObject
+    this: 'Variable'    # The this variable of the class
+    thisType: 'instanceType'
+    var: 'Variable'     # The variable of the method
+    fn: FnObject
+
+    def __repr__(self):
+        return f"Method<{self.obj.zClass.name}.{self.var.name}>"
+
+def boundMethod(obj: InstanceObject, name: str) -> BoundMethod:
+    '''
+    Method of the instance with the given name (from the method table of its class), created once per instance
+    '''
+    bound = obj.boundMethods.get(name)
+    if (bound == None):
+        cls = obj.zClass
+        bound = BoundMethod(obj, Variable(0, "this", cls.thisID), instanceType(cls), cls.methods[name].var, cls.functions[name])
+        obj.boundMethods[name] = bound
+    return bound
+
+def methodTable(stmts: Dict[str, "AST"], compileBody = None) -> Dict[str, FnObject]:
+    '''
+    FnObjects of the methods among the statements of a class (with their bodies compiled by compileBody)
+    '''
+    return {name: FnObject(stmt.functionType, stmt.params_type, stmt.params, compileBody(stmt.body) if compileBody != None else stmt.body, stmt.return_type)
+            for name, stmt in stmts.items() if isinstance(stmt, DeclareFun)}
+
+def bindMethod(bound: BoundMethod, scopes: 'Scopes'):
+    '''
+    Declares this and the method of the bound method in the current scope (the scope of the call)
+    '''
+    scopes.bind(bound.this, [bound.obj, bound.thisType, False])
+    scopes.bind(bound.var, [bound.fn, FnObject, False])
+
 @dataclass
 class arrayType:
     '''
@@ -164,25 +711,53 @@ class arrayType:
 class Scopes:
     '''
     Scopes storing the stack of environments
+
+    Bindings live in an array indexed by the slot the resolver assigned to the variable,
+    so reads and writes take constant time. Every scope only records the slots it declared
+    (and the bindings they shadowed) so that endScope can restore them.
     '''
-    stack: List[Dict[Variable, "AST"]]
-    def __init__(self, stack: List[Dict[Variable, "AST"]] = None):
+    stack: List[List[tuple]]
+    slots: List[Optional[list]]
+    def __init__(self, stack: List[List[tuple]] = None):
         if (stack == None):
-            self.stack = [dict()]
+            self.stack = [[]]
         else:
             self.stack = stack
+        self.slots = []
     
     def beginScope(self):
-        self.stack.append({})
+        self.stack.append([])
     
     def endScope(self):
         assert(len(self.stack) != 0)
-        self.stack.pop()
+        slots = self.slots
+        # Restoring the bindings shadowed by the declarations of this scope (latest first)
+        for var, _, previous in reversed(self.stack.pop()):
+            slots[var.id] = previous
+    
+    def bind(self, var: Variable, binding: list):
+        '''
+        Binds the [value, dtype, isConst] list to the slot of the variable in the current scope
+        '''
+        slots = self.slots
+        if (var.id >= len(slots)):
+            slots.extend([None] * (var.id + 1 - len(slots)))
+        self.stack[-1].append((var, binding, slots[var.id]))
+        slots[var.id] = binding
+
+    def lookup(self, var: Variable):
+        '''
+        Utility to get the [value, dtype, isConst] binding of the variable in the closest scope
+        '''
+        try:
+            return self.slots[var.id]
+        except IndexError:
+            return None
         
     def declareFun(self, f: Variable, fn_object):
         #declares the function in the current scope with the give name v
         assert(len(self.stack) != 0)
-        self.stack[-1][f] = [fn_object, FnObject, False]
+        self.bind(f, [fn_object, FnObject, False])
     
     def declareVariable(self, var: Variable, value: 'AST', dtype:type, isConst: bool):
         '''
@@ -191,105 +766,99 @@ class Scopes:
         assert(len(self.stack) != 0)
         # Avoiding redeclaration in the same scope
         if ((not isinstance(dtype, type)) and isinstance(dtype, instanceType)):
-            if (value != nil() and (isinstance(value, InstanceObject) and dtype.name.name != value.zClass.name)):
+            if (value is not None and (isinstance(value, InstanceObject) and dtype.name.name != value.zClass.name)):
                 typeCheckError(f"Cannot initialize a {dtype.name} instance with instance of type {value.zClass.name}.", var.lineNumber)
         
         elif ((not isinstance(dtype, type)) and isinstance(dtype, arrayType)):
-            if (value != nil() and (isinstance(value, zArray) and dtype.dtype != value.dtype)):
+            if (value is not None and (isinstance(value, zArray) and dtype.dtype != value.dtype)):
                 typeCheckError(f"Cannot initialize a {dtype.dtype} array with array of type {value.dtype}.", var.lineNumber)
 
         # Implicit type conversion from float to int and int to float
-        elif (issubclass(dtype, Int)):
-            if (isinstance(value, Float)):
-                value = Int(int(value.value))
-        elif (issubclass(dtype, Float)):
-            if (isinstance(value, Int)):
-                value = Float(float(value.value) if value.value != None else 0.0)
-        elif (dtype != Bool and value != nil() and not isinstance(value, dtype)):
-            typeCheckError(f"Cannot initialize a {dtype.__name__} with Literal of type {type(value).__name__}.", var.lineNumber)
+        elif (dtype is Int):
+            if (isinstance(value, (Fraction, float))):
+                value = int(value)
+        elif (dtype is Float):
+            if (type(value) is int):
+                value = FloatType(float(value))
+        elif (dtype != Bool and value is not None and not isinstance(value, nativeType(dtype))):
+            typeCheckError(f"Cannot initialize a {dtype.__name__} with Literal of type {literalType(value).__name__}.", var.lineNumber)
         elif (dtype == Bool):
-            value = Bool.truthy(value)
-        self.stack[-1][var] = [value, dtype, isConst]
+            value = bool(value)
+        self.bind(var, [value, dtype, isConst])
     
     def updateVariable(self, var: Variable, value: 'AST'):
         '''
         Utility to update the variable in the closest scope
         '''
-        id = var.id
-        name = var.name
+        binding = self.lookup(var)
+        if (binding == None):
+            return
         lineNumber = var.lineNumber
-        for i in range(len(self.stack)-1, -1, -1):
-            for var in self.stack[i]:
-                if var.id == id:
-                    if (not isinstance(self.stack[i][var][1], type) and isinstance(self.stack[i][var][1], instanceType)):
-                        if (value != nil() and ((not isinstance(value, InstanceObject)) or (isinstance(value, InstanceObject) and self.stack[i][var][1].name.name != value.zClass.name))):
-                            typeCheckError(f"Cannot assign a {self.stack[i][var][1].name} instance with instance of type {value}.", lineNumber)
-                        self.stack[i][var][0] = value
-                        return
-                    elif (not isinstance(self.stack[i][var][1], type) and isinstance(self.stack[i][var][1], arrayType)):
-                        if (value != nil() and ((not isinstance(value, zArray)))):
-                            typeCheckError(f"Cannot assign a {self.stack[i][var][1].dtype} array with instance of type {value}.", lineNumber)
-                        elif (value != nil() and (isinstance(value, zArray) and self.stack[i][var][1].dtype != value.dtype)):
-                            typeCheckError(f"Cannot assign a {self.stack[i][var][1].dtype} array with array of type {value.dtype}.", lineNumber)
-                        self.stack[i][var][0] = value
-                        return
-                    # Truthify if lvalue is of type Bool
-                    if (issubclass(self.stack[i][var][1], Bool)):
-                        value = Bool.truthy(value)
-
-                    if (self.getVariableIsConst(var) == True):
-                        typeCheckError(f"Cannot Update const Variable {var.name}", lineNumber, "integrityError")
-                    dtype = self.getVariableType(var)
-
-                    # Implicit type conversion from float to int and int to float
-                    if (issubclass(dtype, Int)):
-                        if (isinstance(value, Float)):
-                            value = Int(int(value.value))
-                    
-                    elif (issubclass(dtype, Float)):
-                        if (isinstance(value, Int)):
-                            value = Float(float(value.value) if value.value != None else 0.0)
+        dtype = binding[1]
+        if (not isinstance(dtype, type) and isinstance(dtype, instanceType)):
+            if (value is not None and ((not isinstance(value, InstanceObject)) or (isinstance(value, InstanceObject) and dtype.name.name != value.zClass.name))):
+                typeCheckError(f"Cannot assign a {dtype.name} instance with instance of type {value}.", lineNumber)
+            binding[0] = value
+            return
+        elif (not isinstance(dtype, type) and isinstance(dtype, arrayType)):
+            if (value is not None and ((not isinstance(value, zArray)))):
+                typeCheckError(f"Cannot assign a {dtype.dtype} array with instance of type {value}.", lineNumber)
+            elif (value is not None and (isinstance(value, zArray) and dtype.dtype != value.dtype)):
+                typeCheckError(f"Cannot assign a {dtype.dtype} array with array of type {value.dtype}.", lineNumber)
+            binding[0] = value
+            return
+        # Truthify if lvalue is of type Bool
+        if (dtype is Bool):
+            value = bool(value)
+
+        if (binding[2] == True):
+            typeCheckError(f"Cannot Update const Variable {var.name}", lineNumber, "integrityError")
 
-                    elif (value != nil() and not isinstance(value, dtype)):
-                        typeCheckError(f"Cannot assign {type(value).__name__} to a variable of type {dtype.__name__}", lineNumber)
-                    
-                    self.stack[i][var][0] = value
-                    return value
+        # Implicit type conversion from float to int and int to float
+        if (dtype is Int):
+            if (isinstance(value, (Fraction, float))):
+                value = int(value)
+        
+        elif (dtype is Float):
+            if (type(value) is int):
+                value = FloatType(float(value))
 
+        elif (value is not None and not isinstance(value, nativeType(dtype))):
+            typeCheckError(f"Cannot assign {literalType(value).__name__} to a variable of type {dtype.__name__}", lineNumber)
+        
+        binding[0] = value
+        return value
 
     def getVariable(self, var: Variable):
         '''
         Utility to get the value of the variable in the closest scope
         '''
-        for i in range(len(self.stack)-1, -1, -1):
-            for v in self.stack[i]:
-                if v.id == var.id:
-                    return self.stack[i][v][0]
+        binding = self.lookup(var)
+        if (binding != None):
+            return binding[0]
     
     def getVariableType(self, var: Variable):
         '''
           Utility to get the type of the variable in the closest scope
         '''
-        for i in range(len(self.stack)-1, -1, -1):
-            for v in self.stack[i]:
-                if v.id == var.id:
-                    return self.stack[i][v][1]
+        binding = self.lookup(var)
+        if (binding != None):
+            return binding[1]
     
     def getVariableIsConst(self, var: Variable):
         '''
         Utility to get the constness of the variable in the closest scope
         '''
-        for i in range(len(self.stack)-1, -1, -1):
-            for v in self.stack[i]:
-                if v.id == var.id:
-                    return self.stack[i][v][2]
+        binding = self.lookup(var)
+        if (binding != None):
+            return binding[2]
     
     def __repr__(self):
         s = ""
         for i in range(len(self.stack)-1, -1, -1):
             s += (f"Scope {i}:\n")
-            for v in self.stack[i]:
-                s += (f"{v.name} : {self.stack[i][v][0]}\n")
+            for v, binding, _ in self.stack[i]:
+                s += (f"{v.name} : {binding[0]}\n")
             s += '\n'
         return s 
 
@@ -306,6 +875,7 @@ class Get(metadata):
     '''
     var: Variable
     field: str
+    slot: int = None    # Slot of the field in the instances (set by the typechecker, None for methods)
 
 @dataclass
 class Set(metadata):
@@ -315,6 +885,7 @@ class Set(metadata):
     var: Variable
     field: str
     value: 'AST'
+    slot: int = None    # Slot of the field in the instances (set by the typechecker)
 
 @dataclass
 class AtIndex(metadata):
@@ -370,6 +941,15 @@ class array_insert(metadata):
     element : 'AST'
     array_name : Identifier
 
+@dataclass
+class array_builtin(metadata):
+    '''
+    Call of a bulk array builtin (see ARRAY_BUILTINS), with the operator map applies
+    '''
+    name : str
+    args : List['AST']
+    operator : str = None
+
 # Basic Operations
 @dataclass
 class Declare(metadata):
@@ -439,6 +1019,7 @@ class PRINT(metadata):
     print_stmt: List['AST']
     sep: Optional[str]=Str(' ')
     end: Optional[str]=Str('\n')
+    flush: 'AST'=Bool(False)
 
 @dataclass
 class Seq:
@@ -464,17 +1045,56 @@ class DeclareFun(metadata):
 class FunCall(metadata):
     fn: 'AST'
     args: List['AST']
+    tail: bool = False  # Call in tail position (return f(...);) reusing the activation of the caller (set by the resolver)
 
 @dataclass
 class Return(metadata):
     value: 'AST'
+
+@dataclass
+class TailCall(Return):
+    '''
+    Return of a call in tail position: the evaluated function (value) is called with the evaluated
+    arguments by the caller of the returning function, in place of it
+    '''
+    argv: List['AST']
+
+# Calls in progress, innermost last, as (expression of the function called, line of the call), kept
+# by the calls of all the engines for the sampling profiler (see profiler.Sampler). A call in tail
+# position replaces the function of the call it returns from
+CALLS = []
     
 # Defining the AST
-AST = Variable|BinOp|Bool|Int|Float|Declare|If|UnOp|Str|Slice|nil|PRINT|Seq|For|DeclareFun|FunCall|zArray|array_append|array_insert|array_len|array_remove|array_pop|Return|FnObject|ClassObject|InstanceObject|DeclareClass|Get|Set|This|Block
+AST = Variable|BinOp|Bool|Int|Float|Declare|If|UnOp|Str|Slice|nil|PRINT|Seq|For|DeclareFun|FunCall|zArray|array_append|array_insert|array_builtin|array_len|array_remove|array_pop|Return|FnObject|ClassObject|InstanceObject|DeclareClass|Get|Set|This|Block
 
 # Defining a Number as both an integer as  well as Float
 Number = Float|Int
 
+def isZero(operand) -> bool:
+    '''
+    Utility to check if a numeric runtime value is zero (booleans are not numbers)
+    '''
+    return type(operand) is not bool and operand == 0
+
+def storeString(var: 'AST', value: str, scopes: Scopes):
+    '''
+    Utility to store the string obtained by setting a character back where the string came from
+    '''
+    match var:
+        case Variable():
+            # Binding directly, as characters of const strings could always be set
+            scopes.lookup(var)[0] = value
+        case This(lineNumber, id):
+            scopes.lookup(Variable(lineNumber, "this", id))[0] = value
+        case AtIndex(lineNumber, array, index):
+            arr = evaluate(array, scopes)
+            if (arr.shared):
+                own(arr)
+            arr.elements[evaluate(index, scopes)] = value
+        case Get(lineNumber, obj, name, slot):
+            obj = evaluate(obj, scopes)
+            obj.slots[slot if slot != None else classLayout(obj.zClass).slots[name]] = value
+
 
 def evaluate(program: AST, scopes: Scopes = None):
     '''
@@ -489,19 +1109,19 @@ def evaluate(program: AST, scopes: Scopes = None):
             return scopes.getVariable(v)
         
         case Int(value):
-            return program
+            return value
         
         case Float(value):
-            return program
+            return value
         
         case Bool(value):
-            return program
+            return value
 
         case Str(value):
-            return program
+            return value
 
         case nil():
-            return program
+            return None
         
         case InstanceObject() as obj:
             return obj
@@ -512,6 +1132,9 @@ def evaluate(program: AST, scopes: Scopes = None):
         case zArray(dtype, value) as arr:
             for i in range(len(arr.elements)):
                 arr.elements[i] = evaluate(arr.elements[i], scopes)
+            # Moving the evaluated elements into the storage of the array
+            if (isinstance(arr.elements, list)):
+                arr.elements = arrayStorage(arr.dtype, arr.elements)
             return arr
 
         case Block(blockStatements):
@@ -534,120 +1157,88 @@ def evaluate(program: AST, scopes: Scopes = None):
             
             match operator:
                 case "+":
-                    #code for string concatenation starts
-                    if (isinstance(firstOperand, Str) and isinstance(secondOperand, Str)):
-                        return Str(firstOperand.value + secondOperand.value)
-                    
+                    # Array concatenation (strings and numbers are added natively)
                     if (isinstance(firstOperand, zArray) and isinstance(secondOperand, zArray)):
-                        return zArray(lineNumber, firstOperand.dtype, firstOperand.elements + secondOperand.elements)
-                    
-                    #code for string concatenation ends
+                        return concatenate(firstOperand, secondOperand, lineNumber)
+                    if (firstOperand.__class__ is str):
+                        return concatenateStrings(firstOperand, secondOperand)
                     
-                    firstOperand, secondOperand = BinOp.implicitIntToFloat(firstOperand, secondOperand)
-                    
-                    if (isinstance(firstOperand, Float)):
-                        return Float(firstOperand.value + secondOperand.value)
-                    else:
-                        return Int(firstOperand.value + secondOperand.value)
+                    return firstOperand + secondOperand
 
                 case "-":
-                    firstOperand, secondOperand = BinOp.implicitIntToFloat(firstOperand, secondOperand)
-                    
-                    if (isinstance(firstOperand, Float)):
-                        return Float(firstOperand.value - secondOperand.value)
-                    else:
-                        return Int(firstOperand.value - secondOperand.value)
+                    return firstOperand - secondOperand
                 
                 case "/":
-                    if (secondOperand == Int(0) or secondOperand == Float(0)):
+                    if (isZero(secondOperand)):
                         RuntimeError("Cannot divide with zero.", lineNumber)
-                    return Float(firstOperand.value / secondOperand.value)
+                    return FloatType(firstOperand / secondOperand)
                 
                 case "*":
-                    # for strings starts
-                    second_type = isinstance(secondOperand,int) or isinstance(secondOperand,Int)
-                    first_type = isinstance(firstOperand,int) or isinstance(firstOperand,Int)
-                    
-                    if (isinstance(firstOperand,Str) and second_type):
-                        return Str(firstOperand.value * secondOperand.value)
-
-                    if (first_type and isinstance(secondOperand,Str)):
-                        return Str(firstOperand.value * secondOperand.value)
-                    #for string ends
-                    
-                    firstOperand, secondOperand = BinOp.implicitIntToFloat(firstOperand, secondOperand)
-                    
-                    if (isinstance(firstOperand, Float)):
-                        return Float(firstOperand.value * secondOperand.value)
-                    else:
-                        return Int(firstOperand.value * secondOperand.value)
+                    return firstOperand * secondOperand
                 
                 case "//" :
-                    if (secondOperand == Int(0) or secondOperand == Float(0)):
+                    if (isZero(secondOperand)):
                         RuntimeError("Cannot divide with zero.", lineNumber)
-                    return Int(int(firstOperand.value / secondOperand.value))
+                    return int(firstOperand / secondOperand)
                 
                 case "%":
-                    return Int(firstOperand.value % secondOperand.value)
+                    return firstOperand % secondOperand
                 
                 case "<<":
-                    if (secondOperand.value < 0):
+                    if (secondOperand < 0):
                         RuntimeError(f"Negative left operand not allowed for {operator}.", lineNumber)
-                    return Int(firstOperand.value << secondOperand.value)
+                    return firstOperand << secondOperand
                 
                 case ">>":
-                    if (secondOperand.value < 0):
+                    if (secondOperand < 0):
                         RuntimeError(f"Negative left operand not allowed for {operator}.", lineNumber)
-                    return Int(firstOperand.value >> secondOperand.value)
+                    return firstOperand >> secondOperand
                 
                 case "&":
-                    return Int(firstOperand.value & secondOperand.value)
+                    return firstOperand & secondOperand
                 
                 case "|":
-                    return Int(firstOperand.value | secondOperand.value)
+                    return firstOperand | secondOperand
                 
                 case "<=":
-                    return Bool(firstOperand.value <= secondOperand.value)
+                    return firstOperand <= secondOperand
                 
                 case "<":
-                    return Bool(firstOperand.value < secondOperand.value)
+                    return firstOperand < secondOperand
                 
                 case "==":
-                    return Bool(firstOperand.value == secondOperand.value) 
+                    return firstOperand == secondOperand
                 
                 case ">":
-                    return Bool(firstOperand.value > secondOperand.value)
+                    return firstOperand > secondOperand
                 
                 case ">=":
-                    return Bool(firstOperand.value >= secondOperand.value)
+                    return firstOperand >= secondOperand
                 
                 case "!=":
-                    return Bool(firstOperand.value != secondOperand.value)
+                    return firstOperand != secondOperand
                 
                 case "&&":
-                    return Bool(Bool.truthy(firstOperand).value and Bool.truthy(secondOperand).value)
+                    return bool(firstOperand) and bool(secondOperand)
                 
                 case "||":
-                    return Bool(Bool.truthy(firstOperand).value or Bool.truthy(secondOperand).value)
+                    return bool(firstOperand) or bool(secondOperand)
                 case "=":
                     return scopes.updateVariable(firstOperand, secondOperand)
                 case "^":
-                    if isinstance(firstOperand, Int) and isinstance(secondOperand, Int):
-                        return Int(firstOperand.value ** secondOperand.value)
-                    return Float(firstOperand.value ** secondOperand.value)
+                    if isinstance(firstOperand, int) and isinstance(secondOperand, int):
+                        return firstOperand ** secondOperand
+                    return FloatType(firstOperand ** secondOperand)
 
         case UnOp(lineNumber, operator, operand):
             operand = evaluate(operand, scopes)
             match operator:
                 case "-":
-                    # Returning Literal similar to the operand literal
-                    if (isinstance(operand, Float)):
-                        return Float(operand.value * -1)
-                    elif (isinstance(operand, Int)):
-                        return Int(operand.value * -1)
+                    # Returning value of the same type as the operand
+                    if (isinstance(operand, (int, Fraction, float))):
+                        return -operand
                 case "~":
-                    evaluated_operand = Bool.truthy(operand.value)
-                    return Bool(not evaluated_operand.value)
+                    return not operand
         
         case Declare(lineNumber, var, value, dtype, isConst):
             # Evaluating the expression before declaration
@@ -655,75 +1246,61 @@ def evaluate(program: AST, scopes: Scopes = None):
             
             # Truthify if Bool dtype
             if (dtype == Bool):
-                value = Bool.truthy(value)
+                value = bool(value)
             # Declaring
             scopes.declareVariable(var, value, dtype, isConst)
 
             return value
 
         case If (lineNumber, condition, ifBlock, elseBlock):
-            evaluated_condition = Bool.truthy(evaluate(condition, scopes))
-            if (evaluated_condition.value):
+            if (evaluate(condition, scopes)):
                 return evaluate(ifBlock, scopes)
             else:
                 if (elseBlock != None): 
                     return evaluate(elseBlock, scopes)
                 else:
-                    return nil()
+                    return None
 
         case Slice(lineNumber, value_, first, second):
             elem = evaluate(value_, scopes)
+            first = evaluate(first, scopes)
+            second = evaluate(second, scopes)
             if(not(isinstance(elem, zArray))):
-                if (first.value>second.value or first.value < 0 or second.value > len(elem.value)):
+                if (first>second or first < 0 or second > len(elem)):
                     RuntimeError("Index out of bounds", lineNumber, "indexError")
                 
-                return Str(elem.value[first.value:second.value])
+                return elem[first:second]
             else:
-                if (first.value < 0 or first.value >= len(elem.elements)):
+                if (first < 0 or first >= len(elem.elements)):
                     RuntimeError("Index out of bounds", lineNumber, "indexError")
-                if(second==nil()):
-                    return elem.elements[first.value:first.value+1][0]
-                if (first.value>second.value or first.value < 0 or second.value > len(elem.elements)):
+                if(second is None):
+                    return elem.elements[first]
+                if (first>second or first < 0 or second > len(elem.elements)):
                     RuntimeError("Index out of bounds", lineNumber, "indexError")
-                return zArray(lineNumber, elem.dtype, elem.elements[first.value:second.value])
+                return sliceArray(elem, first, second, lineNumber)
         
-        case PRINT(lineNumber, print_stmt, sep,end):
+        case PRINT(lineNumber, print_stmt, sep, end, flush):
+            last = len(print_stmt) - 1
             for i,stmt in  enumerate(print_stmt):
                 out=evaluate(stmt,scopes)
-                if(isinstance(out,zArray)):
-                    l=traverse_array(out)
-                    if (i==len(print_stmt)-1):
-                        print(l, end=end.value)
-                    else:
-                        print(l, end=sep.value)
-                elif (isinstance(out,nil)):
+                if (out is None):
                     continue
-                else:
-                    if (i==len(print_stmt)-1):
-                        print(out, end=end.value)
-                    else:
-                        print(out, end=sep.value)
-            
-            return nil()
+                printValue(out, end.value if i == last else sep.value)
+            if (evaluate(flush, scopes)):
+                OUTPUT.flush()
+            return None
 
         case Seq(lines):
-            ans = nil()
+            ans = None
             for line in lines:
-                pp = pprint.PrettyPrinter(indent=4)
-                # pp.pprint(line)
                 ans = evaluate(line, scopes)
-                match ans:
-                    case Return(l,r):
-                        # print("checkpoint:0")
-                        break
-                    case _:
-                        continue
+                if isinstance(ans, Return):
+                    break
             return ans
 
         case While(lineNumber, condition,block) :
-            pp = pprint.PrettyPrinter(indent=4)
             isreturn = None
-            while(isinstance(isreturn , Return ) == False  and  evaluate(condition,scopes).value):
+            while(isinstance(isreturn , Return ) == False  and  evaluate(condition,scopes)):
                 isreturn = evaluate(block,scopes)
             
             return isreturn
@@ -741,68 +1318,83 @@ def evaluate(program: AST, scopes: Scopes = None):
         case array_append(lineNumber, element, var):
             l = scopes.getVariable(var)
             element=evaluate(element, scopes)
-            l.elements.append(element)
-            return nil()
+            if (l.shared):
+                own(l)
+            try:
+                l.elements.append(element)
+            except OverflowError:
+                boxed(l).append(element)
+            return None
         
         case array_remove(lineNumber, index , var):
             l=scopes.getVariable(var)
             # Checking if the index is out of bounds
             index=evaluate(index, scopes)
-            if (len(l.elements) <= index.value):
+            if (len(l.elements) <= index):
                 RuntimeError(f"array index out of bounds", lineNumber, 'indexError')
-            return l.elements.pop(index.value)
+            if (l.shared):
+                own(l)
+            return l.elements.pop(index)
         
         case array_len(lineNumber, var):
             l = evaluate(var, scopes)
             if(isinstance(l,zArray)):
-                return Int(len(l.elements))
-            elif(isinstance(l,Str)):
-                return Int(len(l.value))
+                return len(l.elements)
+            elif(isinstance(l,STRING_TYPES)):
+                return len(l)
         
         case array_pop(lineNumber, array_name):
             l=scopes.getVariable(array_name)
             if (len(l.elements) == 0):
                 RuntimeError(f"Cannot popout from an empty array", lineNumber, 'indexError')
+            if (l.shared):
+                own(l)
             return l.elements.pop()
         
+        case array_builtin(lineNumber, name, args, operator):
+            return ARRAY_BUILTINS[name]([evaluate(arg, scopes) for arg in args], operator, lineNumber)
+
         case array_insert(lineNumber, index, element, var):
             l = scopes.getVariable(var)
             element=evaluate(element, scopes)
-            l.elements.insert(index.value, element)
-            return nil()
+            if (l.shared):
+                own(l)
+            try:
+                l.elements.insert(index.value, element)
+            except OverflowError:
+                boxed(l).insert(index.value, element)
+            return None
 
         case DeclareFun(lineNumber, f, return_type, params_type, params, body, function_type):
             scopes.declareFun(f, FnObject(function_type, params_type, params, body, return_type))
-            return nil()
+            return None
         
-        case Get(lineNumber, var, name) as g:
+        case Get(lineNumber, var, name, slot):
             obj = evaluate(var, scopes)
             if (isinstance(obj, InstanceObject)):
-                field = nil()
-                if name in obj.fields:
-                    field = obj.fields[name][0]
+                if (slot != None):
+                    return obj.slots[slot]
+                field = None
+                layout = classLayout(obj.zClass)
+                if name in layout.slots:
+                    field = obj.slots[layout.slots[name]]
                 elif name in obj.zClass.methods:
                     field = obj.zClass.methods[name]
                 else:
                     RuntimeError(f"Instance of class {obj.zClass.name} has no attribute {name}", lineNumber, "attributeError")
                 if (isinstance(field, DeclareFun)):
-                    # Begining scopes for the this variable
-                    scopes.beginScope()
-
-                    # Declaring the this variable
-                    scopes.declareVariable(Variable(lineNumber, "this", obj.zClass.thisID), obj, instanceType(obj.zClass), False)
-
-                    # Declaring the function
-                    evaluate(field, scopes)
-                    return scopes.getVariable(field.var)
+                    # this is bound when the method is called
+                    return boundMethod(obj, name)
                 return field
             
-        case Set(lineNumber, var, name, value):
+        case Set(lineNumber, var, name, value, slot):
             obj = evaluate(var, scopes)
             value = evaluate(value, scopes)
             if (isinstance(obj, InstanceObject)):
-                if name in obj.fields:
-                    obj.fields[name][0] = value
+                if (slot != None):
+                    obj.slots[slot] = value
+                elif name in classLayout(obj.zClass).slots:
+                    obj.slots[classLayout(obj.zClass).slots[name]] = value
                 else:
                     RuntimeError(f"Instance of class {obj.zClass.name} has no attribute {name}", lineNumber, "attributeError")         
 
@@ -810,29 +1402,38 @@ def evaluate(program: AST, scopes: Scopes = None):
             obj = evaluate(var, scopes)
             index = evaluate(index, scopes)
             if (isinstance(obj, zArray)):
-                if (index.value < 0 or index.value >= len(obj.elements)):
+                elements = obj.elements
+                if (index < 0 or index >= len(elements)):
                     RuntimeError("Index out of bounds", lineNumber, "indexError")
-                return obj.elements[index.value]
-            elif (isinstance(obj, Str)):
-                if (index.value < 0 or index.value >= len(obj.value)):
+                if (elements.__class__ is BoolArray):
+                    return byteAt(elements, index) != 0
+                return elements[index]
+            elif (isinstance(obj, STRING_TYPES)):
+                if (index < 0 or index >= len(obj)):
                     RuntimeError("Index out of bounds", lineNumber, "indexError")
-                return Str(obj.value[index.value])
+                return obj[index]
         
         case SetAtIndex(lineNumber, var, index, value):
             obj = evaluate(var, scopes)
             index = evaluate(index, scopes)
             value = evaluate(value, scopes)
             if (isinstance(obj, zArray)):
-                if (index.value < 0 or index.value >= len(obj.elements)):
+                if (index < 0 or index >= len(obj.elements)):
                     RuntimeError("Index out of bounds", lineNumber, "indexError")
-                obj.elements[index.value] = value
-            elif (isinstance(obj, Str)):
-                if (index.value < 0 or index.value >= len(obj.value)):
+                if (obj.shared):
+                    own(obj)
+                try:
+                    obj.elements[index] = value
+                except OverflowError:
+                    boxed(obj)[index] = value
+            elif (isinstance(obj, STRING_TYPES)):
+                if (index < 0 or index >= len(obj)):
                     RuntimeError("Index out of bounds", lineNumber, "indexError")
-                obj.value = obj.value[:index.value] + value.value + obj.value[index.value+1:]
+                # Strings are immutable values, storing the new string back in its place
+                storeString(var, replacedCharacter(obj, index, value), scopes)
 
         case DeclareClass(lineNumber, var, stmts, thisID):
-            classObj = ClassObject(var.name, stmts, thisID)
+            classObj = ClassObject(var.name, stmts, thisID, methodTable(stmts), instanceLayout(stmts))
             scopes.declareVariable(var, classObj, ClassObject, False)
             
         case FunCall(lineNumber, f, args): 
@@ -840,12 +1441,11 @@ def evaluate(program: AST, scopes: Scopes = None):
             
             # Checking if it is a class instantiation
             if (isinstance(fn, ClassObject)):
-                # Collecting all the instance fields
-                instanceFields = {}
-                for stmt in fn.methods:
-                    stmt = fn.methods[stmt]
-                    if isinstance(stmt, Declare):
-                        instanceFields[stmt.var.name] = [evaluate(stmt.value), stmt.dtype, stmt.isConst]
+                # Copying the template of the instance, evaluating the non constant fields into its slots
+                layout = classLayout(fn)
+                instanceFields = layout.template.copy()
+                for slot, value in layout.initializers:
+                    instanceFields[slot] = evaluate(value, layout.scopes)
                 
                 # Creating the instance object from the class object
                 obj = InstanceObject(fn, instanceFields)
@@ -858,34 +1458,58 @@ def evaluate(program: AST, scopes: Scopes = None):
                 return obj
             
             else:
+                bound = None
+                if (isinstance(fn, BoundMethod)):
+                    bound = fn
+                    fn = bound.fn
+
                 argv = []
 
                 for arg in args:
                     argv.append(evaluate(arg, scopes))
 
-                scopes.beginScope()
+                CALLS.append((f, lineNumber))
+                while True:
+                    scopes.beginScope()
 
-                for i in range(len(fn.params)):
-                    scopes.declareVariable(fn.params[i],argv[i],fn.params_types[i],False)
-            
-                returnVal = evaluate(fn.body, scopes)
-                
-                scopes.endScope()
+                    if (bound != None):
+                        bindMethod(bound, scopes)
 
-                if (fn.function_type == 'METHOD'):
+                    for i in range(len(fn.params)):
+                        scopes.declareVariable(fn.params[i],argv[i],fn.params_types[i],False)
+                
+                    returnVal = evaluate(fn.body, scopes)
+                    
                     scopes.endScope()
+
+                    if (not isinstance(returnVal, TailCall)):
+                        break
+                    # Making the call in tail position in place of the returning function
+                    fn = returnVal.value
+                    argv = returnVal.argv
+                    bound = None
+                CALLS.pop()
                 
-                match returnVal:
-                    case Return(lineNumber, value):
-                        return_val = evaluate(value, scopes)
-                        return return_val
-                    case _:
-                        return nil()
+                # Returning the (already evaluated) value of the return statement
+                if isinstance(returnVal, Return):
+                    return returnVal.value
+                return None
             
         
+        case Return(lineNumber, FunCall(_, f, args, True)):
+            # Leaving the call in tail position to the caller, so the recursion runs in constant space
+            fn = evaluate(f, scopes)
+            argv = [evaluate(arg, scopes) for arg in args]
+            CALLS[-1] = (f, CALLS[-1][1])
+            return TailCall(lineNumber, fn, argv)
+
         case Return(lineNumber, value):
             r =  evaluate(value, scopes)
             return Return(lineNumber,r)
+
+        # Elements of array literals are replaced by their values once evaluated
+        case int() | float() | str() | Fraction() | None:
+            return program
     
         # Handling unknown expressions
         case _ as v:
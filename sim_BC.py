@@ -1,152 +1,19 @@
+'''
+Bytecode compiler and stack VM
+
+codegen compiles the resolved and typechecked AST (the same one sim.evaluate runs) into
+ByteCode, which the VM executes with an operand stack and a stack of call frames. Variables
+live in sim.Scopes (indexed by the resolver slots), so the behaviour is identical to sim.evaluate.
+The call frames live on the heap rather than the Python stack, so the depth of the recursion is
+only limited by the memory budget of the VM (see setMemoryBudget).
+'''
 from dataclasses import dataclass
 from fractions import Fraction
 from typing import Union, Optional, List, Dict
-from lexer import Keyword, Operator, Identifier
 from error import RuntimeError, typeCheckError, resolveError
-
-# @dataclass
-# class metadata:
-#     '''
-#     Class to store the meta data of the AST
-#     '''
-#     lineNumber: int
-@dataclass(frozen=True)
-class Variable():
-    '''
-    Variable class containing the name of the variable
-    '''
-    lineNumber: int
-    name: str
-    id: int
-    localID: int
-    def __init__(self, name):
-        self.name = name
-        self.id = self.localID = None
-
-    def __repr__(self):
-        return f"{self.name}::{self.id}::{self.localID}"
-
-# Basic Data Types
-@dataclass
-class nil():
-    pass
-@dataclass
-class Int():
-   '''
-   Class representing the integers in the language
-   '''
-   value: int
-
-@dataclass
-class Float():
-    '''
-    Floating objects represented as Fractions in python
-    '''
-    value: Fraction
-    def __init__(self, value):
-        self.value = Fraction(value)
-
-@dataclass
-class Bool():
-    '''
-    Seperate boolean class representing two types of values True and False
-    '''
-    value: bool
-    @staticmethod
-    def truthy(checking):
-        if(checking == Int(0) or checking == Str("") or checking == Float(0) or checking == nil() or checking == Bool(False)):
-            return Bool(False)
-        else:
-            return Bool(True)
-
-@dataclass
-class Str() :
-    value: str
-
-
-@dataclass
-class BinOp():
-    '''
-    Variable evaluting to the value of the binary operation
-    '''
-    operator: str
-    firstOperand: 'AST'
-    secondOperand: 'AST'
-
-    def implicitIntToFloat(firstOperand, secondOperand):
-        '''
-        Function to take of the implicit conversion of the both operands to Float if either of them is a Float
-        '''
-        if (isinstance(firstOperand, Float) or isinstance(secondOperand, Float)):
-            if (isinstance(firstOperand, Int)):
-                firstOperand = Float(firstOperand.value)
-            elif (isinstance(secondOperand, Int)):
-                secondOperand = Float(secondOperand.value)
-        return firstOperand, secondOperand
-
-
-@dataclass
-class UnOp():
-    '''
-    Variable evaluating to the value of the unary operation 
-    '''
-    operator: str
-    operand: 'AST'
-
-@dataclass
-class PRINT():
-    print_stmt: List['AST']
-    sep: Optional[str]=Str(' ')
-    end: Optional[str]=Str('\n')
-    
-@dataclass
-class Seq:
-    lines: List['AST']
-
-
-@dataclass
-class For():
-    initial : 'AST'
-    condition : 'AST'
-    block: 'AST'
-
-
-@dataclass
-class If():
-    '''
-    If class evaluates to Bool
-    '''
-    condition: 'AST'
-    ifBlock: 'AST'
-    elseBlock: 'AST'
-
-@dataclass
-class While():
-    '''
-    while loop
-    '''
-    condition: 'AST'
-    block: 'AST'
-   
-
-# Defined binary operators in the Language
-BINARY_OPERATORS = [
-                    "+", "/", "-", "//", "*", "%", "^", "-",    # Binary operators for numbers
-                    "<<", ">>", "&", "|",                       # Bitwise binary operators for numbers
-                    "<=", "<", ">", ">=", "==", "~=",           # Binary operators for Number types(similar)
-                    "&&", "||"  , "="                           # Binary operators for Booleans
-]
-
-# Defined unary operators in the language
-UNARY_OPERATORS = [
-                    "-", # Unary operator for numbers
-                    "~"  # Unary operator for Boolean types
-]
-
-Number = Float|Int
-
-AST = Variable|BinOp|Bool|Int|Float|If|UnOp|Str|nil|PRINT|Seq|For|While
-
+from sim import *
+from sim_closure import add, exp, div, quot, lshift, rshift
+import operator
 
 @dataclass
 class Label:
@@ -161,6 +28,8 @@ class I:
     class UMINUS:
         pass
 
+    # Binary operators pop their first operand first, as the second operand is evaluated
+    # (and pushed) first like in sim.evaluate
     @dataclass
     class ADD:
         pass
@@ -175,11 +44,11 @@ class I:
 
     @dataclass
     class DIV:
-        pass
+        lineNumber: int
 
     @dataclass
     class QUOT:
-        pass
+        lineNumber: int
 
     @dataclass
     class REM:
@@ -191,16 +60,32 @@ class I:
 
     @dataclass
     class LSHIFT:
-        pass
+        lineNumber: int
 
     @dataclass
     class RSHIFT:
+        lineNumber: int
+
+    @dataclass
+    class BITAND:
+        pass
+
+    @dataclass
+    class BITOR:
         pass
-    
+
     @dataclass
-    class ASSIGN:
+    class AND:
+        pass
+
+    @dataclass
+    class OR:
         pass
 
+    @dataclass
+    class ASSIGN:
+        var: Variable
+
     @dataclass
     class EQ:
         pass
@@ -233,7 +118,6 @@ class I:
     class JMP_IF_FALSE:
         label: Label
 
-
     @dataclass
     class JMP_IF_TRUE:
         label: Label
@@ -252,21 +136,158 @@ class I:
 
     @dataclass
     class PRINT:
-        sep: Optional[str]=Str(' ')
-        end: Optional[str]=Str('\n')
+        end: str
+        flush: bool = False
+
+    @dataclass
+    class FLUSH:
+        pass
 
     @dataclass
     class LOAD:
-        localID: int
+        var: Variable
 
     @dataclass
-    class STORE:
-        localID: int
+    class DECLARE:
+        var: Variable
+        dtype: type
+        isConst: bool
+
+    @dataclass
+    class BEGIN_SCOPE:
+        pass
+
+    @dataclass
+    class END_SCOPE:
+        pass
+
+    @dataclass
+    class BUILD_ARRAY:
+        array: zArray
+        count: int
+        built: bool = False
+
+    @dataclass
+    class JMP_IF_BUILT:
+        build: "I.BUILD_ARRAY"
+        label: Label
+
+    @dataclass
+    class SLICE:
+        lineNumber: int
+
+    @dataclass
+    class APPEND:
+        pass
+
+    @dataclass
+    class REMOVE:
+        lineNumber: int
+
+    @dataclass
+    class LEN:
+        pass
+
+    @dataclass
+    class POP_ARRAY:
+        lineNumber: int
+
+    @dataclass
+    class INSERT:
+        index: Int
+
+    @dataclass
+    class ARRAY_BUILTIN:
+        function: object    # Bulk array builtin (of ARRAY_BUILTINS) taking the arguments
+        argc: int
+        operator: str
+        lineNumber: int
+
+    @dataclass
+    class DECLARE_FUN:
+        var: Variable
+        fn: FnObject
+
+    @dataclass
+    class DECLARE_CLASS:
+        var: Variable
+        stmts: Dict[str, AST]
+        thisID: int
+        functions: Dict[str, FnObject]
+        layout: Layout      # Layout of the instances, holding the compiled field initializers
+
+    @dataclass
+    class GET:
+        name: str
+        lineNumber: int
+        slot: int = None    # Slot of the field (see sim.Get)
+
+    @dataclass
+    class SET:
+        name: str
+        lineNumber: int
+        slot: int = None
+
+    @dataclass
+    class AT_INDEX:
+        lineNumber: int
+
+    @dataclass
+    class SET_INDEX:
+        target: AST
+        lineNumber: int
+
+    @dataclass
+    class PREPARE_CALL:
+        lineNumber: int
+        label: Label
+
+    @dataclass
+    class CALL:
+        argc: int
+        lineNumber: int = 0
+        call: tuple = None      # Function expression and line, kept in sim.CALLS while the call runs
+
+    @dataclass
+    class TAIL_CALL:
+        argc: int
+        lineNumber: int = 0
+        fn: 'AST' = None        # Function expression, replacing the function of the call in sim.CALLS
+
+    @dataclass
+    class RETURN:
+        pass
 
     @dataclass
     class HALT:
         pass
 
+    # Superinstructions fused by the peephole optimizer (see optimize)
+    @dataclass
+    class STORE:
+        var: Variable
+
+    @dataclass
+    class DECLARE_POP:
+        var: Variable
+        dtype: type
+        isConst: bool
+
+    @dataclass
+    class INC_LOCAL:
+        var: Variable
+        value: AST
+
+    @dataclass
+    class LOAD_LOCAL_CONST_ADD:
+        var: Variable
+        value: AST
+
+    @dataclass
+    class CMP_JMP_IF_FALSE:
+        compare: "I.EQ | I.NEQ | I.LT | I.GT | I.LE | I.GE"
+        label: Label
+
 Instruction = (
       I.PUSH
     | I.ADD
@@ -291,18 +312,127 @@ Instruction = (
     | I.LE
     | I.GE
     | I.LOAD
-    | I.STORE
     | I.LSHIFT
     | I.RSHIFT
+    | I.BITAND
+    | I.BITOR
+    | I.AND
+    | I.OR
+    | I.ASSIGN
     | I.PRINT
+    | I.FLUSH
+    | I.DECLARE
+    | I.BEGIN_SCOPE
+    | I.END_SCOPE
+    | I.BUILD_ARRAY
+    | I.JMP_IF_BUILT
+    | I.SLICE
+    | I.APPEND
+    | I.REMOVE
+    | I.LEN
+    | I.POP_ARRAY
+    | I.INSERT
+    | I.ARRAY_BUILTIN
+    | I.DECLARE_FUN
+    | I.DECLARE_CLASS
+    | I.GET
+    | I.SET
+    | I.AT_INDEX
+    | I.SET_INDEX
+    | I.PREPARE_CALL
+    | I.CALL
+    | I.TAIL_CALL
+    | I.RETURN
+    | I.STORE
+    | I.DECLARE_POP
+    | I.INC_LOCAL
+    | I.LOAD_LOCAL_CONST_ADD
+    | I.CMP_JMP_IF_FALSE
 )
 
+# Integer opcodes of the instructions (ByteCode.assemble encodes the instructions with them).
+# The binary operators come first, so the VM finds them with a single comparison
+OPCODES = {instruction: opcode for opcode, instruction in enumerate([
+    # Binary operators taking the two operands
+    I.SUB, I.MUL, I.REM, I.BITAND, I.BITOR, I.EQ, I.NEQ, I.LT, I.GT, I.LE, I.GE, I.AND, I.OR,
+    # Binary operators also taking the line number (operand) of the instruction
+    I.ADD, I.EXP, I.DIV, I.QUOT, I.LSHIFT, I.RSHIFT,
+    # Instructions dispatched in the VM loop (most frequent first)
+    I.LOAD, I.CMP_JMP_IF_FALSE, I.PUSH, I.LOAD_LOCAL_CONST_ADD, I.INC_LOCAL, I.STORE, I.DECLARE_POP,
+    I.JMP_IF_FALSE, I.JMP, I.POP, I.ASSIGN, I.DECLARE, I.BEGIN_SCOPE, I.END_SCOPE,
+    I.CALL, I.RETURN, I.TAIL_CALL, I.PREPARE_CALL, I.JMP_IF_TRUE, I.JMP_IF_BUILT, I.HALT,
+    # Instructions dispatched through VM.HANDLERS
+    I.UMINUS, I.NOT, I.DUP, I.PRINT, I.FLUSH, I.BUILD_ARRAY, I.SLICE, I.APPEND, I.REMOVE, I.LEN,
+    I.POP_ARRAY, I.INSERT, I.ARRAY_BUILTIN, I.DECLARE_FUN, I.DECLARE_CLASS, I.GET, I.SET, I.AT_INDEX, I.SET_INDEX,
+])}
+
+FIRST_CHECKED = OPCODES[I.ADD]
+FIRST_INSTRUCTION = OPCODES[I.LOAD]
+OP_LOAD = OPCODES[I.LOAD]
+OP_CMP_JMP_IF_FALSE = OPCODES[I.CMP_JMP_IF_FALSE]
+OP_PUSH = OPCODES[I.PUSH]
+OP_LOAD_LOCAL_CONST_ADD = OPCODES[I.LOAD_LOCAL_CONST_ADD]
+OP_INC_LOCAL = OPCODES[I.INC_LOCAL]
+OP_STORE = OPCODES[I.STORE]
+OP_DECLARE_POP = OPCODES[I.DECLARE_POP]
+OP_JMP_IF_FALSE = OPCODES[I.JMP_IF_FALSE]
+OP_JMP = OPCODES[I.JMP]
+OP_POP = OPCODES[I.POP]
+OP_ASSIGN = OPCODES[I.ASSIGN]
+OP_DECLARE = OPCODES[I.DECLARE]
+OP_BEGIN_SCOPE = OPCODES[I.BEGIN_SCOPE]
+OP_END_SCOPE = OPCODES[I.END_SCOPE]
+OP_CALL = OPCODES[I.CALL]
+OP_RETURN = OPCODES[I.RETURN]
+OP_TAIL_CALL = OPCODES[I.TAIL_CALL]
+OP_PREPARE_CALL = OPCODES[I.PREPARE_CALL]
+OP_JMP_IF_TRUE = OPCODES[I.JMP_IF_TRUE]
+OP_JMP_IF_BUILT = OPCODES[I.JMP_IF_BUILT]
+OP_HALT = OPCODES[I.HALT]
+
+# Functions of the binary operators by opcode, called with the first operand first
+BINARY_OPERATIONS = [None] * len(OPCODES)
+for instruction, function in {
+    I.SUB: operator.sub, I.MUL: operator.mul, I.REM: operator.mod,
+    I.BITAND: operator.and_, I.BITOR: operator.or_,
+    I.EQ: operator.eq, I.NEQ: operator.ne, I.LT: operator.lt, I.GT: operator.gt, I.LE: operator.le, I.GE: operator.ge,
+    I.AND: lambda firstOperand, secondOperand: bool(firstOperand) and bool(secondOperand),
+    I.OR: lambda firstOperand, secondOperand: bool(firstOperand) or bool(secondOperand),
+    # Taking the line number as well
+    I.ADD: add, I.EXP: exp, I.DIV: div, I.QUOT: quot, I.LSHIFT: lshift, I.RSHIFT: rshift,
+}.items():
+    BINARY_OPERATIONS[OPCODES[instruction]] = function
+
+def operand(instruction: Instruction):
+    '''
+    Operand of the instruction in the encoded ByteCode
+    '''
+    match instruction:
+        case I.PUSH(value):
+            return value
+        case I.LOAD(var):
+            return var.id
+        case I.JMP(label) | I.JMP_IF_FALSE(label) | I.JMP_IF_TRUE(label):
+            return label.target
+        case I.CALL(argc) | I.TAIL_CALL(argc):
+            return argc
+        case I.CMP_JMP_IF_FALSE(compare, label):
+            return (BINARY_OPERATIONS[OPCODES[type(compare)]], label.target)
+        case I.DIV(lineNumber) | I.QUOT(lineNumber) | I.LSHIFT(lineNumber) | I.RSHIFT(lineNumber):
+            return lineNumber
+        case _:
+            return instruction
+
 @dataclass
 class ByteCode:
     inst: List[Instruction]
+    ops: List[int]      # Opcodes of the instructions (see assemble)
+    args: List[AST]     # Operands of the instructions
 
     def __init__(self):
         self.inst = []
+        self.ops = None
+        self.args = None
 
     def label(self):
         return Label(-1)
@@ -313,240 +443,673 @@ class ByteCode:
     def emit_label(self, label):
         label.target = len(self.inst)
 
+    def assemble(self):
+        '''
+        Encodes the instructions into the integer opcodes and the operands the VM runs
+        '''
+        self.ops = [OPCODES[type(instruction)] for instruction in self.inst]
+        self.args = [operand(instruction) for instruction in self.inst]
+        return self
+
+# Memory the call frames of the VM may take (in bytes), and the estimates of the memory they take
+# (measured with tracemalloc): each Frame with its scope, each local variable of the function
+# (its binding, its entry in the scope and an int value) and each operand left on the stack
+memoryBudget = 256 * 1024 * 1024
+FRAME_BYTES = 380
+LOCAL_BYTES = 160
+OPERAND_BYTES = 40
+
+# Instructions declaring a local variable of the function they run in
+DECLARATIONS = (I.DECLARE, I.DECLARE_POP, I.DECLARE_FUN, I.DECLARE_CLASS)
+
+def setMemoryBudget(budget: int):
+    global memoryBudget
+    memoryBudget = budget
+
+@dataclass
+class CompiledFunction:
+    '''
+    Body of a function compiled into its own ByteCode
+    '''
+    var: Variable
+    code: ByteCode
+    frameBytes: int = FRAME_BYTES   # Estimated memory of a call frame of the function
+
+@dataclass(repr=False)
+class Instantiation(BoundMethod):
+    '''
+    Init method of a new instance, the instance being the result of the call
+    '''
+
 class Frame:
-    locals: List[AST]
-    def __init__(self):
-        MAX_LOCALS = 32
-        self.locals = [None] * MAX_LOCALS
+    '''
+    Call frame of a running function
+    '''
+    code: ByteCode      # Code to return to
+    ip: int             # Instruction to return to
+    depth: int          # Number of scopes when the function was called
+    obj: InstanceObject # Instance returned instead of the result of an init method
+    size: int           # Estimated memory of the frame (see CompiledFunction.frameBytes)
+
+    def __init__(self, code, ip, depth, obj, size):
+        self.code = code
+        self.ip = ip
+        self.depth = depth
+        self.obj = obj
+        self.size = size
 
 class VM:
     bytecode: ByteCode
     ip: int
     data: List[AST]
-    currentFrame: Frame
+    frames: List[Frame]
+    scopes: Scopes
+    depth: int
 
-    def load(self, bytecode):
+    def load(self, bytecode, scopes: Scopes = None):
+        if (bytecode.ops == None):
+            bytecode.assemble()
         self.bytecode = bytecode
+        self.scopes = scopes if scopes != None else Scopes()
         self.restart()
 
     def restart(self):
         self.ip = 0
         self.data = []
-        self.currentFrame = Frame()
+        self.frames = []
+        self.depth = len(self.scopes.stack)
+
+    def unwind(self, depth: int):
+        '''
+        Ends the scopes begun after the given number of scopes
+        '''
+        while (len(self.scopes.stack) > depth):
+            self.scopes.endScope()
 
     def execute(self) -> AST:
+        # Keeping the state of the VM in locals while running
+        code = self.bytecode
+        ops = code.ops
+        args = code.args
+        ip = self.ip
+        stack = self.data
+        push = stack.append
+        pop = stack.pop
+        frames = self.frames
+        scopes = self.scopes
+        slots = scopes.slots
+        handlers = self.HANDLERS
+        binary = BINARY_OPERATIONS
+        calls = CALLS
+        used = sum(frame.size for frame in frames)
+
         while True:
-            assert self.ip < len(self.bytecode.inst)
-            match self.bytecode.inst[self.ip]:
-                case I.PUSH(val):
-                    self.data.append(val)
-                    self.ip += 1
-                case I.UMINUS():
-                    op = self.data.pop()
-                    if(isinstance(op, Float)):
-                        self.data.append(Float(op.value * -1))
-                        self.ip += 1
-                    else:
-                        self.data.append(Int(op.value * -1))
-                        self.ip += 1
-                case I.ADD():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    if (isinstance(firstOperand, Str) and isinstance(secondOperand, Str)):
-                        self.data.append(Str(firstOperand.value + secondOperand.value))
-                    firstOperand, secondOperand = BinOp.implicitIntToFloat(firstOperand, secondOperand)
-                    if (isinstance(firstOperand, Float)):
-                        self.data.append(Float(firstOperand.value + secondOperand.value))
-                        self.ip += 1
+            op = ops[ip]
+            arg = args[ip]
+            ip += 1
+            if (op < FIRST_INSTRUCTION):
+                firstOperand = pop()
+                if (op < FIRST_CHECKED):
+                    stack[-1] = binary[op](firstOperand, stack[-1])
+                else:
+                    stack[-1] = binary[op](firstOperand, stack[-1], arg)
+            elif (op == OP_LOAD):
+                try:
+                    binding = slots[arg]
+                except IndexError:
+                    binding = None
+                push(binding[0] if binding != None else None)
+            elif (op == OP_CMP_JMP_IF_FALSE):
+                firstOperand = pop()
+                compare, target = arg
+                if not compare(firstOperand, pop()):
+                    ip = target
+            elif (op == OP_PUSH):
+                push(arg)
+            elif (op == OP_LOAD_LOCAL_CONST_ADD):
+                binding = slots[arg.var.id] if arg.var.id < len(slots) else None
+                push(add(binding[0] if binding != None else None, arg.value, None))
+            elif (op == OP_INC_LOCAL):
+                binding = slots[arg.var.id] if arg.var.id < len(slots) else None
+                current = binding[0] if binding != None else None
+                # Incrementing int variables directly, the rest is checked by the scopes
+                if (binding != None and binding[1] is Int and current.__class__ is int and arg.value.__class__ is int and not binding[2]):
+                    binding[0] = current + arg.value
+                else:
+                    scopes.updateVariable(arg.var, add(current, arg.value, None))
+            elif (op == OP_STORE):
+                value = pop()
+                binding = slots[arg.var.id] if arg.var.id < len(slots) else None
+                if (binding != None and binding[1] is Int and value.__class__ is int and not binding[2]):
+                    binding[0] = value
+                else:
+                    scopes.updateVariable(arg.var, value)
+            elif (op == OP_DECLARE_POP):
+                value = pop()
+                if (arg.dtype == Bool):
+                    value = bool(value)
+                if (arg.dtype is Int and value.__class__ is int):
+                    scopes.bind(arg.var, [value, Int, arg.isConst])
+                else:
+                    scopes.declareVariable(arg.var, value, arg.dtype, arg.isConst)
+            elif (op == OP_JMP_IF_FALSE):
+                if not pop():
+                    ip = arg
+            elif (op == OP_JMP):
+                ip = arg
+            elif (op == OP_POP):
+                pop()
+            elif (op == OP_ASSIGN):
+                value = stack[-1]
+                binding = slots[arg.var.id] if arg.var.id < len(slots) else None
+                # Assigning ints to int variables directly, the rest is checked by the scopes
+                if (binding != None and binding[1] is Int and value.__class__ is int and not binding[2]):
+                    binding[0] = value
+                else:
+                    stack[-1] = scopes.updateVariable(arg.var, value)
+            elif (op == OP_DECLARE):
+                value = stack[-1]
+                # Truthify if Bool dtype
+                if (arg.dtype == Bool):
+                    value = stack[-1] = bool(value)
+                if (arg.dtype is Int and value.__class__ is int):
+                    scopes.bind(arg.var, [value, Int, arg.isConst])
+                else:
+                    scopes.declareVariable(arg.var, value, arg.dtype, arg.isConst)
+            elif (op == OP_BEGIN_SCOPE):
+                scopes.stack.append([])
+            elif (op == OP_END_SCOPE):
+                scopes.endScope()
+            elif (op == OP_CALL):
+                argv = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                fn = pop()
+                size = (fn if fn.__class__ is FnObject else fn.fn).body.frameBytes
+                if (used + size + OPERAND_BYTES * len(stack) > memoryBudget):
+                    self.exceeded(len(frames), code.inst[ip - 1].lineNumber)
+                used += size
+                frames.append(Frame(code, ip, len(scopes.stack), fn.obj if fn.__class__ is Instantiation else None, size))
+                calls.append(code.inst[ip - 1].call)
+
+                scopes.beginScope()
+                if (fn.__class__ is not FnObject):
+                    # Binding this for methods
+                    bindMethod(fn, scopes)
+                    fn = fn.fn
+                params = fn.params
+                params_types = fn.params_types
+                for i in range(len(params)):
+                    if (params_types[i] is Int and argv[i].__class__ is int):
+                        scopes.bind(params[i], [argv[i], Int, False])
                     else:
-                        self.data.append(Int(firstOperand.value + secondOperand.value))
-                        self.ip += 1
-                case I.SUB():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    firstOperand, secondOperand = BinOp.implicitIntToFloat(firstOperand, secondOperand)
-
-                    if (isinstance(firstOperand, Float)):
-                        self.data.append(Float(firstOperand.value - secondOperand.value))
-                        self.ip += 1
+                        scopes.declareVariable(params[i], argv[i], params_types[i], False)
+
+                code = fn.body.code
+                if (code.ops == None):
+                    code.assemble()
+                ops = code.ops
+                args = code.args
+                ip = 0
+            elif (op == OP_RETURN):
+                value = pop()
+                if (len(frames) == 0):
+                    # Returning from the program
+                    self.unwind(self.depth)
+                    return value
+                frame = frames.pop()
+                used -= frame.size
+                calls.pop()
+                self.unwind(frame.depth)
+                # overriding the return from the init function
+                push(frame.obj if frame.obj != None else value)
+                code = frame.code
+                ops = code.ops
+                args = code.args
+                ip = frame.ip
+            elif (op == OP_TAIL_CALL):
+                # Reusing the frame of the returning function (a function, as marked by the resolver)
+                argv = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                fn = pop()
+                frame = frames[-1]
+                size = fn.body.frameBytes
+                if (used - frame.size + size + OPERAND_BYTES * len(stack) > memoryBudget):
+                    self.exceeded(len(frames), code.inst[ip - 1].lineNumber)
+                used += size - frame.size
+                frame.size = size
+                self.unwind(frame.depth)
+                calls[-1] = (code.inst[ip - 1].fn, calls[-1][1])
+
+                scopes.beginScope()
+                params = fn.params
+                params_types = fn.params_types
+                for i in range(len(params)):
+                    if (params_types[i] is Int and argv[i].__class__ is int):
+                        scopes.bind(params[i], [argv[i], Int, False])
                     else:
-                        self.data.append(Int(firstOperand.value - secondOperand.value))
-                        self.ip += 1
-                case I.MUL():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-
-                    second_type = isinstance(secondOperand,int) or isinstance(secondOperand,Int)
-                    first_type = isinstance(firstOperand,int) or isinstance(firstOperand,Int)
-                    
-                    if (isinstance(firstOperand,Str) and second_type):
-                        self.data.append(Str(firstOperand.value * secondOperand.value))
-                        self.ip += 1
-
-                    if (first_type and isinstance(secondOperand,Str)):
-                        self.data.append(Str(firstOperand.value * secondOperand.value))
-                        self.ip += 1
-                    
-                    firstOperand, secondOperand = BinOp.implicitIntToFloat(firstOperand, secondOperand)
-
-                    if (isinstance(firstOperand, Float)):
-                        self.data.append(Float(firstOperand.value * secondOperand.value))
-                        self.ip += 1
-                    else:
-                        self.data.append(Int(firstOperand.value * secondOperand.value))
-                        self.ip += 1
-                case I.DIV():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    if (secondOperand == Int(0) or secondOperand == Float(0)):
-                        RuntimeError("Cannot divide with zero")
-                    self.data.append(Float(firstOperand.value/secondOperand.value))
-                    self.ip += 1
-                case I.EXP():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    if isinstance(firstOperand, Int) and isinstance(secondOperand, Int):
-                        self.data.append(Int(firstOperand.value ** secondOperand.value))
-                        self.ip += 1
-                    else:
-                        self.data.append(Float(firstOperand.value ** secondOperand.value))
-                        self.ip += 1
-                case I.QUOT():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-
-                    if (secondOperand == Int(0) or secondOperand == Float(0)):
-                        RuntimeError("Cannot divide with zero.")
-                    self.data.append(Int(int(firstOperand.value / secondOperand.value)))
-                    self.ip += 1
-                case I.REM():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    self.data.append(Int(firstOperand.value % secondOperand.value))
-                    self.ip += 1
-
-                case I.LSHIFT():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    if (secondOperand.value < 0):
-                        RuntimeError(f"Negative firstOperand operand is not allowed.")
-                    self.data.append(Int(firstOperand.value << secondOperand.value))
-                    self.ip += 1
-                case I.RSHIFT():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    if (secondOperand.value < 0):
-                        RuntimeError(f"Negative firstOperand operand not allowed.")
-                    self.data.append(Int(firstOperand.value >> secondOperand.value))
-                    self.ip += 1
-                case I.EQ():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    self.data.append(Bool(firstOperand.value == secondOperand.value))
-                    self.ip += 1
-                case I.NEQ():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    self.data.append(Bool(firstOperand.value != secondOperand.value))
-                    self.ip += 1
-                case I.LT():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    self.data.append(Bool(firstOperand.value < secondOperand.value))
-                    self.ip += 1
-                case I.GT():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    self.data.append(Bool(firstOperand.value > secondOperand.value))
-                    self.ip += 1
-                case I.LE():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    self.data.append(Bool(firstOperand.value <= secondOperand.value))
-                    self.ip += 1
-                case I.GE():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    self.data.append(Bool(firstOperand.value >= secondOperand.value))
-                    self.ip += 1
-                case I.ASSIGN():
-                    secondOperand = self.data.pop()
-                    firstOperand = self.data.pop()
-                    self.data.append(Bool(firstOperand.value >= secondOperand.value))
-                    self.ip += 1
-                case I.JMP(label):
-                    self.ip = label.target
-                case I.JMP_IF_FALSE(label):
-                    op = self.data.pop()
-                    if not op:
-                        self.ip = label.target
-                    else:
-                        self.ip += 1
-                case I.JMP_IF_TRUE(label):
-                    op = self.data.pop()
-                    if op:
-                        self.ip = label.target
-                    else:
-                        self.ip += 1
-                case I.NOT():
-                    op = self.data.pop()
-                    evaluated_operand = Bool.truthy(op.value)
-                    self.data.append(Bool(not evaluated_operand.value))
-                    self.ip += 1
-                case I.DUP():
-                    op = self.data.pop()
-                    self.data.append(op)
-                    self.data.append(op)
-                    self.ip += 1
-                case I.POP():
-                    self.data.pop()
-                    self.ip += 1
-                case I.PRINT(sep, end):
-                    p=self.data.pop()
-                    if(sep is not None):
-                        print(p.value, end=sep.value)
-                    elif(end is not None):
-                        print(p.value, end=end.value)
-                    self.ip+=1
-                case I.LOAD(localID):
-                    self.data.append(self.currentFrame.locals[localID])
-                    self.ip += 1
-                case I.STORE(localID):
-                    v = self.data.pop()
-                    self.currentFrame.locals[localID] = v
-                    self.ip += 1
-                case I.HALT():
-                    return self.data.pop()
+                        scopes.declareVariable(params[i], argv[i], params_types[i], False)
+
+                code = fn.body.code
+                if (code.ops == None):
+                    code.assemble()
+                ops = code.ops
+                args = code.args
+                ip = 0
+            elif (op == OP_PREPARE_CALL):
+                # Checking if it is a class instantiation
+                if (isinstance(stack[-1], ClassObject) and not self.instantiate(arg)):
+                    # Skipping the call (and the arguments)
+                    ip = arg.label.target
+            elif (op == OP_JMP_IF_TRUE):
+                if pop():
+                    ip = arg
+            elif (op == OP_JMP_IF_BUILT):
+                # Array literals are evaluated in place only once (as in sim.evaluate)
+                if (arg.build.built):
+                    push(arg.build.array)
+                    ip = arg.label.target
+            elif (op == OP_HALT):
+                return pop()
+            else:
+                handlers[op](self, arg)
+
+    def exceeded(self, calls: int, lineNumber: int):
+        '''
+        Reports the recursion running out of the memory budget
+        '''
+        RuntimeError(f"Maximum recursion depth exceeded ({calls} calls, in a memory budget of {memoryBudget // (1024 * 1024)} MB)", lineNumber, "recursionError")
 
+    def instantiate(self, instruction: I.PREPARE_CALL) -> bool:
+        '''
+        Replaces the class on the stack by a new instance, returns if its init method has to be called
+        '''
+        cls = self.data[-1]
+
+        # Copying the template of the instance, evaluating the non constant fields into its slots
+        layout = classLayout(cls)
+        instanceFields = layout.template.copy()
+        for slot, initializer in layout.initializers:
+            instanceFields[slot] = run(initializer, layout.scopes)
+
+        # Creating the instance object from the class object
+        obj = InstanceObject(cls, instanceFields)
+
+        if "init" not in cls.methods:
+            self.data[-1] = obj
+            return False
+
+        # Calling the init method next
+        init = boundMethod(obj, "init")
+        self.data[-1] = Instantiation(obj, init.this, init.thisType, init.var, init.fn)
+        return True
+
+    # Handlers of the less frequent instructions, taking the VM and the operand of the instruction
+    def uminus(self, instruction: I.UMINUS):
+        op = self.data.pop()
+        self.data.append(-op if isinstance(op, (int, Fraction, float)) else None)
+
+    def not_(self, instruction: I.NOT):
+        self.data.append(not self.data.pop())
+
+    def dup(self, instruction: I.DUP):
+        self.data.append(self.data[-1])
+
+    def print_(self, instruction: I.PRINT):
+        p = self.data.pop()
+        if (p is not None):
+            if (isinstance(p, zArray)):
+                printValue(p, instruction.end)
+            else:
+                OUTPUT.write(str(p) + instruction.end)
+        if (instruction.flush):
+            OUTPUT.flush()
+
+    def flush(self, instruction: I.FLUSH):
+        if (self.data.pop()):
+            OUTPUT.flush()
+
+    def buildArray(self, instruction: I.BUILD_ARRAY):
+        array = instruction.array
+        count = instruction.count
+        values = []
+        if (count != 0):
+            values = self.data[-count:]
+            del self.data[-count:]
+        array.elements = arrayStorage(array.dtype, values)
+        instruction.built = True
+        self.data.append(array)
+
+    def slice(self, instruction: I.SLICE):
+        lineNumber = instruction.lineNumber
+        second = self.data.pop()
+        first = self.data.pop()
+        elem = self.data.pop()
+        if(not(isinstance(elem, zArray))):
+            if (first>second or first < 0 or second > len(elem)):
+                RuntimeError("Index out of bounds", lineNumber, "indexError")
+            self.data.append(elem[first:second])
+        else:
+            if (first < 0 or first >= len(elem.elements)):
+                RuntimeError("Index out of bounds", lineNumber, "indexError")
+            if(second is None):
+                self.data.append(elem.elements[first])
+            else:
+                if (first>second or first < 0 or second > len(elem.elements)):
+                    RuntimeError("Index out of bounds", lineNumber, "indexError")
+                self.data.append(sliceArray(elem, first, second, lineNumber))
+
+    def append(self, instruction: I.APPEND):
+        element = self.data.pop()
+        l = self.data.pop()
+        if (l.shared):
+            own(l)
+        try:
+            l.elements.append(element)
+        except OverflowError:
+            boxed(l).append(element)
+        self.data.append(None)
+
+    def remove(self, instruction: I.REMOVE):
+        index = self.data.pop()
+        l = self.data.pop()
+        # Checking if the index is out of bounds
+        if (len(l.elements) <= index):
+            RuntimeError(f"array index out of bounds", instruction.lineNumber, 'indexError')
+        if (l.shared):
+            own(l)
+        self.data.append(l.elements.pop(index))
+
+    def len_(self, instruction: I.LEN):
+        l = self.data.pop()
+        if(isinstance(l,zArray)):
+            self.data.append(len(l.elements))
+        elif(isinstance(l,STRING_TYPES)):
+            self.data.append(len(l))
+        else:
+            self.data.append(None)
+
+    def popArray(self, instruction: I.POP_ARRAY):
+        l = self.data.pop()
+        if (len(l.elements) == 0):
+            RuntimeError(f"Cannot popout from an empty array", instruction.lineNumber, 'indexError')
+        if (l.shared):
+            own(l)
+        self.data.append(l.elements.pop())
+
+    def insert(self, instruction: I.INSERT):
+        element = self.data.pop()
+        l = self.data.pop()
+        if (l.shared):
+            own(l)
+        try:
+            l.elements.insert(instruction.index.value, element)
+        except OverflowError:
+            boxed(l).insert(instruction.index.value, element)
+        self.data.append(None)
+
+    def arrayBuiltin(self, instruction: I.ARRAY_BUILTIN):
+        args = self.data[-instruction.argc:]
+        del self.data[-instruction.argc:]
+        self.data.append(instruction.function(args, instruction.operator, instruction.lineNumber))
+
+    def declareFun(self, instruction: I.DECLARE_FUN):
+        self.scopes.declareFun(instruction.var, instruction.fn)
+        self.data.append(None)
+
+    def declareClass(self, instruction: I.DECLARE_CLASS):
+        classObj = ClassObject(instruction.var.name, instruction.stmts, instruction.thisID, instruction.functions, instruction.layout)
+        self.scopes.declareVariable(instruction.var, classObj, ClassObject, False)
+        self.data.append(None)
+
+    def get(self, instruction: I.GET):
+        name = instruction.name
+        lineNumber = instruction.lineNumber
+        obj = self.data.pop()
+        field = None
+        if (isinstance(obj, InstanceObject)):
+            layout = classLayout(obj.zClass)
+            if (instruction.slot != None):
+                field = obj.slots[instruction.slot]
+            elif name in layout.slots:
+                field = obj.slots[layout.slots[name]]
+            elif name in obj.zClass.methods:
+                field = obj.zClass.methods[name]
+            else:
+                RuntimeError(f"Instance of class {obj.zClass.name} has no attribute {name}", lineNumber, "attributeError")
+            if (isinstance(field, DeclareFun)):
+                # this is bound when the method is called
+                field = boundMethod(obj, name)
+        self.data.append(field)
+
+    def set(self, instruction: I.SET):
+        name = instruction.name
+        value = self.data.pop()
+        obj = self.data.pop()
+        if (isinstance(obj, InstanceObject)):
+            if (instruction.slot != None):
+                obj.slots[instruction.slot] = value
+            elif name in classLayout(obj.zClass).slots:
+                obj.slots[classLayout(obj.zClass).slots[name]] = value
+            else:
+                RuntimeError(f"Instance of class {obj.zClass.name} has no attribute {name}", instruction.lineNumber, "attributeError")
+        self.data.append(None)
+
+    def atIndex(self, instruction: I.AT_INDEX):
+        lineNumber = instruction.lineNumber
+        index = self.data.pop()
+        obj = self.data.pop()
+        value = None
+        if (isinstance(obj, zArray)):
+            elements = obj.elements
+            if (index < 0 or index >= len(elements)):
+                RuntimeError("Index out of bounds", lineNumber, "indexError")
+            if (elements.__class__ is BoolArray):
+                value = byteAt(elements, index) != 0
+            else:
+                value = elements[index]
+        elif (isinstance(obj, STRING_TYPES)):
+            if (index < 0 or index >= len(obj)):
+                RuntimeError("Index out of bounds", lineNumber, "indexError")
+            value = obj[index]
+        self.data.append(value)
+
+    def setIndex(self, instruction: I.SET_INDEX):
+        lineNumber = instruction.lineNumber
+        value = self.data.pop()
+        index = self.data.pop()
+        obj = self.data.pop()
+        if (isinstance(obj, zArray)):
+            if (index < 0 or index >= len(obj.elements)):
+                RuntimeError("Index out of bounds", lineNumber, "indexError")
+            if (obj.shared):
+                own(obj)
+            try:
+                obj.elements[index] = value
+            except OverflowError:
+                boxed(obj)[index] = value
+        elif (isinstance(obj, STRING_TYPES)):
+            if (index < 0 or index >= len(obj)):
+                RuntimeError("Index out of bounds", lineNumber, "indexError")
+            storeString(instruction.target, replacedCharacter(obj, index, value), self.scopes)
+        self.data.append(None)
+
+# Handlers of the instructions not dispatched in the VM loop, by opcode
+VM.HANDLERS = [None] * len(OPCODES)
+for instruction, handler in {
+    I.UMINUS: VM.uminus, I.NOT: VM.not_, I.DUP: VM.dup, I.PRINT: VM.print_, I.FLUSH: VM.flush,
+    I.BUILD_ARRAY: VM.buildArray, I.SLICE: VM.slice, I.APPEND: VM.append, I.REMOVE: VM.remove,
+    I.LEN: VM.len_, I.POP_ARRAY: VM.popArray, I.INSERT: VM.insert, I.ARRAY_BUILTIN: VM.arrayBuiltin, I.DECLARE_FUN: VM.declareFun,
+    I.DECLARE_CLASS: VM.declareClass, I.GET: VM.get, I.SET: VM.set, I.AT_INDEX: VM.atIndex,
+    I.SET_INDEX: VM.setIndex,
+}.items():
+    VM.HANDLERS[OPCODES[instruction]] = handler
+
+def run(code: ByteCode, scopes: Scopes = None):
+    '''
+    Runs the given ByteCode on a new VM
+    '''
+    vm = VM()
+    vm.load(code, scopes)
+    return vm.execute()
+
+# Peephole optimization of the generated ByteCode (toggled with setPeephole), and the number
+# of instructions generated and eliminated by it so far
+peephole = True
+peepholeStats = {"instructions": 0, "eliminated": 0}
 
+def setPeephole(enabled: bool):
+    global peephole
+    peephole = enabled
+
+def jumpTargets(inst: List[Instruction]) -> set:
+    '''
+    Indices of the instructions jumped to by the given instructions
+    '''
+    return {instruction.label.target for instruction in inst if hasattr(instruction, "label")}
+
+def threadJumps(inst: List[Instruction]):
+    '''
+    Retargets the jumps landing on an unconditional jump to the final target of the chain
+    '''
+    for instruction in inst:
+        if (not hasattr(instruction, "label")):
+            continue
+        label = instruction.label
+        seen = set()
+        while (label.target < len(inst) and isinstance(inst[label.target], I.JMP) and label.target not in seen):
+            seen.add(label.target)
+            label.target = inst[label.target].label.target
+
+def rewrite(inst: List[Instruction], i: int, targets: set):
+    '''
+    Peephole rewrite of the instructions starting at index i, as (number of instructions
+    replaced, replacement), or None. Jumps may only land on the first replaced instruction
+    '''
+    def window(n):
+        if (i + n > len(inst) or any(j in targets for j in range(i + 1, i + n))):
+            return None
+        return inst[i:i + n]
+
+    # i = i + c; (the second operand is pushed first)
+    match window(5):
+        case [I.PUSH(value), I.LOAD(var), I.ADD(), I.ASSIGN(target), I.POP()] if var.id == target.id:
+            return 5, [I.INC_LOCAL(target, value)]
+    match window(3):
+        case [I.PUSH(value), I.LOAD(var), I.ADD()]:
+            return 3, [I.LOAD_LOCAL_CONST_ADD(var, value)]
+    match window(2):
+        case [I.ASSIGN(var), I.POP()]:
+            return 2, [I.STORE(var)]
+        case [I.DECLARE(var, dtype, isConst), I.POP()]:
+            return 2, [I.DECLARE_POP(var, dtype, isConst)]
+        case [I.EQ() | I.NEQ() | I.LT() | I.GT() | I.LE() | I.GE() as compare, I.JMP_IF_FALSE(label)]:
+            return 2, [I.CMP_JMP_IF_FALSE(compare, label)]
+        # Values pushed only to be discarded (statements of a Seq, the nil of loops and prints)
+        case [I.PUSH() | I.LOAD(), I.POP()]:
+            return 2, []
+    match window(1):
+        case [I.JMP(label)] if label.target == i + 1:
+            return 1, []
+    return None
+
+def optimize(code: ByteCode) -> int:
+    '''
+    Peephole optimization of the (not yet assembled) instructions of the code: removes the
+    dead push/pop pairs, threads the jumps to jumps and fuses the superinstructions.
+    Returns the number of instructions eliminated
+    '''
+    inst = code.inst
+    before = len(inst)
+    changed = True
+    while (changed):
+        changed = False
+        threadJumps(inst)
+        targets = jumpTargets(inst)
+        optimized = []
+        # New index of each old instruction (removed ones map to the next instruction kept)
+        positions = []
+        i = 0
+        while (i < len(inst)):
+            rewritten = rewrite(inst, i, targets)
+            if (rewritten == None):
+                positions.append(len(optimized))
+                optimized.append(inst[i])
+                i += 1
+                continue
+            count, replacement = rewritten
+            positions.extend([len(optimized)] * count)
+            optimized.extend(replacement)
+            i += count
+            changed = True
+        positions.append(len(optimized))
+
+        # Relocating the labels (shared by the instructions jumping to the same place) once
+        labels = {id(instruction.label): instruction.label for instruction in optimized if hasattr(instruction, "label")}
+        for label in labels.values():
+            label.target = positions[label.target]
+        inst = optimized
+
+    code.inst = inst
+    peepholeStats["instructions"] += before
+    peepholeStats["eliminated"] += before - len(inst)
+    return before - len(inst)
 
 def codegen(program: AST) -> ByteCode:
     code = ByteCode()
     generate_codegen(program, code)
     code.emit(I.HALT())
-    return code
+    if (peephole):
+        optimize(code)
+    return code.assemble()
+
+def codegen_function(fn: DeclareFun) -> FnObject:
+    '''
+    Compiles the body of the function, which returns nil when it ends without a return statement
+    '''
+    code = ByteCode()
+    generate_codegen(fn.body, code)
+    code.emit(I.POP())
+    code.emit(I.PUSH(None))
+    code.emit(I.RETURN())
+    if (peephole):
+        optimize(code)
+    code.assemble()
+    # The parameters, the local declarations, and this and the method itself for methods
+    locals = len(fn.params) + sum(isinstance(instruction, DECLARATIONS) for instruction in code.inst)
+    if (fn.functionType == "METHOD"):
+        locals += 2
+    body = CompiledFunction(fn.var, code, FRAME_BYTES + LOCAL_BYTES * locals)
+    return FnObject(fn.functionType, fn.params_type, fn.params, body, fn.return_type)
 
 def generate_codegen (program: AST, code: ByteCode) -> None:
 
     def codegen_(program):
         generate_codegen(program, code)
+
     binary_operators = {
         "+": I.ADD(),
         "-": I.SUB(),
         "*": I.MUL(),
-        "/": I.DIV(),
-        "//": I.QUOT(),
         "%": I.REM(),
         "<": I.LT(),
         ">": I.GT(),
         "<=": I.LE(),
         ">=": I.GE(),
-        "=": I.EQ(),
+        "==": I.EQ(),
         "!=": I.NEQ(),
-        "~": I.NOT(),
-        ">>": I.RSHIFT(),
-        "<<": I.LSHIFT(),
-        "^":I.EXP(),
+        "&": I.BITAND(),
+        "|": I.BITOR(),
+        "&&": I.AND(),
+        "||": I.OR(),
+        "^": I.EXP(),
+    }
+
+    # Binary operators reporting errors at the line of the operation
+    checked_operators = {
+        "/": I.DIV,
+        "//": I.QUOT,
+        ">>": I.RSHIFT,
+        "<<": I.LSHIFT,
     }
 
     unary_operators={
@@ -555,43 +1118,66 @@ def generate_codegen (program: AST, code: ByteCode) -> None:
     }
 
     match program:
-        case (Variable() as v) | UnOp("~", Variable() as v):
-            code.emit(I.LOAD(v.localID))
-        case Int(value) | Bool(value) | Str(value) | Float(value) as v:
-            code.emit(I.PUSH(v))
+        case Variable() as v:
+            code.emit(I.LOAD(v))
+        case This(lineNumber, id):
+            code.emit(I.LOAD(Variable(lineNumber, "this", id)))
+        case Int(value) | Bool(value) | Str(value) | Float(value):
+            code.emit(I.PUSH(value))
         case nil():
             code.emit(I.PUSH(None))
-        case BinOp(op, firstOperand, secondOperand) if op in binary_operators:
-            codegen_(firstOperand)
-            codegen_(secondOperand)
-            code.emit(binary_operators[op])
-        case BinOp("&&", firstOperand, secondOperand):
+        # Values (elements of array literals already evaluated by sim.evaluate)
+        case int() | float() | str() | Fraction() | None | InstanceObject():
+            code.emit(I.PUSH(program))
+        case zArray() as arr:
             E = code.label()
+            build = I.BUILD_ARRAY(arr, len(arr.elements))
+            code.emit(I.JMP_IF_BUILT(build, E))
+            for element in arr.elements:
+                codegen_(element)
+            code.emit(build)
+            code.emit_label(E)
+        case BinOp(lineNumber, "=", var, value):
+            codegen_(value)
+            code.emit(I.ASSIGN(var))
+        case BinOp(lineNumber, op, firstOperand, secondOperand) if op in binary_operators or op in checked_operators:
+            codegen_(secondOperand)
             codegen_(firstOperand)
-            code.emit(I.DUP())
-            code.emit(I.JMP_IF_FALSE(E))
-            code.emit(I.POP())
+            if (op in binary_operators):
+                code.emit(binary_operators[op])
+            else:
+                code.emit(checked_operators[op](lineNumber))
+        case BinOp(lineNumber, op, firstOperand, secondOperand):
+            # Operators sim.evaluate does not implement evaluate to nil
             codegen_(secondOperand)
-            code.emit_label(E)
-        case BinOp("||", firstOperand, secondOperand):
-            E = code.label()
             codegen_(firstOperand)
-            code.emit(I.DUP())
-            code.emit(I.JMP_IF_TRUE(E))
             code.emit(I.POP())
-            codegen_(secondOperand)
-            code.emit_label(E)
-        case UnOp(op, operand) if op in unary_operators:
+            code.emit(I.POP())
+            code.emit(I.PUSH(None))
+        case UnOp(lineNumber, op, operand) if op in unary_operators:
             codegen_(operand)
             code.emit(unary_operators[op])
+        case UnOp(lineNumber, op, operand):
+            codegen_(operand)
+            code.emit(I.POP())
+            code.emit(I.PUSH(None))
+        case Declare(lineNumber, var, value, dtype, isConst):
+            codegen_(value)
+            code.emit(I.DECLARE(var, dtype, isConst))
+        case Block(blockStatements):
+            code.emit(I.BEGIN_SCOPE())
+            codegen_(blockStatements)
+            code.emit(I.END_SCOPE())
         case Seq(lines):
-            if not lines: raise RuntimeError()
+            if not lines:
+                code.emit(I.PUSH(None))
+                return
             last, rest = lines[-1], lines[:-1]
             for line in rest:
                 codegen_(line)
                 code.emit(I.POP())
             codegen_(last)
-        case If(condition, ifBlock, elseBlock):
+        case If(lineNumber, condition, ifBlock, elseBlock):
             E = code.label()
             F = code.label()
             codegen_(condition)
@@ -599,9 +1185,9 @@ def generate_codegen (program: AST, code: ByteCode) -> None:
             codegen_(ifBlock)
             code.emit(I.JMP(E))
             code.emit_label(F)
-            codegen_(elseBlock)
+            codegen_(elseBlock if elseBlock != None else nil())
             code.emit_label(E)
-        case While(condition, block):
+        case While(lineNumber, condition, block):
             B = code.label()
             E = code.label()
             code.emit_label(B)
@@ -612,28 +1198,104 @@ def generate_codegen (program: AST, code: ByteCode) -> None:
             code.emit(I.JMP(B))
             code.emit_label(E)
             code.emit(I.PUSH(None))
-        case For(initial, condition, block):
-            B = code.label()
-            E = code.label()
+        case For(lineNumber, initial, condition, block):
+            # The initial statement should not effect the outer scope
+            code.emit(I.BEGIN_SCOPE())
             codegen_(initial)
-            code.emit_label(B)
-            codegen_(condition)
-            code.emit(I.JMP_IF_FALSE(E))
-            codegen_(block)
             code.emit(I.POP())
-            code.emit(I.JMP(B))
-            code.emit_label(E)
-            code.emit(I.PUSH(None))
+            codegen_(While(lineNumber, condition, block))
+            code.emit(I.END_SCOPE())
 
-        case PRINT(print_stmt, sep, end):
-            last, rest = print_stmt[-1], print_stmt[:-1]
-            for stmt in (rest):
+        case PRINT(lineNumber, print_stmt, sep, end, flush):
+            # A literal flush is done by the last PRINT, any other one by a FLUSH of its value
+            for i, stmt in enumerate(print_stmt):
                 codegen_(stmt)
-                code.emit(I.PRINT(sep))
-            codegen_(last)
-            code.emit(I.PRINT(end))
+                last = i == len(print_stmt) - 1
+                code.emit(I.PRINT(end.value if last else sep.value, isinstance(flush, Bool) and flush.value and last))
+            if (not isinstance(flush, Bool)):
+                codegen_(flush)
+                code.emit(I.FLUSH())
             code.emit(I.PUSH(None))
 
+        case array_append(lineNumber, element, var):
+            code.emit(I.LOAD(var))
+            codegen_(element)
+            code.emit(I.APPEND())
+        case array_remove(lineNumber, index, var):
+            code.emit(I.LOAD(var))
+            codegen_(index)
+            code.emit(I.REMOVE(lineNumber))
+        case array_len(lineNumber, var):
+            codegen_(var)
+            code.emit(I.LEN())
+        case array_pop(lineNumber, var):
+            code.emit(I.LOAD(var))
+            code.emit(I.POP_ARRAY(lineNumber))
+        case array_insert(lineNumber, index, element, var):
+            code.emit(I.LOAD(var))
+            codegen_(element)
+            code.emit(I.INSERT(index))
+        case array_builtin(lineNumber, name, args, operator):
+            for arg in args:
+                codegen_(arg)
+            code.emit(I.ARRAY_BUILTIN(ARRAY_BUILTINS[name], len(args), operator, lineNumber))
+        case Slice(lineNumber, value, first, second):
+            codegen_(value)
+            codegen_(first)
+            codegen_(second)
+            code.emit(I.SLICE(lineNumber))
+
+        case DeclareFun() as f:
+            code.emit(I.DECLARE_FUN(f.var, codegen_function(f)))
+        case DeclareClass(lineNumber, var, stmts, thisID):
+            # Compiling the methods and the field initializers up front
+            functions = {}
+            for name, stmt in stmts.items():
+                if isinstance(stmt, DeclareFun):
+                    functions[name] = codegen_function(stmt)
+            layout = instanceLayout(stmts, lambda stmt: codegen(stmt.value))
+            code.emit(I.DECLARE_CLASS(var, stmts, thisID, functions, layout))
+        case Get(lineNumber, var, name, slot):
+            codegen_(var)
+            code.emit(I.GET(name, lineNumber, slot))
+        case Set(lineNumber, var, name, value, slot):
+            codegen_(var)
+            codegen_(value)
+            code.emit(I.SET(name, lineNumber, slot))
+        case AtIndex(lineNumber, var, index):
+            codegen_(var)
+            codegen_(index)
+            code.emit(I.AT_INDEX(lineNumber))
+        case SetAtIndex(lineNumber, var, index, value):
+            codegen_(var)
+            codegen_(index)
+            codegen_(value)
+            code.emit(I.SET_INDEX(var, lineNumber))
+
+        case FunCall(lineNumber, f, args):
+            # The arguments are evaluated after the function (and the instance for classes)
+            E = code.label()
+            codegen_(f)
+            code.emit(I.PREPARE_CALL(lineNumber, E))
+            for arg in args:
+                codegen_(arg)
+            code.emit(I.CALL(len(args), lineNumber, (f, lineNumber)))
+            code.emit_label(E)
+        case Return(lineNumber, FunCall(_, f, args, True)):
+            codegen_(f)
+            for arg in args:
+                codegen_(arg)
+            code.emit(I.TAIL_CALL(len(args), lineNumber, f))
+        case Return(lineNumber, value):
+            codegen_(value)
+            code.emit(I.RETURN())
+
         # Handling unknown expressions
         case _ as v:
             raise Exception(f"Got {v}, Expression|Statement Invalid")
+
+def evaluateVM(program: AST, scopes: Scopes = None):
+    '''
+    Compiles the given AST to ByteCode and runs it on the VM
+    '''
+    return run(codegen(program), scopes)
@@ -0,0 +1,562 @@
+'''
+Closure compiling evaluator
+
+compileAST walks the resolved and typechecked AST once and turns every node into a Python
+closure with its children (and operator) already bound. Running the program then only calls
+those closures, instead of re-matching every node in sim.evaluate on every execution.
+The behaviour (including the output and the errors reported) is identical to sim.evaluate.
+'''
+from sim import *
+
+# Binary operators, each taking the evaluated operands and the line number of the operation
+def add(firstOperand, secondOperand, lineNumber):
+    if (isinstance(firstOperand, zArray) and isinstance(secondOperand, zArray)):
+        return concatenate(firstOperand, secondOperand, lineNumber)
+    if (firstOperand.__class__ is str):
+        return concatenateStrings(firstOperand, secondOperand)
+    return firstOperand + secondOperand
+
+def div(firstOperand, secondOperand, lineNumber):
+    if (isZero(secondOperand)):
+        RuntimeError("Cannot divide with zero.", lineNumber)
+    return floatValue(firstOperand / secondOperand)
+
+def quot(firstOperand, secondOperand, lineNumber):
+    if (isZero(secondOperand)):
+        RuntimeError("Cannot divide with zero.", lineNumber)
+    return int(firstOperand / secondOperand)
+
+def lshift(firstOperand, secondOperand, lineNumber):
+    if (secondOperand < 0):
+        RuntimeError(f"Negative left operand not allowed for <<.", lineNumber)
+    return firstOperand << secondOperand
+
+def rshift(firstOperand, secondOperand, lineNumber):
+    if (secondOperand < 0):
+        RuntimeError(f"Negative left operand not allowed for >>.", lineNumber)
+    return firstOperand >> secondOperand
+
+def exp(firstOperand, secondOperand, lineNumber):
+    if isinstance(firstOperand, int) and isinstance(secondOperand, int):
+        return firstOperand ** secondOperand
+    return floatValue(firstOperand ** secondOperand)
+
+BINARY_FUNCTIONS = {
+    "+": add,
+    "/": div,
+    "//": quot,
+    "<<": lshift,
+    ">>": rshift,
+    "^": exp,
+    "-": lambda firstOperand, secondOperand, lineNumber: firstOperand - secondOperand,
+    "*": lambda firstOperand, secondOperand, lineNumber: firstOperand * secondOperand,
+    "%": lambda firstOperand, secondOperand, lineNumber: firstOperand % secondOperand,
+    "&": lambda firstOperand, secondOperand, lineNumber: firstOperand & secondOperand,
+    "|": lambda firstOperand, secondOperand, lineNumber: firstOperand | secondOperand,
+    "<=": lambda firstOperand, secondOperand, lineNumber: firstOperand <= secondOperand,
+    "<": lambda firstOperand, secondOperand, lineNumber: firstOperand < secondOperand,
+    "==": lambda firstOperand, secondOperand, lineNumber: firstOperand == secondOperand,
+    ">": lambda firstOperand, secondOperand, lineNumber: firstOperand > secondOperand,
+    ">=": lambda firstOperand, secondOperand, lineNumber: firstOperand >= secondOperand,
+    "!=": lambda firstOperand, secondOperand, lineNumber: firstOperand != secondOperand,
+    "&&": lambda firstOperand, secondOperand, lineNumber: bool(firstOperand) and bool(secondOperand),
+    "||": lambda firstOperand, secondOperand, lineNumber: bool(firstOperand) or bool(secondOperand),
+}
+
+def invalid(v):
+    '''
+    Closure for a node sim.evaluate does not know, failing only when it is executed
+    '''
+    def run(scopes):
+        raise Exception(f"Got {v}, Expression|Statement Invalid")
+    return run
+
+class ClosureCompiler:
+    '''
+    Compiles an AST into closures taking the runtime Scopes
+    '''
+    def __init__(self):
+        # Compiled function bodies and field initializers by id of their (kept alive) node
+        self.compiled: Dict[int, tuple] = {}
+
+    def compiledFor(self, node):
+        '''
+        Returns the closure compiled for a function body or field initializer node
+        '''
+        entry = self.compiled.get(id(node))
+        if (entry == None):
+            entry = (node, self.compile(node))
+            self.compiled[id(node)] = entry
+        return entry[1]
+
+    def compile(self, program: AST):
+        compile_ = self.compile
+
+        match program:
+            case Variable():
+                var = program
+                def run(scopes):
+                    return scopes.getVariable(var)
+                return run
+
+            case Int(value) | Float(value) | Bool(value) | Str(value):
+                return lambda scopes: value
+
+            case nil():
+                return lambda scopes: None
+
+            case InstanceObject():
+                obj = program
+                return lambda scopes: obj
+
+            case This(lineNumber, id):
+                this = Variable(lineNumber, "this", id)
+                def run(scopes):
+                    return scopes.getVariable(this)
+                return run
+
+            case zArray() as arr:
+                # Array literals are evaluated in place (as in sim.evaluate), after which
+                # evaluating them again no longer changes the elements
+                elements = [compile_(element) for element in arr.elements]
+                evaluated = False
+                def run(scopes):
+                    nonlocal evaluated
+                    if (not evaluated):
+                        arr.elements = arrayStorage(arr.dtype, [element(scopes) for element in elements])
+                        evaluated = True
+                    return arr
+                return run
+
+            case Block(Seq(lines)):
+                # Running the lines of the block directly (one Python frame less per block)
+                lines = [compile_(line) for line in lines]
+                def run(scopes):
+                    scopes.beginScope()
+                    ans = None
+                    for line in lines:
+                        ans = line(scopes)
+                        if (isinstance(ans, Return)):
+                            break
+                    scopes.endScope()
+                    return ans
+                return run
+
+            case Block(blockStatements):
+                statements = compile_(blockStatements)
+                def run(scopes):
+                    scopes.beginScope()
+                    returnVal = statements(scopes)
+                    scopes.endScope()
+                    return returnVal
+                return run
+
+            case BinOp(lineNumber, "=", firstOperand, secondOperand):
+                var = firstOperand
+                value = compile_(secondOperand)
+                def run(scopes):
+                    return scopes.updateVariable(var, value(scopes))
+                return run
+
+            case BinOp(lineNumber, operator, firstOperand, secondOperand):
+                first = compile_(firstOperand)
+                second = compile_(secondOperand)
+                function = BINARY_FUNCTIONS.get(operator)
+                if (function == None):
+                    # Operators sim.evaluate does not implement evaluate to None
+                    def run(scopes):
+                        second(scopes)
+                        first(scopes)
+                    return run
+                def run(scopes):
+                    secondOperand = second(scopes)
+                    return function(first(scopes), secondOperand, lineNumber)
+                return run
+
+            case UnOp(lineNumber, "-", operand):
+                operand = compile_(operand)
+                def run(scopes):
+                    value = operand(scopes)
+                    if (isinstance(value, (int, Fraction, float))):
+                        return -value
+                return run
+
+            case UnOp(lineNumber, "~", operand):
+                operand = compile_(operand)
+                def run(scopes):
+                    return not operand(scopes)
+                return run
+
+            case UnOp(lineNumber, operator, operand):
+                operand = compile_(operand)
+                def run(scopes):
+                    operand(scopes)
+                return run
+
+            case Declare(lineNumber, var, value, dtype, isConst):
+                value = compile_(value)
+                isBool = dtype == Bool
+                def run(scopes):
+                    evaluated = value(scopes)
+                    if (isBool):
+                        evaluated = bool(evaluated)
+                    scopes.declareVariable(var, evaluated, dtype, isConst)
+                    return evaluated
+                return run
+
+            case If(lineNumber, condition, ifBlock, elseBlock):
+                condition = compile_(condition)
+                ifBlock = compile_(ifBlock)
+                elseBlock = compile_(elseBlock) if elseBlock != None else (lambda scopes: None)
+                def run(scopes):
+                    if (condition(scopes)):
+                        return ifBlock(scopes)
+                    return elseBlock(scopes)
+                return run
+
+            case Slice(lineNumber, value_, first, second):
+                value_ = compile_(value_)
+                first = compile_(first)
+                second = compile_(second)
+                def run(scopes):
+                    elem = value_(scopes)
+                    start = first(scopes)
+                    stop = second(scopes)
+                    if(not(isinstance(elem, zArray))):
+                        if (start>stop or start < 0 or stop > len(elem)):
+                            RuntimeError("Index out of bounds", lineNumber, "indexError")
+                        return elem[start:stop]
+                    else:
+                        if (start < 0 or start >= len(elem.elements)):
+                            RuntimeError("Index out of bounds", lineNumber, "indexError")
+                        if(stop is None):
+                            return elem.elements[start]
+                        if (start>stop or start < 0 or stop > len(elem.elements)):
+                            RuntimeError("Index out of bounds", lineNumber, "indexError")
+                        return sliceArray(elem, start, stop, lineNumber)
+                return run
+
+            case PRINT(lineNumber, print_stmt, sep, end, flush):
+                statements = [compile_(stmt) for stmt in print_stmt]
+                # Each value is followed by the separator, the last one by the end
+                ends = [sep.value] * (len(statements) - 1) + [end.value]
+                printed = list(zip(statements, ends))
+                flushed = compile_(flush)
+                write = OUTPUT.write
+                def run(scopes):
+                    for stmt, terminator in printed:
+                        out = stmt(scopes)
+                        if (out is None):
+                            continue
+                        if (isinstance(out, zArray)):
+                            writeArray(out, write)
+                            write(terminator)
+                        else:
+                            write(str(out) + terminator)
+                    if (flushed(scopes)):
+                        OUTPUT.flush()
+                    return None
+                return run
+
+            case Seq(lines):
+                lines = [compile_(line) for line in lines]
+                def run(scopes):
+                    ans = None
+                    for line in lines:
+                        ans = line(scopes)
+                        if (isinstance(ans, Return)):
+                            break
+                    return ans
+                return run
+
+            case While(lineNumber, condition, block):
+                return self.compileWhile(compile_(condition), compile_(block))
+
+            case For(lineNumber, initial, condition, block):
+                initial = compile_(initial)
+                loop = self.compileWhile(compile_(condition), compile_(block))
+                def run(scopes):
+                    scopes.beginScope()
+                    initial(scopes)
+                    retVal = loop(scopes)
+                    scopes.endScope()
+                    return retVal
+                return run
+
+            case array_append(lineNumber, element, var):
+                element = compile_(element)
+                def run(scopes):
+                    l = scopes.getVariable(var)
+                    value = element(scopes)
+                    if (l.shared):
+                        own(l)
+                    try:
+                        l.elements.append(value)
+                    except OverflowError:
+                        boxed(l).append(value)
+                    return None
+                return run
+
+            case array_remove(lineNumber, index, var):
+                index = compile_(index)
+                def run(scopes):
+                    l = scopes.getVariable(var)
+                    i = index(scopes)
+                    if (len(l.elements) <= i):
+                        RuntimeError(f"array index out of bounds", lineNumber, 'indexError')
+                    if (l.shared):
+                        own(l)
+                    return l.elements.pop(i)
+                return run
+
+            case array_len(lineNumber, var):
+                var = compile_(var)
+                def run(scopes):
+                    l = var(scopes)
+                    if(isinstance(l,zArray)):
+                        return len(l.elements)
+                    elif(isinstance(l,STRING_TYPES)):
+                        return len(l)
+                return run
+
+            case array_pop(lineNumber, array_name):
+                def run(scopes):
+                    l = scopes.getVariable(array_name)
+                    if (len(l.elements) == 0):
+                        RuntimeError(f"Cannot popout from an empty array", lineNumber, 'indexError')
+                    if (l.shared):
+                        own(l)
+                    return l.elements.pop()
+                return run
+
+            case array_builtin(lineNumber, name, args, operator):
+                function = ARRAY_BUILTINS[name]
+                args = [compile_(arg) for arg in args]
+                def run(scopes):
+                    return function([arg(scopes) for arg in args], operator, lineNumber)
+                return run
+
+            case array_insert(lineNumber, index, element, var):
+                element = compile_(element)
+                def run(scopes):
+                    l = scopes.getVariable(var)
+                    value = element(scopes)
+                    if (l.shared):
+                        own(l)
+                    try:
+                        l.elements.insert(index.value, value)
+                    except OverflowError:
+                        boxed(l).insert(index.value, value)
+                    return None
+                return run
+
+            case DeclareFun(lineNumber, f, return_type, params_type, params, body, function_type):
+                body = self.compiledFor(body)
+                def run(scopes):
+                    scopes.declareFun(f, FnObject(function_type, params_type, params, body, return_type))
+                    return None
+                return run
+
+            case Get(lineNumber, var, name, slot):
+                var = compile_(var)
+                if (slot != None):
+                    # Field resolved to its slot by the typechecker
+                    def run(scopes):
+                        obj = var(scopes)
+                        if (isinstance(obj, InstanceObject)):
+                            return obj.slots[slot]
+                    return run
+                def run(scopes):
+                    obj = var(scopes)
+                    if (isinstance(obj, InstanceObject)):
+                        field = None
+                        layout = classLayout(obj.zClass)
+                        if name in layout.slots:
+                            field = obj.slots[layout.slots[name]]
+                        elif name in obj.zClass.methods:
+                            field = obj.zClass.methods[name]
+                        else:
+                            RuntimeError(f"Instance of class {obj.zClass.name} has no attribute {name}", lineNumber, "attributeError")
+                        if (isinstance(field, DeclareFun)):
+                            # this is bound when the method is called
+                            return boundMethod(obj, name)
+                        return field
+                return run
+
+            case Set(lineNumber, var, name, value, slot):
+                var = compile_(var)
+                value = compile_(value)
+                def run(scopes):
+                    obj = var(scopes)
+                    evaluated = value(scopes)
+                    if (isinstance(obj, InstanceObject)):
+                        if (slot != None):
+                            obj.slots[slot] = evaluated
+                        elif name in classLayout(obj.zClass).slots:
+                            obj.slots[classLayout(obj.zClass).slots[name]] = evaluated
+                        else:
+                            RuntimeError(f"Instance of class {obj.zClass.name} has no attribute {name}", lineNumber, "attributeError")
+                return run
+
+            case AtIndex(lineNumber, var, index):
+                var = compile_(var)
+                index = compile_(index)
+                def run(scopes):
+                    obj = var(scopes)
+                    i = index(scopes)
+                    if (isinstance(obj, zArray)):
+                        elements = obj.elements
+                        if (i < 0 or i >= len(elements)):
+                            RuntimeError("Index out of bounds", lineNumber, "indexError")
+                        if (elements.__class__ is BoolArray):
+                            return byteAt(elements, i) != 0
+                        return elements[i]
+                    elif (isinstance(obj, STRING_TYPES)):
+                        if (i < 0 or i >= len(obj)):
+                            RuntimeError("Index out of bounds", lineNumber, "indexError")
+                        return obj[i]
+                return run
+
+            case SetAtIndex(lineNumber, target, index, value):
+                var = compile_(target)
+                index = compile_(index)
+                value = compile_(value)
+                def run(scopes):
+                    obj = var(scopes)
+                    i = index(scopes)
+                    evaluated = value(scopes)
+                    if (isinstance(obj, zArray)):
+                        if (i < 0 or i >= len(obj.elements)):
+                            RuntimeError("Index out of bounds", lineNumber, "indexError")
+                        if (obj.shared):
+                            own(obj)
+                        try:
+                            obj.elements[i] = evaluated
+                        except OverflowError:
+                            boxed(obj)[i] = evaluated
+                    elif (isinstance(obj, STRING_TYPES)):
+                        if (i < 0 or i >= len(obj)):
+                            RuntimeError("Index out of bounds", lineNumber, "indexError")
+                        storeString(target, replacedCharacter(obj, i, evaluated), scopes)
+                return run
+
+            case DeclareClass(lineNumber, var, stmts, thisID):
+                # Compiling the methods (into the method table) and the field initializers up front
+                functions = methodTable(stmts, self.compiledFor)
+                layout = instanceLayout(stmts, lambda stmt: self.compiledFor(stmt.value))
+                def run(scopes):
+                    classObj = ClassObject(var.name, stmts, thisID, functions, layout)
+                    scopes.declareVariable(var, classObj, ClassObject, False)
+                return run
+
+            case FunCall(lineNumber, f, args):
+                return self.compileFunCall(program, compile_(f), [compile_(arg) for arg in args])
+
+            case Return(lineNumber, FunCall(_, f, args, True)):
+                # Leaving the call in tail position to the caller (see compileFunCall)
+                function = f
+                f = compile_(f)
+                args = [compile_(arg) for arg in args]
+                def run(scopes):
+                    fn = f(scopes)
+                    argv = [arg(scopes) for arg in args]
+                    CALLS[-1] = (function, CALLS[-1][1])
+                    return TailCall(lineNumber, fn, argv)
+                return run
+
+            case Return(lineNumber, value):
+                value = compile_(value)
+                def run(scopes):
+                    return Return(lineNumber, value(scopes))
+                return run
+
+            # Elements of array literals the tree-walker already replaced by their values
+            case int() | float() | str() | Fraction() | None:
+                value = program
+                return lambda scopes: value
+
+            # Handling unknown expressions
+            case _ as v:
+                return invalid(v)
+
+    def compileWhile(self, condition, block):
+        def run(scopes):
+            isreturn = None
+            while(not isinstance(isreturn, Return) and condition(scopes)):
+                isreturn = block(scopes)
+            return isreturn
+        return run
+
+    def compileFunCall(self, program: FunCall, f, args):
+        frame = (program.fn, program.lineNumber)
+        def call(fn, scopes):
+            bound = None
+            if (isinstance(fn, BoundMethod)):
+                bound = fn
+                fn = bound.fn
+
+            argv = [arg(scopes) for arg in args]
+
+            CALLS.append(frame)
+            while True:
+                scopes.beginScope()
+                if (bound != None):
+                    bindMethod(bound, scopes)
+                params = fn.params
+                params_types = fn.params_types
+                for i in range(len(params)):
+                    scopes.declareVariable(params[i], argv[i], params_types[i], False)
+
+                returnVal = fn.body(scopes)
+
+                scopes.endScope()
+
+                if (not isinstance(returnVal, TailCall)):
+                    break
+                # Making the call in tail position in place of the returning function
+                fn = returnVal.value
+                argv = returnVal.argv
+                bound = None
+            CALLS.pop()
+
+            if (isinstance(returnVal, Return)):
+                return returnVal.value
+            return None
+
+        def run(scopes):
+            fn = f(scopes)
+
+            # Checking if it is a class instantiation
+            if (isinstance(fn, ClassObject)):
+                # Copying the template of the instance, evaluating the non constant fields into its slots
+                layout = classLayout(fn)
+                instanceFields = layout.template.copy()
+                for slot, initializer in layout.initializers:
+                    instanceFields[slot] = initializer(layout.scopes)
+
+                # Creating the instance object from the class object
+                obj = InstanceObject(fn, instanceFields)
+
+                # Calling the initialization method(if present)
+                if "init" in fn.methods:
+                    call(boundMethod(obj, "init"), scopes)
+
+                # overriding the return from the init function
+                return obj
+
+            return call(fn, scopes)
+        return run
+
+def compileAST(program: AST):
+    '''
+    Compiles the given AST into a closure to be called with the runtime Scopes
+    '''
+    return ClosureCompiler().compile(program)
+
+def evaluateCompiled(program: AST, scopes: Scopes = None):
+    '''
+    Evaluates the given AST through its compiled closures
+    '''
+    if (scopes == None):
+        scopes = Scopes()
+    return compileAST(program)(scopes)
@@ -5,31 +5,46 @@ def test():
     b = Int(20)
     c = 1
     d = 20
-    v=VM()
-    l=[BinOp("-", a,b),BinOp("+", a,b),BinOp("*", a,b),BinOp("/", a,b),BinOp("//", a,b),BinOp("%", a,b),
-        UnOp("-", a),BinOp("<", a,b),BinOp(">", a,b),BinOp("^",a,b)]
-    m=[Int(c-d),Int(c+d),Int(c*d),Float(c/d),Int(c//d),Int(c%d),Int(-1*c),Bool(c<d),Bool(c>d),Int(c^d)]
-    for i in range(7):
-        v.load(codegen(l[i]))
-        if(m[i]!=v.execute()):
+    l=[BinOp(1, "-", a,b),BinOp(1, "+", a,b),BinOp(1, "*", a,b),BinOp(1, "/", a,b),BinOp(1, "//", a,b),BinOp(1, "%", a,b),
+        UnOp(1, "-", a),BinOp(1, "<", a,b),BinOp(1, ">", a,b),BinOp(1, "^",a,b)]
+    m=[c-d,c+d,c*d,Fraction(c/d),int(c/d),c%d,-1*c,c<d,c>d,c**d]
+    for i in range(len(l)):
+        if(m[i]!=run(codegen(l[i]))):
             print("Test Failed: ", i+1)
             return -1
     print("All BinOp and UnOp tests passed")
 
-    condition = Seq([BinOp("<", Int(5), Int(20))])
-    v.load(codegen(If(condition,Int(10), Int(20))))
-    if (v.execute() != Int(10)):
+    condition = Seq([BinOp(1, "<", Int(5), Int(20))])
+    if (run(codegen(If(1, condition,Int(10), Int(20)))) != 10):
         print("Basic evaluation of If failed")
         exit()
     print("tests for if passed")
 
 
-    v.load(codegen(PRINT([BinOp("+",Int(10),Int(30)),Int(20),Str("Hi")])))
-    if (v.execute() != None):
+    if (run(codegen(PRINT(1, [BinOp(1, "+",Int(10),Int(30)),Int(20),Str("Hi")], Str(' '), Str('\n')))) != None):
         print("Basic evaluation of PRINT failed")
         exit()
     print("tests for PRINT passed")
 
-    
+    # var int x = 1; x = x + 20; x
+    x = Variable(1, "x", 0)
+    program = Seq([Declare(1, x, a, Int, False), BinOp(1, "=", x, BinOp(1, "+", x, b)), x])
+    code = codegen(program)
+    if (run(code) != 21 or not any(isinstance(instruction, I.INC_LOCAL) for instruction in code.inst)):
+        print("Peephole optimization failed")
+        exit()
+    print("tests for peephole passed")
+
+    # Frames of functions with more local variables take more of the memory budget
+    from parser import parse
+    from resolver import resolve
+    program = resolve(parse("func int f(int n) { var int x = n + 1; return x; } func int g(int n) { return n; }"))
+    f, g = (codegen_function(declaration) for declaration in program.lines)
+    if (g.body.frameBytes != FRAME_BYTES + LOCAL_BYTES or f.body.frameBytes != FRAME_BYTES + 2 * LOCAL_BYTES):
+        print("Estimating the memory of the call frames failed")
+        exit()
+    print("tests for the memory budget passed")
+
+
 if (__name__ == "__main__"):
-    test()
\ No newline at end of file
+    test()
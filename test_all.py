@@ -3,11 +3,19 @@ Run this file to get perform all the checks
 '''
 
 import os # to get the test file names at the run time
+import sys
+import shutil
 from importlib import import_module
 import io
 from contextlib import redirect_stdout
 from zebra import executeFile
 
+# Engine to run the tests on (python test_all.py --engine=closure)
+engine = "tree"
+for arg in sys.argv[1:]:
+    if arg.startswith("--engine="):
+        engine = arg[len("--engine="):]
+
 # Get the list of all the file names in the tests folder
 files = list (os.listdir("tests/"))
 
@@ -45,7 +53,7 @@ for test_file in files:
         # Redirecting the output to a string
         f = io.StringIO()
         with redirect_stdout(f):
-            executeFile("tests/" + test_file)
+            executeFile("tests/" + test_file, engine)
         out = f.getvalue().strip()
         
         # Print the output
@@ -59,7 +67,7 @@ for test_file in files:
             else:
                 tests_fail.append(test_file)
         
-        print("\033[04m" + (" " * os.get_terminal_size().columns) + "\033[0m")
+        print("\033[04m" + (" " * shutil.get_terminal_size().columns) + "\033[0m")
 
 # Display the failed and the succeded test cases
 for test_file in tests_succeed:
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import time
+import cache
+
+def test():
+    directory = cache.CACHE_DIR
+    with tempfile.TemporaryDirectory() as cache.CACHE_DIR:
+        key = cache.cacheKey("zout(1);", "fraction")
+        if (key == cache.cacheKey("zout(1);", "double") or key == cache.cacheKey("zout(2);", "fraction")):
+            print("Cache keys do not depend on the source and float mode")
+            exit()
+
+        if (cache.load(key) != None or not cache.store(key, [1, 2, 3]) or cache.load(key) != [1, 2, 3]):
+            print("Caching a program failed")
+            exit()
+
+        # Unreadable entries are invalidated
+        with open(cache.entryPath(key), 'wb') as file:
+            file.write(b"corrupted")
+        if (cache.load(key) != None or os.path.exists(cache.entryPath(key))):
+            print("Invalidating a corrupted entry failed")
+            exit()
+
+        # Evicting the least recently used entries first
+        keys = [cache.cacheKey(f"zout({i});", "fraction") for i in range(3)]
+        for i, key in enumerate(keys):
+            cache.store(key, "x" * 1000)
+            os.utime(cache.entryPath(key), (time.time() - 10 + i, time.time() - 10 + i))
+        cache.load(keys[0])
+        cache.evict(2 * os.path.getsize(cache.entryPath(keys[0])))
+        if ([os.path.exists(cache.entryPath(key)) for key in keys] != [True, False, True]):
+            print("LRU eviction failed")
+            exit()
+    cache.CACHE_DIR = directory
+    print("tests for the cache passed")
+
+if (__name__ == "__main__"):
+    test()
@@ -0,0 +1,58 @@
+import io
+import mmap
+import tempfile
+from lexer import Lexer, Stream, String, EOF, tokenize
+
+PROGRAM = '''  
+@ Sum of the numbers
+var int total = 0;
+$ a comment $
+for (var int i = 0; i < 10; i = i + 1) {
+    total = total + i * 2.5;
+}
+zout("total:\\t", total, 'it''s', sep = "\\n");
+
+'''
+
+def tokens(stream: Stream) -> list:
+    lexer = Lexer.from_stream(stream)
+    result = []
+    while True:
+        token = lexer.next_token()
+        result.append((token, lexer.lineNumber))
+        if isinstance(token, EOF):
+            return result
+
+def test():
+    expected = tokens(Stream.from_string(PROGRAM.strip()))
+    if (expected != tokenize(PROGRAM.strip())):
+        print("Tokenizing the program failed")
+        exit()
+
+    # Streamed in chunks of any size (stripped like the string)
+    for size in [1, 2, 3, 5, 64]:
+        if (tokens(Stream.from_file(io.StringIO(PROGRAM), size)) != expected):
+            print(f"Lexing the program in chunks of {size} failed")
+            exit()
+    with tempfile.TemporaryFile() as file:
+        file.write(PROGRAM.replace("\n", "\r\n").encode())
+        file.flush()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            if (tokens(Stream.from_file(source, 7)) != expected):
+                print("Lexing an mmap failed")
+                exit()
+
+    # Escapes are decoded inside the strings only
+    strings = [token.val for token, _ in expected if isinstance(token, String)]
+    if (strings != ["total:\t", "it", "s", "\n"]):
+        print("Decoding the escapes of the strings failed")
+        exit()
+
+    # Whitespace does not recurse
+    if (len(tokenize("zout(1);" + " " * 100000 + "\n" * 100000)) != 6):
+        print("Lexing long whitespace failed")
+        exit()
+    print("tests for the lexer passed")
+
+if (__name__ == "__main__"):
+    test()
@@ -0,0 +1,68 @@
+import io
+import re
+from contextlib import redirect_stdout
+import sim
+from parser import parse
+from resolver import resolve, ResolverScopes
+from typechecking import typecheckAST
+from output import OUTPUT
+from profiler import Profiler, Sampler, MAIN
+from zebra import ENGINES
+
+PROGRAM = '''func int fib(int n) {
+    if (n < 2) {
+        return n;
+    }
+    return fib(n - 1) + fib(n - 2);
+}
+zout(fib(10));'''
+
+def test():
+    program = resolve(parse(PROGRAM), ResolverScopes())
+    typecheckAST(program, sim.Scopes())
+    profiler = Profiler()
+    with redirect_stdout(io.StringIO()):
+        profiler.run(program, sim.Scopes())
+        OUTPUT.flush()
+    profile = profiler.toJSON("fib", PROGRAM)
+    if (sim.evaluate.__name__ != "evaluate" or sim.Scopes.lookup.__name__ != "lookup"):
+        print("The evaluator was not restored after profiling")
+        exit()
+
+    functions = {function["name"]: function for function in profile["functions"]}
+    if (functions["fib"]["calls"] != 177 or functions[MAIN]["calls"] != 1):
+        print("Counting the function calls failed")
+        exit()
+    if (functions["fib"]["inclusive"] > profile["total"] or functions["fib"]["exclusive"] > functions["fib"]["inclusive"]):
+        print("Timing the function calls failed")
+        exit()
+
+    lines = {line["line"]: line for line in profile["lines"]}
+    if (lines[5]["source"] != "return fib(n - 1) + fib(n - 2);" or lines[2]["variableLookups"] != 177 or lines[2]["scopeEntries"] != 177):
+        print("Counting the evaluations by line failed")
+        exit()
+    print("tests for the profiler passed")
+
+def testSampler():
+    for engine, evaluate in ENGINES.items():
+        program = resolve(parse(PROGRAM.replace("fib(10)", "fib(18)")), ResolverScopes())
+        typecheckAST(program, sim.Scopes())
+        sampler = Sampler(0.001)
+        with redirect_stdout(io.StringIO()):
+            sampler.run(program, sim.Scopes(), evaluate)
+            OUTPUT.flush()
+        stacks = sampler.collapsed()
+        if (sampler.samples == 0 or sum(stacks.values()) != sampler.samples or len(sim.CALLS) != 0):
+            print(f"Sampling the program on the {engine} engine failed")
+            exit()
+
+        # Every fib is called from line 7 or from line 5 of the fib calling it
+        for collapsed in stacks:
+            if (re.fullmatch(rf"{MAIN}(:7(;fib:5)*;fib)?", collapsed) == None):
+                print(f"Sampling the stack on the {engine} engine failed: {collapsed}")
+                exit()
+    print("tests for the sampler passed")
+
+if (__name__ == "__main__"):
+    test()
+    testSampler()
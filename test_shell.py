@@ -0,0 +1,39 @@
+import builtins
+import io
+from contextlib import redirect_stdout
+import zebra
+from output import OUTPUT
+
+# Lines typed into the interactive shell (tests/shell_*.zebra), and their output (tests/shell_*.out)
+SCRIPTS = ["shell_array_builtins"]
+
+def shell(lines: list, engine: str) -> str:
+    '''
+    Output of the interactive shell given the lines, one input each
+    '''
+    inputs = iter(lines + ["exit", ""])
+    prompt = builtins.input
+    builtins.input = lambda message = "": next(inputs)
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            zebra.interactiveShell(engine)
+            OUTPUT.flush()
+    finally:
+        builtins.input = prompt
+    return output.getvalue()
+
+def test():
+    for script in SCRIPTS:
+        with open(f"tests/{script}.zebra", 'r') as file:
+            lines = file.read().strip().split("\n")
+        with open(f"tests/{script}.out", 'r') as file:
+            expected = file.read()
+        for engine in zebra.ENGINES:
+            if (shell(lines, engine) != expected):
+                print(f"Running tests/{script}.zebra in the shell on the {engine} engine failed")
+                exit()
+    print("tests for the interactive shell passed")
+
+if (__name__ == "__main__"):
+    test()
@@ -0,0 +1,44 @@
+import io
+from contextlib import redirect_stdout
+import sim
+import zebra
+from resolver import ResolverScopes
+from output import OUTPUT
+
+PROGRAM = '''func int square(int n) {
+    return n * n;
+}
+var int total = 0;
+for (var int i = 1; i < 4; i = i + 1) {
+    total = total + square(i);
+}
+zout(total);
+'''
+
+def run(program: str, engine: str) -> str:
+    output = io.StringIO()
+    with redirect_stdout(output):
+        zebra.isError = False
+        zebra.execute(program, ResolverScopes(), sim.Scopes(), sim.Scopes(), engine, streaming=True)
+        OUTPUT.flush()
+    return output.getvalue()
+
+def test():
+    for engine in zebra.ENGINES:
+        if (run(PROGRAM, engine) != "14\n"):
+            print(f"Running the statements one at a time on the {engine} engine failed")
+            exit()
+
+        # The statements before an error have run, the ones after have not
+        output = run(PROGRAM + "zout(undeclared);\nzout(1);", engine)
+        if (not output.startswith("14\n") or output.endswith("1\n") or not zebra.isError):
+            print(f"Stopping at a resolve error on the {engine} engine failed")
+            exit()
+        output = run(PROGRAM + "zout(;\nzout(1);", engine)
+        if (not output.startswith("14\n") or output.endswith("1\n") or not zebra.isError):
+            print(f"Stopping at a parse error on the {engine} engine failed")
+            exit()
+    print("tests for the streaming execution passed")
+
+if (__name__ == "__main__"):
+    test()
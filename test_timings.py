@@ -0,0 +1,74 @@
+import io
+from contextlib import redirect_stdout
+import sim
+from zebra import execute
+from resolver import ResolverScopes
+from output import OUTPUT
+from lexer import tokenize
+from timings import Timings
+
+PROGRAM = '''var int total = 0;
+for (var int i = 0; i < 10; i = i + 1) {
+    total = total + i;
+}
+zout(total);'''
+
+# Boxing an array, a slice of it and the results of the calls
+BOXING = '''var array(int) a = array(int){1, 2, 3};
+var array(int) b = slice a 0:2;
+func int f(int n) {
+    return n;
+}
+zout(f(1), b);'''
+
+def run(timings: Timings, program: str = PROGRAM) -> str:
+    output = io.StringIO()
+    with redirect_stdout(output):
+        execute(program, ResolverScopes(), sim.Scopes(), sim.Scopes(), timings=timings)
+        OUTPUT.flush()
+    return output.getvalue()
+
+def test():
+    timings = Timings()
+    if (run(timings) != "45\n"):
+        print("Running the program through the timed phases failed")
+        exit()
+
+    if (list(timings.phases) != ["cache", "lex", "parse", "resolve", "typecheck", "evaluate"]):
+        print("Timing the phases failed")
+        exit()
+    for phase in timings.phases.values():
+        if (phase.wall < 0 or phase.cpu < 0 or phase.peakMemory < 0):
+            print(f"Timing the {phase.name} phase failed")
+            exit()
+    if (timings.phases["parse"].peakMemory == 0):
+        print("Tracing the memory of the phases failed")
+        exit()
+
+    counters = timings.counters
+    if (counters["tokens"] != len(tokenize(PROGRAM)) or counters["nodes"] == 0 or counters["scopes"] < 10):
+        print("Counting the work of the phases failed")
+        exit()
+    if (sim.Scopes.beginScope.__name__ != "beginScope" or sim.Int.__init__.__qualname__.startswith("AllocationCounter")):
+        print("The evaluator was not restored after counting")
+        exit()
+
+    timings = Timings()
+    run(timings, BOXING)
+    if (timings.counters["boxed"] < 3):
+        print("Counting the boxed objects failed")
+        exit()
+
+    # Only the times
+    timings = Timings(detailed=False)
+    run(timings)
+    if (timings.phases["evaluate"].peakMemory != 0 or timings.counters["scopes"] != 0):
+        print("Leaving out the details failed")
+        exit()
+    if (set(timings.toJSON()) != {"phases", "counters"}):
+        print("Converting the timings failed")
+        exit()
+    print("tests for the timings passed")
+
+if (__name__ == "__main__"):
+    test()
@@ -0,0 +1,159 @@
+'''
+Instrumentation of the phases of zebra.execute (zebra.py --timings)
+
+Timings records the wall time, the CPU time and the peak memory allocated (traced by tracemalloc)
+of each phase run: lex, parse, resolve, typecheck (or cache, when the typechecked program is
+loaded from the cache) and evaluate, along with counters of the work done: the tokens lexed, the
+nodes of the program, and the scopes entered and boxed objects allocated while evaluating it.
+The boxed objects are the instances of COUNTED_CLASSES: the arrays, strings being built, slices,
+functions, instances, bound methods and returns, and the literals of the program. The ints,
+floats, booleans and strings computed at runtime are native Python values, not counted.
+Tracing the memory and counting the scopes and values slow the phases down, so that they can be
+left out (detailed=False) for the times alone.
+'''
+import gc
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, fields, is_dataclass
+import sim
+
+# Classes whose instances (the boxed objects) are counted while running a program
+COUNTED_CLASSES = [
+    sim.Int, sim.Float, sim.Bool, sim.Str, sim.nil,
+    sim.zArray, sim.ArrayView, sim.StrBuilder, sim.Return, sim.TailCall,
+    sim.FnObject, sim.BoundMethod, sim.InstanceObject,
+]
+
+@dataclass
+class Phase:
+    name: str
+    wall: float = 0.0       # Seconds
+    cpu: float = 0.0        # Seconds
+    peakMemory: int = 0     # Bytes allocated at the peak, over those allocated before the phase
+
+class AllocationCounter:
+    '''
+    Context manager counting the instances of COUNTED_CLASSES created inside it
+    '''
+    def __enter__(self):
+        self.counts = {cls.__name__: 0 for cls in COUNTED_CLASSES}
+        self.originals = {}
+        for cls in COUNTED_CLASSES:
+            self.originals[cls] = cls.__init__
+            cls.__init__ = self.counting(cls.__name__, cls.__init__)
+        self.collections = gc.get_stats()[0]["collections"]
+        return self
+
+    def counting(self, name, init):
+        counts = self.counts
+        def __init__(*args, **kwargs):
+            counts[name] += 1
+            init(*args, **kwargs)
+        return __init__
+
+    def __exit__(self, *exc):
+        self.collections = gc.get_stats()[0]["collections"] - self.collections
+        for cls, init in self.originals.items():
+            cls.__init__ = init
+
+def countNodes(program) -> int:
+    '''
+    Number of nodes (dataclass instances) reachable from the given program
+    '''
+    count = 0
+    seen = set()
+    pending = [program]
+    while (len(pending) != 0):
+        node = pending.pop()
+        if (isinstance(node, (list, tuple))):
+            pending.extend(node)
+        elif (is_dataclass(node) and not isinstance(node, type) and id(node) not in seen):
+            seen.add(id(node))
+            count += 1
+            pending.extend(getattr(node, field.name) for field in fields(node))
+    return count
+
+class Timings:
+    '''
+    Phases (by name, in the order they were first run) and counters of the execution of a program
+    '''
+    def __init__(self, detailed: bool = True):
+        self.detailed = detailed
+        self.phases = {}
+        self.counters = {"tokens": 0, "nodes": 0, "scopes": 0, "boxed": 0}
+
+    @contextmanager
+    def phase(self, name: str):
+        '''
+        Context manager adding the time (and memory) taken inside it to the given phase
+        '''
+        phase = self.phases.get(name)
+        if (phase == None):
+            phase = self.phases[name] = Phase(name)
+        tracing = self.detailed and not tracemalloc.is_tracing()
+        if (tracing):
+            tracemalloc.start()
+        if (self.detailed):
+            tracemalloc.reset_peak()
+            memory = tracemalloc.get_traced_memory()[0]
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield phase
+        finally:
+            phase.wall += time.perf_counter() - wall
+            phase.cpu += time.process_time() - cpu
+            if (self.detailed):
+                phase.peakMemory = max(phase.peakMemory, tracemalloc.get_traced_memory()[1] - memory)
+            if (tracing):
+                tracemalloc.stop()
+
+    @contextmanager
+    def evaluation(self):
+        '''
+        Context manager timing the evaluate phase, counting the scopes entered and the boxed
+        objects allocated inside it
+        '''
+        if (not self.detailed):
+            with self.phase("evaluate"):
+                yield
+            return
+
+        beginScope = sim.Scopes.beginScope
+        counters = self.counters
+        def countedBeginScope(scopes: 'sim.Scopes'):
+            counters["scopes"] += 1
+            beginScope(scopes)
+
+        sim.Scopes.beginScope = countedBeginScope
+        try:
+            with AllocationCounter() as allocations, self.phase("evaluate"):
+                yield
+        finally:
+            sim.Scopes.beginScope = beginScope
+            counters["boxed"] += sum(allocations.counts.values())
+
+    def toJSON(self) -> dict:
+        '''
+        Phases and counters as a JSON serializable dictionary
+        '''
+        return {
+            "phases": [{"name": phase.name, "wall": phase.wall, "cpu": phase.cpu, "peakMemory": phase.peakMemory}
+                       for phase in self.phases.values()],
+            "counters": dict(self.counters),
+        }
+
+    def report(self, path: str = None, file = None):
+        '''
+        Writes the table of the phases and the counters (to stderr by default)
+        '''
+        file = file if file != None else sys.stderr
+        print(f"Timings of {path or 'the program'}:", file=file)
+        print(f"{'phase':<10} {'wall':>10} {'cpu':>10} {'peak memory':>14}", file=file)
+        for phase in self.phases.values():
+            memory = f"{phase.peakMemory / 1024:,.1f}K" if self.detailed else "-"
+            print(f"{phase.name:<10} {phase.wall * 1000:>8.2f}ms {phase.cpu * 1000:>8.2f}ms {memory:>14}", file=file)
+        counters = self.counters if self.detailed else {name: self.counters[name] for name in ("tokens", "nodes")}
+        print(", ".join(f"{name}={count:,}" for name, count in counters.items()), file=file)
@@ -32,18 +32,18 @@ Number = Int | Float
 
 def createDummyObject(type_ : type):
     '''
-    Utility to Create a dummy(useles) object from the given type
+    Utility to Create a dummy(useles) runtime value from the given type
     '''
     if type_ == Int:
-        return Int(0)
+        return 0
     elif type_ == Bool:
-        return Bool(False)
+        return False
     elif type_ == Str:
-        return Str("")
+        return ""
     elif type_ == Float:
-        return Float(0)
+        return floatValue(0)
     elif type_ == nil:
-        return nil()
+        return None
 
 
 def typecheckAST(program: AST, scopes: Scopes):
@@ -227,7 +227,7 @@ def typecheck(program: AST, scopes = None):
                         scopes.updateVariable(firstOperand, zArray(lineNumber, secondOperandType.dtype, []))
                         return secondOperandType
                     elif (isinstance(secondOperandType, instanceType)):
-                        scopes.updateVariable(firstOperand, InstanceObject(secondOperandType.name, {}))
+                        scopes.updateVariable(firstOperand, InstanceObject(secondOperandType.name, []))
                         return secondOperandType
                     scopes.updateVariable(firstOperand, createDummyObject(secondOperandType))
                     return secondOperandType
@@ -274,7 +274,7 @@ def typecheck(program: AST, scopes = None):
                 at = typecheck(value, scopes)
                 if (at != dtype):
                     typeCheckError(f"Cannot initialize {dtype} with {at}.", lineNumber)
-                scopes.declareVariable(var, nil(), dtype, isConst)
+                scopes.declareVariable(var, None, dtype, isConst)
 
             else:
                 # Evaluating the expression before declaration
@@ -284,10 +284,10 @@ def typecheck(program: AST, scopes = None):
                         if ((isinstance(value, type)) or not isinstance(value, instanceType)):
                             typeCheckError(f"Cannot initialize {dtype.name} with {value}.", lineNumber)
                         dec.dtype = instanceType(scopes.getVariable(dtype.name))
-                        scopes.declareVariable(var, InstanceObject(value.name, {}), instanceType(scopes.getVariable(dtype.name)), isConst)
+                        scopes.declareVariable(var, InstanceObject(value.name, []), instanceType(scopes.getVariable(dtype.name)), isConst)
                     else:
                         dec.dtype = instanceType(scopes.getVariable(dtype.name))
-                        scopes.declareVariable(var, nil(), instanceType(scopes.getVariable(dtype.name)), isConst)
+                        scopes.declareVariable(var, None, instanceType(scopes.getVariable(dtype.name)), isConst)
                 else:
                     scopes.declareVariable(var, createDummyObject(value), dtype, isConst)
             return dtype
@@ -328,7 +328,7 @@ def typecheck(program: AST, scopes = None):
             scopes.endScope()
             return retType
         
-        case Set(lineNumber, var, name, value):
+        case Set(lineNumber, var, name, value) as st:
             # Type check the value
             tv = typecheck(value, scopes)
             # Type check the variable and get the instanceType of the object
@@ -336,6 +336,8 @@ def typecheck(program: AST, scopes = None):
             # Cheking if the returned value is an instanceType
             if (isinstance(var, type) or (not isinstance(var, instanceType))):
                 typeCheckError(f"Expected an instance", lineNumber)
+            # Resolving the field to its slot in the instances
+            st.slot = classLayout(var.name).slots.get(name)
             for stmt in list(var.name.methods.values()):
                 if (isinstance(stmt, Declare)):
                     if (stmt.var.name == name):
@@ -360,9 +362,12 @@ def typecheck(program: AST, scopes = None):
                 ret.append(nil)
             return ret
         
-        case PRINT(lineNumber, exps, sep,end):
+        case PRINT(lineNumber, exps, sep, end, flush):
             sep = typecheck(sep, scopes)
             end = typecheck(end, scopes)
+            flush = typecheck(flush, scopes)
+            if (not (isinstance(flush, type) and issubclass(flush, Bool))):
+                typeCheckError(f"Invalid flush {flush} in PRINT, expected a boolean", lineNumber)
             for exp in exps:
                 exp = typecheck(exp, scopes)
                 if (not issubclass(sep, Str)):
@@ -402,6 +407,40 @@ def typecheck(program: AST, scopes = None):
             else:
                 return var_type.dtype[1]
             
+        case array_builtin(lineNumber, name, args, operator):
+            argTypes = [typecheck(arg, scopes) for arg in args]
+            # map and fill take the array last, after the scalar
+            arrays = argTypes[1:] if name in ["map", "fill"] else argTypes
+            for arrType in arrays:
+                if (isinstance(arrType, type) or not isinstance(arrType, arrayType)):
+                    typeCheckError(f"Expected an array for {name}.", lineNumber)
+            # Types of the elements (None for the arrays of arrays or instances)
+            elements = [arrType.dtype[1] if len(arrType.dtype) == 2 and isinstance(arrType.dtype[1], type) else None for arrType in arrays]
+
+            match name:
+                case "sum" | "dot" | "map":
+                    for element in elements:
+                        if (element not in [Int, Float]):
+                            typeCheckError(f"{name} is only defined for arrays of numbers, not {arrays[0]}.", lineNumber)
+                    if (name == "sum"):
+                        return elements[0]
+                    if (name == "dot"):
+                        return Float if Float in elements else Int
+                    scalar = argTypes[0]
+                    if (scalar not in [Int, Float]):
+                        typeCheckError(f"Cannot map {operator} with a value of type {scalar} over an array.", lineNumber)
+                    return arrayType([zArray, Float if (operator == "/" or Float in [scalar, elements[0]]) else Int])
+                case "min" | "max":
+                    if (elements[0] not in [Int, Float, Str]):
+                        typeCheckError(f"{name} is only defined for arrays of numbers and strings, not {arrays[0]}.", lineNumber)
+                    return elements[0]
+                case "fill":
+                    if (elements[0] not in [Int, Float, Str, Bool] or argTypes[0] != elements[0]):
+                        typeCheckError(f"Cannot fill {arrays[0]} with a value of type {argTypes[0]}.", lineNumber)
+                    return nil
+                case "reverse":
+                    return nil
+
         case array_len(lineNumber, l):
             l = typecheck(l, scopes)
             if (not isinstance(l, type) and isinstance(l, arrayType)) or (issubclass(l, Str)):
@@ -458,9 +497,9 @@ def typecheck(program: AST, scopes = None):
             # 2. Initialize all the params using a dummy object
             for param, param_type in zip(params, params_type):
                 if (not isinstance(param_type, type) and isinstance(param_type, instanceType)):
-                    scopes.declareVariable(param, InstanceObject(param_type.name, {}), param_type, False)
+                    scopes.declareVariable(param, InstanceObject(param_type.name, []), param_type, False)
                 elif (not isinstance(param_type, type) and isinstance(param_type, arrayType)):
-                    scopes.declareVariable(param, nil(), param_type, False)
+                    scopes.declareVariable(param, None, param_type, False)
                 else:
                     scopes.declareVariable(param, createDummyObject(param_type), param_type, False)
 
@@ -568,7 +607,7 @@ def typecheck(program: AST, scopes = None):
             scopes.beginScope()
             
             # Declaring a dummy this variable
-            scopes.declareVariable(Variable(lineNumber, "this", thisID), InstanceObject(classObj, {}), instanceType(classObj), False)
+            scopes.declareVariable(Variable(lineNumber, "this", thisID), InstanceObject(classObj, []), instanceType(classObj), False)
 
             for stmt in stmts:
                 stmt = stmts[stmt]
@@ -579,7 +618,7 @@ def typecheck(program: AST, scopes = None):
                         value = createDummyObject(value)
                     if ((not isinstance(stmt.dtype, type)) and isinstance(stmt.dtype, instanceType)):
                         stmt.dtype = instanceType(scopes.getVariable(stmt.dtype.name))
-                    scopes.getVariable(Variable(lineNumber, "this", thisID)).fields[stmt.var.name] = [value , stmt.dtype, stmt.isConst]
+                    scopes.getVariable(Variable(lineNumber, "this", thisID)).slots.append(value)
                 elif isinstance(stmt, DeclareFun):
                     typecheck(stmt, scopes)
                 else:
@@ -589,7 +628,7 @@ def typecheck(program: AST, scopes = None):
             
             return nil
         
-        case Get(lineNumber, var, name):
+        case Get(lineNumber, var, name) as g:
             obj =  typecheck(var, scopes)
             if isinstance(obj, type) or not isinstance(obj, instanceType):
                 raise typeCheckError(f"Cannot access field {name} on {obj}", lineNumber, "AttributeError")
@@ -603,6 +642,8 @@ def typecheck(program: AST, scopes = None):
                 if (attr == name):
                     field = classObj.methods[attr]
                     if (isinstance(field, Declare)):
+                        # Resolving the field to its slot in the instances
+                        g.slot = classLayout(classObj).slots[name]
                         if isinstance(field.dtype, type) or isinstance(field.dtype, arrayType):
                             return field.dtype
                         elif isinstance(field.dtype, instanceType):
@@ -612,7 +653,7 @@ def typecheck(program: AST, scopes = None):
                         scopes.beginScope()
 
                         # Declaring the this variable
-                        scopes.declareVariable(Variable(lineNumber, "this", classObj.thisID), nil(), instanceType(classObj), False)
+                        scopes.declareVariable(Variable(lineNumber, "this", classObj.thisID), None, instanceType(classObj), False)
 
                         # Declaring the function
                         scopes.declareFun(field.var, FnObject(field.functionType, field.params_type, field.params, field.body, field.return_type))
@@ -5,7 +5,16 @@ from sim import *
 import pprint
 from error import *
 from resolver import *
+from sim_closure import evaluateCompiled
+from sim_BC import evaluateVM, setPeephole, setMemoryBudget
+import cache
+from output import OUTPUT, BUFFER_SIZE, configure as configureOutput
+from profiler import Profiler, Sampler, SAMPLE_INTERVAL
+from timings import Timings, countNodes
+from lexer import tokenize
+from contextlib import nullcontext
 import time
+from typing import TextIO
 try:
     import readline
 except:
@@ -15,41 +24,107 @@ except:
 # Global error flag also takes care of exceptions
 isError = False
 
+# Evaluation engines selectable with --engine=<name>
+ENGINES = {
+    "tree": evaluate,               # Tree walking evaluator in sim.py
+    "closure": evaluateCompiled,    # Closure compiling evaluator in sim_closure.py
+    "vm": evaluateVM,               # Bytecode compiler and VM in sim_BC.py (also --vm)
+}
+
 # Function definitions
-def executeFile(path: str):
+def executeFile(path: str, engine: str = "tree", floatMode: str = "fraction", useCache: bool = True, profileJSON: str = None,
+                samplesFile: str = None, sampleInterval: float = SAMPLE_INTERVAL, timings: Timings = None, streaming: bool = False):
     '''
-    Executes the file at the given path
+    Executes the file at the given path. With profileJSON, the program is profiled (on the tree
+    walking evaluator): the report is written to stderr, and the statistics to profileJSON. With
+    samplesFile, its call stack is sampled every sampleInterval seconds instead, and the collapsed
+    stacks are written to samplesFile. With timings,
+    the phases of the execution are recorded into it. With streaming, each top level statement is
+    run as soon as it is parsed (see executeStatements)
     '''
-    # Try to obtain the stream of characters
+    # The profiler wraps the tree walking evaluator, rather than profiling another engine in its place
+    if (profileJSON != None and engine != "tree"):
+        print(f"The profiler only runs on the tree engine, not on the {engine} engine (--sample runs on any engine)")
+        exit(-1)
+
+    # Opening the file, whose characters are read as they are lexed
     try: 
-        stream = None
-        with open(path, 'r') as file:
-            stream = ''.join(file.readlines()).strip()
+        file = open(path, 'r')
     # In case the given file location is invalid
     except:
         print(f"Specified file at {path} does not exist!")
         exit(-1)
     
-    execute(stream, ResolverScopes(), Scopes(), Scopes())
+    profiler = Profiler() if profileJSON != None else Sampler(sampleInterval) if samplesFile != None else None
+    with file:
+        execute(file, ResolverScopes(), Scopes(), Scopes(), engine, floatMode, useCache, profiler, timings, streaming)
+    if (profileJSON != None):
+        # The source of the lines reported
+        with open(path, 'r') as file:
+            stream = file.read().strip()
+        profiler.report(path, stream)
+        profiler.writeJSON(profileJSON, path, stream)
+    elif (samplesFile != None):
+        profiler.writeCollapsed(samplesFile)
+        print(f"{profiler.samples} samples of {path} written to {samplesFile}", file=sys.stderr)
 
-def execute(stream:str, resolverScopes: ResolverScopes, typecheckerScopes: Scopes, scopes: Scopes):
+def execute(stream: str | TextIO, resolverScopes: ResolverScopes, typecheckerScopes: Scopes, scopes: Scopes, engine: str = "tree", floatMode: str = "fraction", useCache: bool = False, profiler: Profiler | Sampler = None, timings: Timings = None, streaming: bool = False):
+    '''
+    Executes the given program (a string, or a file object or mmap, read as it is lexed). With
+    useCache (only for fresh scopes, as the front end of the interactive shell depends on the
+    previous lines) the typechecked program is looked up in (and added to) the persistent cache.
+    With a profiler (or sampler), the program is evaluated through it. With timings, the time,
+    memory and counters of each phase are recorded into it. With streaming, each top level
+    statement is run as soon as it is parsed (see executeStatements, the cache is not used)
+    '''
     global isError
     try: 
-        programAST = parse(stream) 
-        
-        # print(programAST)
-        # Resolving the AST
-        pp = pprint.PrettyPrinter(indent=4)
-        # print(programAST)
-        resolvedProgram = resolve(programAST, resolverScopes)
-        # pp.pprint(resolvedProgram)
-        # Performing typechecking
-        typecheckAST(resolvedProgram, typecheckerScopes) # any TypecheckError in the stream would be caught in the typecheckAST function and the error flag would be set
-        output = evaluate(resolvedProgram, scopes)
-        return output
+        # Selecting the numeric mode of the floats before the literals are parsed
+        setFloatMode(floatMode)
+        if (streaming):
+            return executeStatements(stream, resolverScopes, typecheckerScopes, scopes, engine, profiler, timings)
+
+        phase = timings.phase if timings != None else lambda name: nullcontext()
+        key = cache.cacheKey(stream, floatMode) if useCache else None
+        with phase("cache"):
+            resolvedProgram = cache.load(key) if key != None else None
+        if (resolvedProgram == None):
+            if (timings != None):
+                # Lexing the whole program first, for the time taken by the lexer alone
+                with phase("lex"):
+                    tokens = tokenize(stream)
+                timings.counters["tokens"] = len(tokens)
+                with phase("parse"):
+                    programAST = parse(stream, tokens)
+            else:
+                programAST = parse(stream) 
+            
+            # print(programAST)
+            # Resolving the AST
+            pp = pprint.PrettyPrinter(indent=4)
+            # print(programAST)
+            with phase("resolve"):
+                resolvedProgram = resolve(programAST, resolverScopes)
+            # pp.pprint(resolvedProgram)
+            # Performing typechecking
+            with phase("typecheck"):
+                typecheckAST(resolvedProgram, typecheckerScopes) # any TypecheckError in the stream would be caught in the typecheckAST function and the error flag would be set
+
+            # Caching the program before running it (the evaluation fills in the array literals)
+            if (key != None):
+                with phase("cache"):
+                    cache.store(key, resolvedProgram)
+        return evaluateProgram(resolvedProgram, scopes, engine, profiler, timings)
         
     
-    except (RuntimeException, TypeCheckException, ParseException, ResolveException, RecursionError) as e:
+    except (RuntimeException, TypeCheckException, ParseException, ResolveException) as e:
+        isError = True
+        return nil()
+
+    except RecursionError as e:
+        # The recursive evaluators run out of Python stack (the VM only limits the recursion by its memory budget)
+        OUTPUT.flush()
+        print(f"\x1B[1;31mrecursionError\x1B[0m: Maximum recursion depth exceeded, run with --vm for deeper recursion")
         isError = True
         return nil()
     
@@ -57,7 +132,50 @@ def execute(stream:str, resolverScopes: ResolverScopes, typecheckerScopes: Scope
         # An uncaught expression for development purpose (Due to unhandled cases in the parser)
         raise e
 
-def interactiveShell():
+    finally:
+        # Writing out the rest of the output of the program
+        OUTPUT.flush()
+
+def evaluateProgram(program: AST, scopes: Scopes, engine: str, profiler: Profiler | Sampler = None, timings: Timings = None):
+    '''
+    Evaluates the typechecked program on the given engine (through the sampler, or through the
+    profiler, on the tree walking evaluator)
+    '''
+    if (timings != None):
+        timings.counters["nodes"] += countNodes(program)
+    # Dropping the calls left in progress by a program stopped by an error
+    CALLS.clear()
+    with timings.evaluation() if timings != None else nullcontext():
+        if (isinstance(profiler, Sampler)):
+            return profiler.run(program, scopes, ENGINES[engine])
+        if (profiler != None):
+            return profiler.run(program, scopes)
+        return ENGINES[engine](program, scopes)
+
+def executeStatements(stream: str | TextIO, resolverScopes: ResolverScopes, typecheckerScopes: Scopes, scopes: Scopes, engine: str = "tree",
+                      profiler: Profiler | Sampler = None, timings: Timings = None):
+    '''
+    Executes the given program a top level statement at a time, like the lines of the interactive
+    shell: each statement is resolved, typechecked and evaluated as soon as it is parsed (so that
+    the statements before an error have run), and only the functions and classes declared hold
+    on to their AST after. With timings, the lexing is part of the parse phase (and the tokens are
+    not counted)
+    '''
+    phase = timings.phase if timings != None else lambda name: nullcontext()
+    statements = parseStatements(stream)
+    output = nil()
+    while True:
+        with phase("parse"):
+            statement = next(statements, None)
+        if (statement is None):
+            return output
+        with phase("resolve"):
+            statement = resolve(statement, resolverScopes)
+        with phase("typecheck"):
+            typecheckAST(statement, typecheckerScopes)
+        output = evaluateProgram(statement, scopes, engine, profiler, timings)
+
+def interactiveShell(engine: str = "tree", floatMode: str = "fraction"):
     '''
     Run the lanuage in interactive shell form
     '''
@@ -96,7 +214,7 @@ def interactiveShell():
                 break
             
             # Executing the lines
-            output = execute(lines, resolverScopes, typecheckerScopes, scopes)
+            output = execute(lines, resolverScopes, typecheckerScopes, scopes, engine, floatMode)
             
             # Printing new line after each line
             print()
@@ -110,16 +228,93 @@ if __name__ == "__main__":
     
     args = sys.argv
 
-    n = len(args)
+    # Separating the options from the script path
+    engine = "tree"
+    floatMode = "fraction"
+    useCache = True
+    outputSize = BUFFER_SIZE
+    outputFd = None
+    profile = False
+    profileJSON = None
+    samplesFile = None
+    sampleInterval = SAMPLE_INTERVAL
+    timings = None
+    streaming = False
+    paths = []
+    for arg in args[1:]:
+        if (arg.startswith("--engine=")):
+            engine = arg[len("--engine="):]
+            if (engine not in ENGINES):
+                print(f"Unknown engine {engine}, expected one of: {', '.join(ENGINES)}")
+                exit(-1)
+        elif (arg == "--vm"):
+            engine = "vm"
+        elif (arg == "--no-peephole"):
+            setPeephole(False)
+        elif (arg == "--no-cache"):
+            useCache = False
+        elif (arg == "--stream"):
+            # Running each top level statement as soon as it is parsed
+            streaming = True
+        elif (arg.startswith("--stack-memory=")):
+            # Memory budget of the call frames of the VM in MB
+            setMemoryBudget(int(arg[len("--stack-memory="):]) * 1024 * 1024)
+        elif (arg.startswith("--output-buffer=")):
+            # Characters of output buffered before being written out (0 writes out every value)
+            outputSize = int(arg[len("--output-buffer="):])
+        elif (arg.startswith("--output-fd=")):
+            # File descriptor the output is written to (instead of the standard output)
+            outputFd = int(arg[len("--output-fd="):])
+        elif (arg == "--profile"):
+            profile = True
+        elif (arg.startswith("--profile-json=")):
+            # Where the statistics of the profile are written (<script>.profile.json by default)
+            profile = True
+            profileJSON = arg[len("--profile-json="):]
+        elif (arg == "--sample"):
+            samplesFile = ""
+        elif (arg.startswith("--sample=")):
+            # Where the collapsed stacks are written (<script>.collapsed by default)
+            samplesFile = arg[len("--sample="):]
+        elif (arg.startswith("--sample-interval=")):
+            # Milliseconds between the samples
+            sampleInterval = float(arg[len("--sample-interval="):]) / 1000
+        elif (arg == "--timings"):
+            timings = Timings()
+        elif (arg == "--timings=time"):
+            # Only the times of the phases (without tracing the memory and counting the scopes and values)
+            timings = Timings(detailed=False)
+        elif (arg.startswith("--float=")):
+            floatMode = arg[len("--float="):]
+            if (floatMode not in FLOAT_MODES):
+                print(f"Unknown float mode {floatMode}, expected one of: {', '.join(FLOAT_MODES)}")
+                exit(-1)
+        elif (arg.startswith("--")):
+            print(f"Unknown option {arg}")
+            exit(-1)
+        else:
+            paths.append(arg)
 
-    if (n > 2):
+    configureOutput(outputSize, outputFd)
+    n = len(paths)
+
+    if (n > 1):
         # Error (Invalid arguments provided)
         print("Invalid Number of arguments")
         exit(-1)
 
-    elif (n == 2):
+    elif (n == 1):
         # Runninng the given script
-        executeFile(args[1])
+        if (profile and profileJSON == None):
+            profileJSON = paths[0] + ".profile.json"
+        if (samplesFile == ""):
+            samplesFile = paths[0] + ".collapsed"
+        executeFile(paths[0], engine, floatMode, useCache, profileJSON if profile else None, samplesFile, sampleInterval, timings, streaming)
+        if (timings != None):
+            timings.report(paths[0])
+    elif (profile or samplesFile != None):
+        print("Only scripts can be profiled")
+        exit(-1)
     else:
         # Running the interactive shell
-        interactiveShell()
+        interactiveShell(engine, floatMode)
\ No newline at end of file